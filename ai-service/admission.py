@@ -0,0 +1,297 @@
+"""
+Control de admisión y deadlines para SCANIX AI Service
+
+Ante una ráfaga, aceptar todos los /recognize solo apila trabajo sobre YOLO
+y CLIP: el proxy de Node corta a los 30 s y el servicio sigue gastando CPU
+en respuestas que nadie va a leer. Acá:
+
+- Como mucho `concurrency` inferencias corren a la vez; el resto espera en
+  una cola acotada por capacidad medida: con el tiempo de servicio promedio
+  (EWMA) la cola admite lo que se puede atender dentro de `max_wait`. Si no
+  entra, el request sale enseguida con 503 y Retry-After.
+- Dos clases de prioridad: 'interactive' (caja / checkout) y 'batch'
+  (auditorías masivas). Los batch usan solo una parte de la cola, ceden el
+  turno a los interactivos y son los primeros en descartarse si un
+  interactivo no tiene lugar.
+- Cada request puede traer un deadline (X-Scanix-Deadline-Ms: milisegundos
+  que el cliente va a esperar). El trabajo vencido se descarta en la cola y
+  antes de cada etapa del pipeline en lugar de procesarse igual.
+
+La cola es por proceso: solo ordena algo si un worker atiende varios
+requests a la vez (gunicorn con worker gthread, SCANIX_THREADS > 1, que es
+el default; o asgi.py). Con un worker sync de un hilo cada request llega
+cuando el anterior ya terminó.
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+
+PRIORITIES = {'interactive': 0, 'batch': 1}
+
+
+class Overloaded(Exception):
+    """Sin lugar en la cola de inferencia (503 + Retry-After)"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """El deadline del request venció antes de la etapa `stage`"""
+
+    def __init__(self, stage):
+        super().__init__(f"Deadline vencido antes de {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Instante (time.monotonic) después del cual el resultado ya no sirve"""
+
+    __slots__ = ('expires',)
+
+    def __init__(self, expires=None):
+        self.expires = expires
+
+    @classmethod
+    def after(cls, milliseconds):
+        return cls(time.monotonic() + milliseconds / 1000.0 if milliseconds else None)
+
+    @classmethod
+    def from_header(cls, value, default_ms=0):
+        """Deadline relativo en milisegundos (0 = sin deadline); el header inválido o ausente usa default_ms"""
+        try:
+            milliseconds = float(value) if value not in (None, '') else default_ms
+        except ValueError:
+            milliseconds = default_ms
+        return cls.after(milliseconds)
+
+    def remaining(self):
+        """Segundos que quedan (None si no hay deadline)"""
+        return None if self.expires is None else self.expires - time.monotonic()
+
+    @property
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def check(self, stage):
+        if self.expired:
+            raise DeadlineExceeded(stage)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'deadline', 'wake', 'sheddable', 'state', 'granted')
+
+    def __init__(self, priority, deadline, wake, sheddable=True):
+        self.priority = priority
+        self.deadline = deadline
+        self.wake = wake
+        self.sheddable = sheddable
+        self.state = 'waiting'  # 'granted' | 'shed' | 'expired'
+        self.granted = None
+
+
+class AdmissionController:
+    """Semáforo con cola acotada, prioridades y deadlines"""
+
+    def __init__(self, concurrency=1, max_wait=5.0, max_queue=64, batch_share=0.5, service_time=1.0,
+                 alpha=0.2):
+        self.concurrency = max(1, int(concurrency))
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.batch_share = batch_share
+        self.service_time = service_time
+        self.alpha = alpha
+        self.observed = 0
+        self.running = 0
+        self._heap = []
+        self._waiting = {name: 0 for name in PRIORITIES}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.admitted = {name: 0 for name in PRIORITIES}
+        self.rejected = {name: 0 for name in PRIORITIES}
+        self.expired = 0
+
+    # Capacidad medida
+
+    def observe(self, seconds):
+        """Tiempo de servicio de una inferencia (promedio móvil exponencial)"""
+        with self._lock:
+            if not self.observed:
+                # La primera medición reemplaza la estimación inicial
+                self.service_time = seconds
+            else:
+                self.service_time += self.alpha * (seconds - self.service_time)
+            self.observed += 1
+
+    def queue_limit(self, priority='interactive'):
+        """Requests que pueden esperar: lo que se atiende en max_wait a la capacidad medida.
+
+        Los batch solo entran mientras la cola está ocupada menos que batch_share.
+        """
+        limit = math.ceil(self.max_wait * self.concurrency / max(self.service_time, 1e-3))
+        limit = max(1, min(self.max_queue, limit))
+        if priority == 'batch':
+            limit = max(1, int(limit * self.batch_share))
+        return limit
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere lugar (para el header Retry-After)"""
+        waiting = sum(self._waiting.values())
+        return max(1, math.ceil((waiting + 1) * self.service_time / self.concurrency))
+
+    @property
+    def waiting(self):
+        return sum(self._waiting.values())
+
+    # Admisión
+
+    def check(self, priority='interactive'):
+        """Rechazar de entrada (Overloaded) si la clase no tiene lugar en la cola"""
+        with self._lock:
+            if self.running >= self.concurrency and self.waiting >= self.queue_limit(priority):
+                self.rejected[priority] += 1
+                raise Overloaded("Servicio saturado, reintentar más tarde", self.retry_after())
+
+    def acquire(self, priority='interactive', deadline=None, shed=True):
+        """Esperar un lugar para inferir; devuelve el instante en que se obtuvo (para release).
+
+        Con shed=False (lotes de un trabajo masivo ya aceptado) no se rechaza por
+        cola llena: se espera el turno detrás de los interactivos.
+        """
+        event = threading.Event()
+        ticket = self._enqueue(priority, deadline or Deadline(), shed, event.set)
+        if not isinstance(ticket, _Waiter):
+            return ticket
+        remaining = ticket.deadline.remaining()
+        event.wait(None if remaining is None else max(0.0, remaining))
+        return self._resolve(ticket)
+
+    async def acquire_async(self, priority='interactive', deadline=None, shed=True):
+        """Como acquire, esperando en el event loop en lugar de bloquear un hilo"""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        ticket = self._enqueue(priority, deadline or Deadline(), shed, wake)
+        if not isinstance(ticket, _Waiter):
+            return ticket
+        remaining = ticket.deadline.remaining()
+        try:
+            await asyncio.wait_for(woken, None if remaining is None else max(0.0, remaining))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Cliente desconectado mientras esperaba: no dejar el lugar tomado
+            self._abandon(ticket)
+            raise
+        return self._resolve(ticket)
+
+    def release(self, started, observe=True):
+        """Liberar el lugar (started: lo que devolvió acquire) y pasarlo al siguiente en la cola.
+
+        observe=False para trabajos que no representan el tiempo de una inferencia
+        (p. ej. un lote entero de /recognize/batch).
+        """
+        if observe:
+            self.observe(time.monotonic() - started)
+        with self._lock:
+            self.running -= 1
+            self._dispatch()
+
+    def stats(self):
+        return {
+            'concurrency': self.concurrency,
+            'running': self.running,
+            'waiting': dict(self._waiting),
+            'queue_limit': {name: self.queue_limit(name) for name in PRIORITIES},
+            'service_ms': round(self.service_time * 1000, 1),
+            'admitted': dict(self.admitted),
+            'rejected': dict(self.rejected),
+            'expired': self.expired
+        }
+
+    def _enqueue(self, priority, deadline, shed, wake):
+        """Instante de inicio si hay lugar libre, o el _Waiter encolado"""
+        with self._lock:
+            if deadline.expired:
+                self.expired += 1
+                raise DeadlineExceeded('admission')
+            if self.running < self.concurrency and not self.waiting:
+                return self._grant(priority)
+
+            if shed and self.waiting >= self.queue_limit(priority):
+                # Un interactivo sin lugar desplaza al último batch en espera
+                if priority != 'interactive' or not self._shed_batch():
+                    self.rejected[priority] += 1
+                    raise Overloaded("Servicio saturado, reintentar más tarde", self.retry_after())
+
+            waiter = _Waiter(priority, deadline, wake, shed)
+            heapq.heappush(self._heap, (PRIORITIES[priority], next(self._seq), waiter))
+            self._waiting[priority] += 1
+            return waiter
+
+    def _resolve(self, waiter):
+        """Resultado de la espera: instante de inicio, DeadlineExceeded u Overloaded"""
+        with self._lock:
+            if waiter.state == 'granted':
+                return waiter.granted
+            if waiter.state == 'waiting':
+                # Venció esperando: sale de la cola sin haber usado CPU
+                waiter.state = 'expired'
+                self._waiting[waiter.priority] -= 1
+                self.expired += 1
+            if waiter.state == 'expired':
+                raise DeadlineExceeded('admission')
+            self.rejected[waiter.priority] += 1
+            raise Overloaded("Desplazado por tráfico interactivo, reintentar más tarde", self.retry_after())
+
+    def _abandon(self, waiter):
+        with self._lock:
+            if waiter.state == 'waiting':
+                self._waiting[waiter.priority] -= 1
+            elif waiter.state == 'granted':
+                self.running -= 1
+                self._dispatch()
+            waiter.state = 'expired'
+
+    def _grant(self, priority):
+        self.running += 1
+        self.admitted[priority] += 1
+        return time.monotonic()
+
+    def _dispatch(self):
+        while self.running < self.concurrency and self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.state != 'waiting':
+                continue
+            self._waiting[waiter.priority] -= 1
+            if waiter.deadline.expired:
+                waiter.state = 'expired'
+                self.expired += 1
+                waiter.wake()
+                continue
+            waiter.state = 'granted'
+            waiter.granted = self._grant(waiter.priority)
+            waiter.wake()
+
+    def _shed_batch(self):
+        """Sacar de la cola al batch que llegó último; False si no hay ninguno.
+
+        Los encolados con shed=False (lotes de un trabajo ya aceptado) no se descartan.
+        """
+        candidates = [entry for entry in self._heap
+                      if entry[2].state == 'waiting' and entry[2].priority == 'batch' and entry[2].sheddable]
+        if not candidates:
+            return False
+        _, _, waiter = max(candidates, key=lambda entry: entry[1])
+        waiter.state = 'shed'
+        self._waiting['batch'] -= 1
+        waiter.wake()
+        return True
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Índice aproximado (IVF-PQ) de embeddings CLIP para catálogos grandes
+
+Con cientos de miles de vectores el matmul contra todo el knowledge base deja
+de ser barato. Este índice, en NumPy puro:
+
+- Agrupa los vectores en `nlist` listas con k-means (el cuantizador grueso) y
+  en cada búsqueda recorre solo las `nprobe` listas más cercanas a la query.
+- Guarda cada vector como el residuo contra el centroide de su lista,
+  comprimido con product quantization (`m` subespacios de 256 centroides: m
+  bytes por vector en disco y 2*m en memoria, 4*m si m > 256, en vez de
+  4*D). La similitud se estima con tablas de lookup por query (asymmetric
+  distance computation).
+- Opcionalmente conserva los vectores exactos para reordenar los `rerank`
+  mejores candidatos (más recall a cambio de memoria).
+- Opcionalmente particiona por el campo 'categoria' del mapeo: cada
+  categoría tiene sus propias listas y la búsqueda puede restringirse a
+  algunas categorías.
+
+Como en EmbeddingIndex, la similitud de un producto es la máxima entre sus filas.
+
+Uso:
+    python ann_index.py build --out models/knowledge_base.ann.npz --partition-by categoria
+    python ann_index.py evaluate --index models/knowledge_base.ann.npz --nprobe 1,4,8,16
+    python ann_index.py evaluate --synthetic 200000 --products 20000 --nprobe 4,8,16,32
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from embedding_index import EmbeddingIndex, normalize_rows
+from product_quantization import ProductQuantizer, kmeans, nearest_centroids
+
+FORMAT_VERSION = 1
+# Modelo de CLIP de los embeddings (parte del fingerprint de la fuente)
+EMBEDDING_MODEL = 'clip-ViT-B-32'
+DEFAULT_NPROBE = 4
+# Filas candidatas por producto pedido antes de reducir por producto
+OVERSAMPLE = 16
+
+
+class AnnIndex:
+    """Índice IVF-PQ con el mismo contrato de búsqueda que EmbeddingIndex"""
+
+    def __init__(self, centroids, list_offsets, list_partitions, partitions, pq, codes, labels, product_ids,
+                 vectors=None, nprobe=DEFAULT_NPROBE, rerank=0, params=None, source_fingerprint=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        # Filas de la lista l: [list_offsets[l], list_offsets[l + 1])
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_partitions = np.asarray(list_partitions, dtype=np.int32)
+        self.partitions = list(partitions)
+        self.pq = pq
+        # Solo residen los códigos ya desplazados a la tabla aplanada (ver codes)
+        self.flat_codes = pq.flat_codes(np.asarray(codes, dtype=np.uint8))
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.product_ids = np.asarray(product_ids, dtype=object)
+        # product_ids con None al final: los labels -1 (sin resultado) caen ahí
+        self._padded_ids = np.append(self.product_ids, np.array([None], dtype=object))
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.rerank = rerank if vectors is not None else 0
+        self.params = params or {}
+        # Hash de los embeddings exactos de los que se construyó (ver source_fingerprint)
+        self.source_fingerprint = source_fingerprint
+        self.list_sizes = np.diff(self.list_offsets)
+        self.half_norms = 0.5 * np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+    @classmethod
+    def build(cls, embeddings, labels, product_ids, categories=None, nlist=None, m=None, nbits=8,
+              iterations=10, seed=0, store_vectors=False, nprobe=DEFAULT_NPROBE, rerank=0):
+        """Entrenar el índice sobre filas (N, D) con su producto (labels -> posición en product_ids).
+
+        categories: categoría de cada producto (para particionar) o None.
+        """
+        x = normalize_rows(embeddings)
+        labels = np.asarray(labels, dtype=np.int32)
+        n, dimension = x.shape
+        nlist = nlist or max(1, int(round(2 * np.sqrt(n))))
+        m = m or max(1, dimension // 16)
+
+        if categories is not None:
+            partitions = sorted({str(c or '') for c in categories})
+            product_partition = np.array([partitions.index(str(c or '')) for c in categories], dtype=np.int32)
+            row_partition = product_partition[labels]
+        else:
+            partitions = ['']
+            row_partition = np.zeros(n, dtype=np.int32)
+
+        # Cuantizador grueso: listas propias por partición, proporcionales a su tamaño
+        centroids, list_partitions = [], []
+        assign = np.empty(n, dtype=np.int32)
+        for p in range(len(partitions)):
+            rows = np.flatnonzero(row_partition == p)
+            if not len(rows):
+                continue
+            part_nlist = max(1, int(round(nlist * len(rows) / n)))
+            part_centroids = kmeans(x[rows], part_nlist, iterations, seed + p, max_points=64 * part_nlist)
+            assign[rows] = nearest_centroids(x[rows], part_centroids) + sum(len(c) for c in centroids)
+            centroids.append(part_centroids)
+            list_partitions += [p] * len(part_centroids)
+        centroids = np.concatenate(centroids)
+
+        # PQ sobre los residuos contra el centroide de cada lista (codebooks compartidos)
+        residuals = x - centroids[assign]
+        pq = ProductQuantizer.train(residuals, m, nbits, iterations, seed)
+        codes = pq.encode(residuals)
+
+        order = np.argsort(assign, kind='stable')
+        list_offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        params = {'nlist': int(len(centroids)), 'm': int(m), 'nbits': int(nbits),
+                  'partition_by': 'categoria' if categories is not None else None}
+        return cls(centroids, list_offsets, list_partitions, partitions, pq, codes[order], labels[order],
+                   product_ids, vectors=x[order] if store_vectors else None, nprobe=nprobe, rerank=rerank,
+                   params=params)
+
+    @property
+    def dimension(self):
+        return self.centroids.shape[1]
+
+    @property
+    def codes(self):
+        """Códigos (N, m) uint8 (para guardar y compactar; se recalculan de flat_codes)"""
+        return self.pq.unflat_codes(self.flat_codes)
+
+    @property
+    def nbytes(self):
+        """Memoria del índice en bytes (sin los product_ids)"""
+        total = sum(a.nbytes for a in (self.centroids, self.half_norms, self.list_offsets, self.list_sizes,
+                                       self.list_partitions, self.flat_codes, self.labels, self.pq.codebooks))
+        return total + (self.vectors.nbytes if self.vectors is not None else 0)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def allowed_lists(self, categories):
+        """Máscara de listas de las categorías dadas (None = todas)"""
+        if categories is None:
+            return None
+        wanted = [self.partitions.index(c) for c in categories if c in self.partitions]
+        return np.isin(self.list_partitions, wanted)
+
+    def search_labels(self, queries, k=1, categories=None, nprobe=None):
+        """Top-k (similitudes, posiciones de producto) por query; relleno con (-1.0, -1) si faltan"""
+        queries = normalize_rows(queries)
+        nprobe = nprobe or self.nprobe
+        out_similarities = np.full((len(queries), k), -1.0, dtype=np.float32)
+        out_labels = np.full((len(queries), k), -1, dtype=np.int64)
+
+        coarse = queries @ self.centroids.T
+        # Listas más cercanas en L2 (el mismo criterio con el que se asignaron las filas)
+        closeness = coarse - self.half_norms
+        allowed = self.allowed_lists(categories)
+        if allowed is not None:
+            closeness[:, ~allowed] = -np.inf
+            nprobe = min(nprobe, int(allowed.sum()))
+        nprobe = min(nprobe, len(self.centroids))
+        if nprobe <= 0:
+            return out_similarities, out_labels
+        probes = np.argpartition(-closeness, nprobe - 1, axis=1)[:, :nprobe]
+        tables = self.pq.lookup(queries)
+
+        for i, lists in enumerate(probes):
+            if allowed is not None:
+                lists = lists[allowed[lists]]
+            sizes = self.list_sizes[lists]
+            total = int(sizes.sum())
+            if not total:
+                continue
+            # Filas de las listas sondeadas (contiguas dentro de cada lista)
+            starts = np.repeat(self.list_offsets[lists] - np.cumsum(sizes) + sizes, sizes)
+            rows = starts + np.arange(total)
+            scores = np.repeat(coarse[i, lists], sizes) + self.pq.scores(tables[i], self.flat_codes[rows])
+
+            if self.rerank:
+                keep = min(self.rerank, total)
+                best = np.argpartition(-scores, keep - 1)[:keep] if keep < total else np.arange(total)
+                rows = rows[best]
+                scores = self.vectors[rows] @ queries[i]
+            else:
+                keep = min(k * OVERSAMPLE, total)
+                best = np.argpartition(-scores, keep - 1)[:keep] if keep < total else np.arange(total)
+                rows, scores = rows[best], scores[best]
+
+            # Reducir por producto: la mejor fila de cada uno
+            order = np.argsort(-scores, kind='stable')
+            labels = self.labels[rows[order]]
+            _, first = np.unique(labels, return_index=True)
+            first = np.sort(first)[:k]
+            out_similarities[i, :len(first)] = scores[order][first]
+            out_labels[i, :len(first)] = labels[first]
+
+        return out_similarities, out_labels
+
+    def search(self, queries, k=1, categories=None, nprobe=None):
+        """Top-k productos más similares para cada query (mismo contrato que EmbeddingIndex.search)"""
+        k = min(k, len(self.product_ids))
+        similarities, labels = self.search_labels(queries, k, categories, nprobe)
+        return similarities, self._padded_ids[labels]
+
+    def compact(self, keep, embeddings, labels, product_ids):
+        """Índice nuevo con los mismos cuantizadores: sin las filas de productos borrados
+        (keep[label] == False) y con filas nuevas asignadas a la lista más cercana.
+
+        Los labels (existentes y nuevos) se renumeran a las posiciones de product_ids.
+        """
+        position = np.cumsum(keep) - 1
+        kept = keep[self.labels]
+        list_ids = np.repeat(np.arange(len(self.centroids), dtype=np.int32), self.list_sizes)[kept]
+        codes = self.pq.unflat_codes(self.flat_codes[kept])
+        new_labels = position[self.labels[kept]]
+        vectors = self.vectors[kept] if self.vectors is not None else None
+
+        added = keep[labels]
+        if added.any():
+            x = normalize_rows(embeddings[added])
+            assign = nearest_centroids(x, self.centroids)
+            list_ids = np.concatenate([list_ids, assign])
+            codes = np.concatenate([codes, self.pq.encode(x - self.centroids[assign])])
+            new_labels = np.concatenate([new_labels, position[labels[added]]])
+            if vectors is not None:
+                vectors = np.concatenate([vectors, x])
+
+        order = np.argsort(list_ids, kind='stable')
+        list_offsets = np.searchsorted(list_ids[order], np.arange(len(self.centroids) + 1))
+        return AnnIndex(self.centroids, list_offsets, self.list_partitions, self.partitions, self.pq, codes[order],
+                        new_labels[order], product_ids, vectors=vectors[order] if vectors is not None else None,
+                        nprobe=self.nprobe, rerank=self.rerank, params=self.params)
+
+    def save(self, path):
+        """Guardar en un .npz (sin pickle)"""
+        header = {
+            'format_version': FORMAT_VERSION,
+            'params': self.params,
+            'partitions': self.partitions,
+            'product_ids': [str(pid) for pid in self.product_ids],
+            'nprobe': self.nprobe,
+            'rerank': self.rerank,
+            'source_fingerprint': self.source_fingerprint
+        }
+        arrays = {
+            'header': np.frombuffer(json.dumps(header, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+            'centroids': self.centroids,
+            'list_offsets': self.list_offsets,
+            'list_partitions': self.list_partitions,
+            'codebooks': self.pq.codebooks,
+            'codes': self.codes,
+            'labels': self.labels
+        }
+        if self.vectors is not None:
+            arrays['vectors'] = self.vectors
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, nprobe=None, rerank=None):
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data['header'].tobytes().decode('utf-8'))
+            if header.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"Versión de índice ANN no soportada: {header.get('format_version')}")
+            return cls(data['centroids'], data['list_offsets'], data['list_partitions'], header['partitions'],
+                       ProductQuantizer(data['codebooks']), data['codes'], data['labels'], header['product_ids'],
+                       vectors=data['vectors'] if 'vectors' in data else None,
+                       nprobe=nprobe or header['nprobe'],
+                       rerank=header['rerank'] if rerank is None else rerank,
+                       params=header['params'], source_fingerprint=header.get('source_fingerprint'))
+
+
+def source_fingerprint(index, model_name=EMBEDDING_MODEL):
+    """BLAKE2b de las filas, labels y productos de un EmbeddingIndex exacto y del modelo que los generó.
+
+    Cambia si se re-embebe un producto o se reemplazan muestras aunque las
+    cantidades queden iguales: un índice guardado con otro fingerprint está viejo.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model_name.encode('utf-8'))
+    digest.update(json.dumps([str(pid) for pid in index.product_ids], ensure_ascii=False).encode('utf-8'))
+    digest.update(np.ascontiguousarray(index.labels, dtype=np.int32).tobytes())
+    # Por bloques: con el bundle las filas son un memmap que no hace falta copiar entero
+    for start in range(0, len(index.labels), 65536):
+        digest.update(np.ascontiguousarray(index.vectors(slice(start, start + 65536)), dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+
+def build_from_index(index, product_mapping=None, partition_by=None, **kwargs):
+    """AnnIndex a partir de un EmbeddingIndex exacto (mismas filas y productos)"""
+    categories = None
+    if partition_by:
+        categories = [(product_mapping or {}).get(pid, {}).get(partition_by, '') for pid in index.product_ids]
+    ann = AnnIndex.build(index.vectors(), index.labels, list(index.product_ids), categories=categories, **kwargs)
+    ann.source_fingerprint = source_fingerprint(index)
+    return ann
+
+
+def synthetic_catalog(num_vectors, num_products, dimension=512, noise=0.5, categories=12, seed=0):
+    """Catálogo sintético: productos agrupados por categoría y muestras alrededor de cada producto
+    (como las fotos de un SKU, parecidas a las de otros SKU de su categoría)"""
+    rng = np.random.default_rng(seed)
+    category_centers = normalize_rows(rng.normal(size=(categories, dimension)))
+    product_category = np.arange(num_products) % categories
+    centers = normalize_rows(category_centers[product_category]
+                             + 0.9 * normalize_rows(rng.normal(size=(num_products, dimension))))
+    # Al menos una muestra por producto
+    labels = np.sort(np.r_[np.arange(num_products), rng.integers(0, num_products, num_vectors - num_products)])
+    labels = labels.astype(np.int32)
+    rows = centers[labels] + noise * rng.normal(size=(num_vectors, dimension)).astype(np.float32) / np.sqrt(dimension)
+    product_ids = [f'sku_{i:06d}' for i in range(num_products)]
+    mapping = {pid: {'categoria': f'cat_{c}'} for pid, c in zip(product_ids, product_category)}
+    return EmbeddingIndex(rows, labels, product_ids), mapping
+
+
+def evaluate(exact, ann, queries, k=5, nprobes=(DEFAULT_NPROBE,)):
+    """Recall@1 / recall@k por producto contra la búsqueda exacta y latencia por query"""
+    exact_similarities, exact_ids = exact.search(queries, k)
+    reports = []
+    for nprobe in nprobes:
+        latencies = []
+        ann_ids = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = ann.search(query[None, :], k, nprobe=nprobe)
+            latencies.append(time.perf_counter() - start)
+            ann_ids.append(ids[0])
+        ann_ids = np.array(ann_ids, dtype=object)
+        hits = [len(set(a) & set(e)) / len(e) for a, e in zip(ann_ids, exact_ids)]
+        latencies = np.array(latencies) * 1000
+        reports.append({
+            'nprobe': nprobe,
+            'rerank': ann.rerank,
+            'recall@1': round(float(np.mean(ann_ids[:, 0] == exact_ids[:, 0])), 4),
+            f'recall@{k}': round(float(np.mean(hits)), 4),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3)
+        })
+    return reports
+
+
+def load_exact_index(kb_path, mapping_path, bundle_path):
+    """EmbeddingIndex exacto y mapeo desde el bundle compilado o el pickle + JSON"""
+    if os.path.exists(bundle_path):
+        from kb_bundle import load_bundle
+        bundle = load_bundle(bundle_path)
+        return bundle.build_index(), bundle.product_mapping
+
+    import pickle
+    with open(kb_path, 'rb') as f:
+        knowledge_base = pickle.load(f)
+    with open(mapping_path, 'r') as f:
+        mapping = json.load(f)
+    return EmbeddingIndex.from_knowledge_base(knowledge_base), mapping
+
+
+def parse_list(text):
+    return [int(v) for v in text.split(',') if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Índice ANN (IVF-PQ) del knowledge base')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_source(p):
+        p.add_argument('--kb', default='models/knowledge_base.pkl')
+        p.add_argument('--mapping', default='models/product_mapping.json')
+        p.add_argument('--bundle', default='models/knowledge_base.scxkb')
+        p.add_argument('--synthetic', type=int, default=0, help='Catálogo sintético con N vectores')
+        p.add_argument('--products', type=int, default=0, help='Productos del catálogo sintético (N/10)')
+
+    def add_build_params(p):
+        p.add_argument('--nlist', type=int, default=None, help='Listas del IVF (por defecto 2*sqrt(N))')
+        p.add_argument('--m', type=int, default=None, help='Subespacios de PQ (por defecto D/16)')
+        p.add_argument('--nprobe', default=str(DEFAULT_NPROBE))
+        p.add_argument('--rerank', type=int, default=0, help='Candidatos a reordenar con los vectores exactos')
+        p.add_argument('--partition-by', default=None, help="Campo del mapeo para particionar (p. ej. 'categoria')")
+        p.add_argument('--seed', type=int, default=0)
+
+    build_parser = commands.add_parser('build', help='Entrenar y guardar el índice')
+    add_source(build_parser)
+    add_build_params(build_parser)
+    build_parser.add_argument('--out', default='models/knowledge_base.ann.npz')
+
+    evaluate_parser = commands.add_parser('evaluate', help='Recall y latencia contra la búsqueda exacta')
+    add_source(evaluate_parser)
+    add_build_params(evaluate_parser)
+    evaluate_parser.add_argument('--index', help='Índice ya construido (si no, se entrena en memoria)')
+    evaluate_parser.add_argument('--queries', type=int, default=500)
+    evaluate_parser.add_argument('--noise', type=float, default=0.5, help='Ruido sobre las filas usadas como queries')
+    evaluate_parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        exact, mapping = synthetic_catalog(args.synthetic, args.products or max(1, args.synthetic // 10), seed=args.seed)
+    else:
+        exact, mapping = load_exact_index(args.kb, args.mapping, args.bundle)
+    nprobes = parse_list(args.nprobe)
+
+    if args.command == 'evaluate' and args.index:
+        ann = AnnIndex.load(args.index, rerank=args.rerank or None)
+    else:
+        start = time.perf_counter()
+        rerank = args.rerank
+        ann = build_from_index(exact, mapping, args.partition_by, nlist=args.nlist, m=args.m, seed=args.seed,
+                               store_vectors=rerank > 0, nprobe=nprobes[0], rerank=rerank)
+        print(f"🔨 Índice entrenado en {time.perf_counter() - start:.1f}s: {ann.params['nlist']} listas, "
+              f"m={ann.params['m']}, {len(ann.labels)} vectores, {len(ann.partitions)} partición(es)", file=sys.stderr)
+
+    if args.command == 'build':
+        ann.save(args.out)
+        print(f"💾 Guardado en {args.out} ({ann.nbytes / 1e6:.1f} MB, exacto: {exact.nbytes / 1e6:.1f} MB)")
+        return 0
+
+    rng = np.random.default_rng(args.seed + 1)
+    rows = rng.choice(len(exact.labels), min(args.queries, len(exact.labels)), replace=False)
+    noise = rng.normal(size=(len(rows), exact.dimension)).astype(np.float32) / np.sqrt(exact.dimension)
+    queries = normalize_rows(exact.vectors(rows) + args.noise * noise)
+
+    report = {
+        'vectors': int(len(exact.labels)),
+        'products': len(exact),
+        'index_bytes': int(ann.nbytes),
+        'exact_bytes': exact.nbytes,
+        'params': ann.params,
+        'results': evaluate(exact, ann, queries, args.k, nprobes)
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
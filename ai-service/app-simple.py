@@ -87,7 +87,10 @@ def recognize_product():
             return jsonify({"success": False, "error": "No image provided"}), 400
 
         file = request.files['image']
-        image = Image.open(io.BytesIO(file.read())).convert("RGB")
+        image = Image.open(io.BytesIO(file.read()))
+        # Decodificar el JPEG ya reducido (escalado DCT) cerca de los 1280 px que usa YOLO
+        image.draft("RGB", (1280, 1280))
+        image = image.convert("RGB")
         
         recognized_items = []
         
@@ -9,7 +9,8 @@ from ultralytics import YOLO
 from PIL import Image
 import io
 from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
+
+from embedding_index import EmbeddingIndex
 
 app = Flask(__name__)
 CORS(app)
@@ -26,11 +27,11 @@ yolo_model = None
 product_mapping = None
 knowledge_base = None
 clip_model = None
-nn_model = None
+embedding_index = None
 
 def load_models():
     """Cargar modelos y datos"""
-    global yolo_model, product_mapping, knowledge_base, clip_model, nn_model
+    global yolo_model, product_mapping, knowledge_base, clip_model, embedding_index
     
     try:
         print("🚀 Iniciando SCANIX AI Service...")
@@ -59,13 +60,10 @@ def load_models():
             clip_model = SentenceTransformer('clip-ViT-B-32')
             print("✅ CLIP cargado")
             
-            # Preparar k-NN
+            # Preparar índice de embeddings
             if knowledge_base:
-                product_ids = list(knowledge_base.keys())
-                embeddings = [knowledge_base[pid] for pid in product_ids]
-                nn_model = NearestNeighbors(n_neighbors=1, metric='cosine')
-                nn_model.fit(np.array(embeddings))
-                print("✅ k-NN entrenado")
+                embedding_index = EmbeddingIndex.from_knowledge_base(knowledge_base)
+                print("✅ Índice de embeddings construido")
         else:
             print("⚠️ Knowledge base no encontrada, usando reconocimiento simulado")
             knowledge_base = None
@@ -98,7 +96,10 @@ def recognize_product():
             return jsonify({"success": False, "error": "No image provided"}), 400
 
         file = request.files['image']
-        image = Image.open(io.BytesIO(file.read())).convert("RGB")
+        image = Image.open(io.BytesIO(file.read()))
+        # Decodificar el JPEG ya reducido (escalado DCT) cerca de los 1280 px que usa YOLO
+        image.draft("RGB", (1280, 1280))
+        image = image.convert("RGB")
         
         recognized_items = []
         
@@ -128,22 +129,19 @@ def recognize_product():
                                 "box": [x1, y1, x2, y2]
                             })
                 
-                if detections and clip_model and nn_model and knowledge_base:
+                if detections and clip_model and embedding_index:
                     # Usar CLIP + k-NN para identificar productos específicos
                     for detection in detections:
                         try:
                             # Generar embedding con CLIP
                             img_embedding = clip_model.encode(detection["image"])
                             
-                            # Buscar producto más cercano con k-NN
-                            distances, indices = nn_model.kneighbors(img_embedding.reshape(1, -1), n_neighbors=1)
-                            best_distance = distances[0][0]
-                            best_index = indices[0][0]
+                            # Buscar producto más cercano en el índice
+                            similarities, product_ids = embedding_index.search(img_embedding, k=1)
+                            best_distance = 1 - float(similarities[0][0])
                             
                             if best_distance < DISTANCE_THRESHOLD:
-                                # Obtener ID del producto desde knowledge_base
-                                product_ids = list(knowledge_base.keys())
-                                product_id = product_ids[best_index]
+                                product_id = product_ids[0][0]
                                 
                                 # Buscar en product_mapping
                                 product_info = None
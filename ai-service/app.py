@@ -1,162 +1,1282 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, request, jsonify
 from flask_cors import CORS
-import cv2
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 import numpy as np
 import pickle
 import json
 import os
-from ultralytics import YOLO
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
+import time
+from concurrent.futures import ThreadPoolExecutor
 import base64
-from PIL import Image
-import io
+import hmac
+
+from embedding_index import EmbeddingIndex, select_precision
+from ann_index import AnnIndex, build_from_index, source_fingerprint
+from kb_bundle import load_bundle
+from batching import MicroBatcher, QueueFullError
+from admission import PRIORITIES, AdmissionController, Deadline, DeadlineExceeded, Overloaded
+from embedding_cache import EmbeddingCache, dhash_from_blocks
+from result_cache import ResultCache, content_key
+from image_decode import ImageTooLargeError, decode_image
+from inference_backends import create_detector, create_image_encoder
+from tiling import TiledDetector
+import cpu_topology
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram, process_rss_bytes, torch_threads
+from service_log import get_logger
+from tracking import ByteTracker, SessionStore, StreamSession
+from bulk import BulkItemError, UploadSpool, recognize_bulk
+from catalog_updates import CatalogError, LiveCatalog
+from product_catalog import ProductCatalog, dumps as dumps_json, product_entry
+from text_prototypes import build_text_prototypes, default_text_encoder, load_dataset, merge_text_rows, text_products
 
 app = Flask(__name__)
 CORS(app)
+log = get_logger('scanix.app')
 
 # Configuración
 MODEL_PATH = 'models/best.pt'
 KNOWLEDGE_BASE_PATH = 'models/knowledge_base.pkl'
 PRODUCT_MAPPING_PATH = 'models/product_mapping.json'
+# Bundle compilado con `python kb_bundle.py compile`; si existe reemplaza al pickle + mapping
+KB_BUNDLE_PATH = os.environ.get('SCANIX_KB_BUNDLE', 'models/knowledge_base.scxkb')
+KB_BUNDLE_VERIFY = os.environ.get('SCANIX_KB_VERIFY', '1') != '0'
+# Búsqueda: 'exact' (matmul contra todo el knowledge base) o 'ann' (IVF-PQ, construir con ann_index.py build)
+INDEX_TYPE = os.environ.get('SCANIX_INDEX', 'exact')
+ANN_INDEX_PATH = os.environ.get('SCANIX_ANN_INDEX', 'models/knowledge_base.ann.npz')
+# Listas sondeadas y candidatos reordenados con los vectores exactos (recall vs latencia)
+ANN_NPROBE = int(os.environ.get('SCANIX_ANN_NPROBE', 0)) or None
+ANN_RERANK = int(os.environ['SCANIX_ANN_RERANK']) if os.environ.get('SCANIX_ANN_RERANK') else None
+# Campo del mapeo para particionar si el índice se construye al arrancar (p. ej. 'categoria')
+ANN_PARTITION_BY = os.environ.get('SCANIX_ANN_PARTITION', '') or None
+# Representación en memoria del índice exacto: 'fp32', 'fp16' (la mitad) o 'pq' (centro por
+# producto + residuo con product quantization de m bytes por fila); solo si pasa el gate de precisión
+KB_PRECISION = os.environ.get('SCANIX_KB_PRECISION', 'fp32')
+KB_PQ_M = int(os.environ.get('SCANIX_KB_PQ_M', 0)) or None
+KB_MIN_AGREEMENT = float(os.environ.get('SCANIX_KB_MIN_AGREEMENT', 0.98))
+KB_MAX_DRIFT = float(os.environ.get('SCANIX_KB_MAX_DRIFT', 0.02))
+# Prototipos de texto de CLIP (nombre/marca/volumen/keywords) para productos sin fotos: 'missing'
+# (solo esos), 'all' u 'off'; cacheados en disco por hash del catálogo (solo índice exacto)
+TEXT_PROTOTYPES_MODE = os.environ.get('SCANIX_TEXT_PROTOTYPES', 'missing')
+TEXT_PROTOTYPES_PATH = os.environ.get('SCANIX_TEXT_PROTOTYPES_PATH', 'models/text_prototypes.npz')
+# Catálogos JSON con productos sin fotos (p. ej. ../DATASET-BEBIDAS-ARGENTINA.json), separados por ':'
+TEXT_CATALOG_PATHS = [path for path in os.environ.get('SCANIX_TEXT_CATALOG', '').split(os.pathsep) if path]
+# Factor de las filas de texto: lleva la similitud imagen-texto (~0.3) a la escala imagen-imagen
+TEXT_SIMILARITY_SCALE = float(os.environ.get('SCANIX_TEXT_SCALE', 2.5))
 CONFIDENCE_THRESHOLD = 0.5
+SIMILARITY_THRESHOLD = 0.7
+CLIP_BATCH_SIZE = int(os.environ.get('SCANIX_CLIP_BATCH_SIZE', 32))
+# Decodificación: lado largo objetivo y límites de entrada
+DECODE_TARGET_SIZE = int(os.environ.get('SCANIX_DECODE_TARGET_SIZE', 1280))
+MAX_IMAGE_PIXELS = int(os.environ.get('SCANIX_MAX_IMAGE_PIXELS', 40_000_000))
+MAX_UPLOAD_BYTES = int(float(os.environ.get('SCANIX_MAX_UPLOAD_MB', 20)) * 1024 * 1024)
+# Inferencia por tiles para fotos de góndola: 'off', 'auto' (según tamaño y densidad) o 'always'
+TILING_MODE = os.environ.get('SCANIX_TILING', 'off')
+# Con tiles, /recognize y /recognize/batch decodifican hasta este lado largo (en lugar de DECODE_TARGET_SIZE)
+TILE_DECODE_SIZE = int(os.environ.get('SCANIX_TILE_DECODE_SIZE', 2560))
+TILE_OVERLAP = float(os.environ.get('SCANIX_TILE_OVERLAP', 0.2))
+TILE_MAX_TILES = int(os.environ.get('SCANIX_TILE_MAX', 12))
+# Política 'auto': tiles si la pasada completa ve al menos N objetos o cajas de menos de N px a imgsz
+TILE_MIN_OBJECTS = int(os.environ.get('SCANIX_TILE_MIN_OBJECTS', 12))
+TILE_SMALL_PX = float(os.environ.get('SCANIX_TILE_SMALL_PX', 32))
+# Hilos entre los que se reparten los tiles (1 = un solo batch)
+TILE_WORKERS = int(os.environ.get('SCANIX_TILE_WORKERS', 1))
+RECOGNIZE_DECODE_SIZE = max(DECODE_TARGET_SIZE, TILE_DECODE_SIZE) if TILING_MODE != 'off' else DECODE_TARGET_SIZE
+# Micro-batching entre requests concurrentes (ventana 0 = desactivado)
+BATCH_MAX_WAIT_MS = float(os.environ.get('SCANIX_BATCH_WAIT_MS', 0))
+BATCH_MAX_SIZE = int(os.environ.get('SCANIX_BATCH_MAX_SIZE', 8))
+BATCH_MAX_QUEUE = int(os.environ.get('SCANIX_BATCH_MAX_QUEUE', 64))
+# Control de admisión: inferencias simultáneas por proceso (0 = tamaño de batch con micro-batching, si no 1),
+# cola máxima, espera máxima en cola (la cola se dimensiona con el tiempo de servicio medido)
+# y fracción de la cola para tráfico batch (auditorías)
+ADMISSION_CONCURRENCY = int(os.environ.get('SCANIX_ADMISSION_CONCURRENCY', 0)) or (BATCH_MAX_SIZE if BATCH_MAX_WAIT_MS > 0 else 1)
+ADMISSION_MAX_QUEUE = int(os.environ.get('SCANIX_ADMISSION_MAX_QUEUE', 64))
+ADMISSION_MAX_WAIT_MS = float(os.environ.get('SCANIX_ADMISSION_MAX_WAIT_MS', 5000))
+ADMISSION_BATCH_SHARE = float(os.environ.get('SCANIX_ADMISSION_BATCH_SHARE', 0.5))
+# Deadline (ms) de los requests sin X-Scanix-Deadline-Ms: el timeout de axios del backend Node (0 = sin deadline)
+DEFAULT_DEADLINE_MS = float(os.environ.get('SCANIX_DEFAULT_DEADLINE_MS', 30000))
+DEADLINE_HEADER = 'X-Scanix-Deadline-Ms'
+# Clase de prioridad del request: 'interactive' (caja, default) o 'batch' (auditorías)
+PRIORITY_HEADER = 'X-Scanix-Priority'
+# Cache de embeddings por hash perceptual del ROI (0 entradas = desactivado)
+EMBED_CACHE_ENTRIES = int(os.environ.get('SCANIX_EMBED_CACHE_ENTRIES', 4096))
+EMBED_CACHE_MB = float(os.environ.get('SCANIX_EMBED_CACHE_MB', 64))
+EMBED_CACHE_TTL = float(os.environ.get('SCANIX_EMBED_CACHE_TTL', 3600))
+EMBED_CACHE_TOLERANCE = int(os.environ.get('SCANIX_EMBED_CACHE_TOLERANCE', 8))
+# Cache de respuestas completas por hash de la imagen (0 entradas = desactivado)
+RESULT_CACHE_ENTRIES = int(os.environ.get('SCANIX_RESULT_CACHE_ENTRIES', 1024))
+RESULT_CACHE_MB = float(os.environ.get('SCANIX_RESULT_CACHE_MB', 16))
+RESULT_CACHE_TTL = float(os.environ.get('SCANIX_RESULT_CACHE_TTL', 300))
+# Backend de inferencia: 'torch' (PyTorch) u 'onnx' (ONNX Runtime, exportar con onnx_backend.py)
+INFERENCE_BACKEND = os.environ.get('SCANIX_BACKEND', 'torch')
+ONNX_DIR = os.environ.get('SCANIX_ONNX_DIR', 'models/onnx')
+# Hilos intra-op de cada sesión de ONNX Runtime (0 = los de torch por worker, SCANIX_TORCH_THREADS)
+ONNX_THREADS = int(os.environ.get('SCANIX_ONNX_THREADS', 0)) or None
+# Comparar ONNX contra PyTorch al arrancar (importa torch); si no coincide se usa PyTorch
+ONNX_PARITY_CHECK = os.environ.get('SCANIX_ONNX_PARITY', '1') != '0'
+PARITY_IMAGE_PATH = os.environ.get('SCANIX_PARITY_IMAGE', '../test_image.jpg')
+# Encoder de CLIP en INT8: '' (FP32), 'dynamic' o 'static' (static solo con backend onnx)
+CLIP_INT8_MODE = os.environ.get('SCANIX_CLIP_INT8', '')
+# Fotos de muestra por producto (<dir>/<product_id>/*.jpg) para calibrar y validar el INT8
+QUANT_SAMPLES_DIR = os.environ.get('SCANIX_QUANT_SAMPLES_DIR', 'models/samples')
+INT8_MIN_AGREEMENT = float(os.environ.get('SCANIX_INT8_MIN_AGREEMENT', 0.98))
+INT8_MAX_DRIFT = float(os.environ.get('SCANIX_INT8_MAX_DRIFT', 0.02))
+# Inferencia sintética antes de reportar ready
+WARMUP_ENABLED = os.environ.get('SCANIX_WARMUP', '1') != '0'
+# Streaming con tracking: detecciones de score bajo para la 2da etapa de asociación,
+# frames que un track puede faltar, y re-identificación de tracks dudosos
+TRACK_LOW_CONFIDENCE = float(os.environ.get('SCANIX_TRACK_LOW_CONF', 0.1))
+TRACK_MAX_LOST = int(os.environ.get('SCANIX_TRACK_MAX_LOST', 30))
+TRACK_MIN_HITS = int(os.environ.get('SCANIX_TRACK_MIN_HITS', 2))
+TRACK_RECHECK_FRAMES = int(os.environ.get('SCANIX_TRACK_RECHECK_FRAMES', 10))
+TRACK_MAX_CHECKS = int(os.environ.get('SCANIX_TRACK_MAX_CHECKS', 3))
+TRACK_MARGIN = float(os.environ.get('SCANIX_TRACK_MARGIN', 0.05))
+STREAM_MAX_SESSIONS = int(os.environ.get('SCANIX_STREAM_SESSIONS', 64))
+STREAM_IDLE_SECONDS = float(os.environ.get('SCANIX_STREAM_IDLE', 120))
+# Las sesiones HTTP de streaming viven en un worker: con varios workers solo se abren si el
+# balanceador enruta cada session_id siempre al mismo worker (afinidad)
+STREAM_STICKY = os.environ.get('SCANIX_STREAM_STICKY', '0') != '0'
+# Reconocimiento masivo (/recognize/batch): imágenes por lote, hilos de decode y tamaño máximo del request
+BULK_BATCH_SIZE = int(os.environ.get('SCANIX_BULK_BATCH_SIZE', 8))
+BULK_DECODE_THREADS = int(os.environ.get('SCANIX_BULK_DECODE_THREADS', min(4, os.cpu_count() or 1)))
+BULK_MAX_UPLOAD_BYTES = int(os.environ.get('SCANIX_BULK_MAX_UPLOAD_MB', 2048)) * 1024 * 1024
+# Partes (archivos) multipart por request de /recognize/batch
+BULK_MAX_FILES = int(os.environ.get('SCANIX_BULK_MAX_FILES', 10000))
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# Productos por página como máximo en /products?limit=
+PRODUCTS_MAX_LIMIT = int(os.environ.get('SCANIX_PRODUCTS_MAX_LIMIT', 1000))
+# Actualizaciones del catálogo en caliente (/admin/*, deshabilitado sin token)
+ADMIN_TOKEN = os.environ.get('SCANIX_ADMIN_TOKEN', '')
+CATALOG_JOURNAL_PATH = os.environ.get('SCANIX_CATALOG_JOURNAL', 'models/catalog_journal.ndjson')
+CATALOG_SYNC_SECONDS = float(os.environ.get('SCANIX_CATALOG_SYNC_SECONDS', 1))
+CATALOG_COMPACT_ROWS = int(os.environ.get('SCANIX_CATALOG_COMPACT_ROWS', 4096))
+CATALOG_COMPACT_TOMBSTONES = int(os.environ.get('SCANIX_CATALOG_COMPACT_TOMBSTONES', 256))
+
+# Rechazar uploads demasiado grandes antes de leerlos (413)
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+class ScanixRequest(Request):
+    """Request con límites de tamaño y de partes multipart propios para /recognize/batch"""
+    
+    @property
+    def max_content_length(self):
+        if self.path == '/recognize/batch':
+            return BULK_MAX_UPLOAD_BYTES
+        return super().max_content_length
+    
+    @property
+    def max_form_parts(self):
+        if self.path == '/recognize/batch':
+            return BULK_MAX_FILES
+        return super().max_form_parts
+
+app.request_class = ScanixRequest
 
 # Variables globales
-yolo_model = None
-clip_model = None
+detector = None
+# YOLO con tiles para /recognize (None con SCANIX_TILING=off); streaming usa siempre detector
+tiled_detector = None
+image_encoder = None
 knowledge_base = None
 product_mapping = None
-nn_model = None
+embedding_index = None
+# Índice + mapeo actualizables en caliente; embedding_index y product_mapping
+# apuntan siempre a su último snapshot
+catalog = None
+# Mapeo del último snapshot compilado (lookups por id/SKU/categoría y /products pre-serializado)
+products_catalog = None
+batcher = None
+admission = AdmissionController(
+    concurrency=ADMISSION_CONCURRENCY,
+    max_wait=ADMISSION_MAX_WAIT_MS / 1000.0,
+    max_queue=ADMISSION_MAX_QUEUE,
+    batch_share=ADMISSION_BATCH_SHARE
+)
+embedding_cache = EmbeddingCache(
+    max_entries=EMBED_CACHE_ENTRIES,
+    max_bytes=int(EMBED_CACHE_MB * 1024 * 1024),
+    ttl_seconds=EMBED_CACHE_TTL,
+    tolerance=EMBED_CACHE_TOLERANCE
+) if EMBED_CACHE_ENTRIES > 0 else None
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_ENTRIES,
+    max_bytes=int(RESULT_CACHE_MB * 1024 * 1024),
+    ttl_seconds=RESULT_CACHE_TTL
+) if RESULT_CACHE_ENTRIES > 0 else None
+stream_sessions = SessionStore(max_sessions=STREAM_MAX_SESSIONS, idle_seconds=STREAM_IDLE_SECONDS)
+model_version = ''
+files_version = ''
+# Estado de arranque: duración de cada fase (segundos) y si ya se hizo el warm-up
+startup_phases = {}
+warmed_up = False
+# Con preload (master de gunicorn) las verificaciones que infieren corren en un proceso hijo efímero
+isolate_checks = False
+# Backend activo y resultado del chequeo de paridad ONNX
+backend_status = {'requested': INFERENCE_BACKEND, 'active': None, 'parity': None}
+# Tipo y parámetros del índice de búsqueda
+index_status = {'type': INDEX_TYPE}
+# Precisión del encoder de CLIP y resultado del gate de precisión INT8
+quantization_status = {'requested': CLIP_INT8_MODE or 'fp32', 'active': 'fp32', 'gate': None}
+
+# Métricas de Prometheus (/metrics)
+STAGE_SECONDS = Histogram('scanix_stage_seconds', 'Duración de cada etapa del pipeline en segundos', ['stage'])
+STAGE_DECODE = STAGE_SECONDS.labels('decode')
+STAGE_YOLO = STAGE_SECONDS.labels('yolo')
+STAGE_CROP = STAGE_SECONDS.labels('crop')
+STAGE_CLIP = STAGE_SECONDS.labels('clip')
+STAGE_SEARCH = STAGE_SECONDS.labels('search')
+STAGE_SERIALIZE = STAGE_SECONDS.labels('serialize')
+DETECTIONS = Counter('scanix_detections', 'Objetos detectados por YOLO')
+RECOGNITIONS = Counter('scanix_recognitions', 'Detecciones reconocidas sobre el umbral de similitud')
+BELOW_THRESHOLD = Counter('scanix_below_threshold', 'Detecciones descartadas por similitud bajo el umbral')
+ERRORS = Counter('scanix_errors', 'Errores por tipo', ['type'])
+IN_FLIGHT = Gauge('scanix_requests_in_flight', 'Requests de reconocimiento en curso')
+REJECTED = Counter('scanix_admission_rejected', 'Requests rechazados con 503 por cola llena, por prioridad', ['priority'])
+DEADLINE_EXPIRED = Counter('scanix_deadline_expired', 'Requests descartados por deadline vencido, por etapa', ['stage'])
+Gauge('scanix_admission_waiting', 'Requests esperando lugar para inferir, por prioridad', ['priority'],
+      callback=lambda: {(name, ): count for name, count in admission.stats()['waiting'].items()})
+Gauge('scanix_batch_queue_depth', 'Imágenes esperando en la cola del micro-batcher',
+      callback=lambda: batcher.queue_depth if batcher else 0)
+Gauge('scanix_cache_hit_ratio', 'Hit ratio de los caches', ['cache'],
+      callback=lambda: {(name, ): cache.stats()['hit_ratio']
+                        for name, cache in (('embedding', embedding_cache), ('result', result_cache)) if cache})
+Gauge('scanix_process_rss_bytes', 'Memoria residente del proceso', callback=process_rss_bytes)
+Gauge('scanix_torch_threads', 'Hilos intra-op de PyTorch', callback=torch_threads)
+Gauge('scanix_ready', 'Modelos cargados y con warm-up', callback=lambda: int(is_ready()))
+STREAM_FRAMES = Counter('scanix_stream_frames', 'Frames procesados por sesiones de streaming')
+STREAM_IDENTIFIED = Counter('scanix_stream_identified', 'Tracks enviados a CLIP en sesiones de streaming')
+Gauge('scanix_stream_sessions', 'Sesiones de streaming abiertas', callback=lambda: len(stream_sessions))
+
+def model_files_version():
+    """Versión de modelos + knowledge base + umbrales, para invalidar el cache de respuestas"""
+    parts = [f'conf={CONFIDENCE_THRESHOLD}', f'sim={SIMILARITY_THRESHOLD}',
+             f"backend={backend_status['active']}", f"clip={quantization_status['active']}"]
+    if INDEX_TYPE == 'ann':
+        parts.append(f"ann={index_status.get('nprobe')}/{index_status.get('rerank')}")
+    else:
+        parts.append(f"kb={index_status.get('precision')}")
+        parts.append(f"text={TEXT_PROTOTYPES_MODE}/{TEXT_SIMILARITY_SCALE}")
+    if TILING_MODE != 'off':
+        parts.append(f'tiles={TILING_MODE}/{RECOGNIZE_DECODE_SIZE}/{TILE_OVERLAP}/{TILE_MAX_TILES}/'
+                     f'{TILE_MIN_OBJECTS}/{TILE_SMALL_PX}')
+    for path in (MODEL_PATH, KB_BUNDLE_PATH, KNOWLEDGE_BASE_PATH, PRODUCT_MAPPING_PATH, ANN_INDEX_PATH,
+                 TEXT_PROTOTYPES_PATH, *TEXT_CATALOG_PATHS):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f'{path}:{stat.st_size}:{stat.st_mtime_ns}')
+    return '|'.join(parts)
+
+def load_detector():
+    """Cargar YOLO en el backend configurado (importa ultralytics/onnxruntime recién acá)"""
+    return create_detector(INFERENCE_BACKEND, MODEL_PATH, conf=CONFIDENCE_THRESHOLD,
+                           onnx_dir=ONNX_DIR, threads=ONNX_THREADS)
+
+def load_tiled_detector(base):
+    """Detector con tiles para fotos de góndola, o None si está desactivado"""
+    if TILING_MODE == 'off':
+        return None
+    tiled = TiledDetector(base, mode=TILING_MODE, overlap=TILE_OVERLAP, max_tiles=TILE_MAX_TILES,
+                          min_objects=TILE_MIN_OBJECTS, small_object_px=TILE_SMALL_PX, workers=TILE_WORKERS)
+    log.info('tiling_enabled', "Inferencia por tiles activa", mode=TILING_MODE, tile_size=tiled.tile_size,
+             decode_size=RECOGNIZE_DECODE_SIZE, max_tiles=TILE_MAX_TILES)
+    return tiled
+
+def load_image_encoder():
+    """Cargar el encoder de imágenes de CLIP en el backend configurado"""
+    return create_image_encoder(INFERENCE_BACKEND, batch_size=CLIP_BATCH_SIZE,
+                                onnx_dir=ONNX_DIR, threads=ONNX_THREADS)
+
+def load_knowledge_base():
+    """Cargar knowledge base, mapeo de productos e índice de embeddings (sin inferir)"""
+    if os.path.exists(KB_BUNDLE_PATH):
+        # Bundle compilado: embeddings mapeados en memoria, compartidos entre workers
+        bundle = load_bundle(KB_BUNDLE_PATH, verify=KB_BUNDLE_VERIFY)
+        log.info('kb_bundle_loaded', "Bundle del knowledge base cargado", checksum=bundle.checksum[:12])
+        kb, mapping, index = bundle, bundle.product_mapping, bundle.build_index()
+    else:
+        # Cargar knowledge base
+        with open(KNOWLEDGE_BASE_PATH, 'rb') as f:
+            kb = pickle.load(f)
+        
+        # Cargar mapeo de productos
+        with open(PRODUCT_MAPPING_PATH, 'r') as f:
+            mapping = json.load(f)
+        
+        # Construir índice de embeddings (prototipos + muestras normalizados)
+        index = EmbeddingIndex.from_knowledge_base(kb)
+    
+    if INDEX_TYPE == 'ann':
+        index = load_ann_index(index, mapping)
+    return kb, mapping, index
+
+def prepare_exact_index(index, mapping, encode_text):
+    """Prototipos de texto y compresión del índice exacto (después de cargar todo: pueden inferir)"""
+    if INDEX_TYPE != 'ann':
+        if TEXT_PROTOTYPES_MODE != 'off':
+            index, mapping = add_text_prototypes(index, mapping, encode_text)
+        if KB_PRECISION not in ('fp32', index.precision):
+            index = select_kb_precision(index)
+        index_status.update(precision=index.precision, bytes=index.nbytes)
+    index_status.update(type=INDEX_TYPE, vectors=len(index.labels))
+    return index, mapping
 
-def load_models():
-    """Cargar todos los modelos necesarios"""
-    global yolo_model, clip_model, knowledge_base, product_mapping, nn_model
+def add_text_prototypes(index, mapping, encode_text):
+    """Sumar al índice una fila de texto por producto sin fotos (del cache si el catálogo no cambió)"""
+    extra = {}
+    for path in TEXT_CATALOG_PATHS:
+        extra.update({pid: {**info, 'samples': 0} for pid, info in load_dataset(path).items()})
+    mapping = {**extra, **mapping}
+    products = text_products(mapping, index, TEXT_PROTOTYPES_MODE)
+    if not products:
+        return index, mapping
     
+    start = time.perf_counter()
     try:
-        print("🤖 Cargando modelos...")
+        prototypes, stats = startup_check(lambda: build_text_prototypes(products, encode_text, TEXT_PROTOTYPES_PATH))
+        index = merge_text_rows(index, prototypes, TEXT_SIMILARITY_SCALE)
+    except Exception as e:
+        index_status['text'] = {'error': str(e)}
+        log.warning('text_prototypes_error', "Prototipos de texto no disponibles", error=str(e))
+        return index, mapping
+    
+    index_status['text'] = {**stats, 'mode': TEXT_PROTOTYPES_MODE, 'scale': TEXT_SIMILARITY_SCALE}
+    log.info('text_prototypes_loaded', "Prototipos de texto agregados al índice",
+             seconds=round(time.perf_counter() - start, 3), **stats)
+    return index, mapping
+
+def text_encoder(encoder):
+    """encode_text del encoder de CLIP cargado, o el de sentence_transformers si el backend no tiene"""
+    if hasattr(encoder, 'encode_text'):
+        return encoder.encode_text
+    return default_text_encoder()
+
+def select_kb_precision(exact):
+    """Comprimir el índice exacto y usarlo solo si pasa el gate de precisión contra float32"""
+    def compress():
+        index, report = select_precision(exact, KB_PRECISION, m=KB_PQ_M, min_agreement=KB_MIN_AGREEMENT,
+                                         max_drift=KB_MAX_DRIFT)
+        # Solo vuelve el comprimido: el original (quizás un memmap del bundle) ya está cargado
+        return (index if index is not exact else None), report
+    
+    start = time.perf_counter()
+    compressed, report = startup_check(compress)
+    index = exact if compressed is None else compressed
+    index_status['compression'] = report
+    if report['active'] == KB_PRECISION:
+        log.info('kb_compressed', "Knowledge base comprimido", seconds=round(time.perf_counter() - start, 3),
+                 **report)
+    else:
+        log.warning('kb_compression_rejected', "Compresión del knowledge base descartada, usando float32",
+                    **report)
+    return index
+
+def load_ann_index(exact, mapping):
+    """Índice IVF-PQ guardado en ANN_INDEX_PATH, o construido al arrancar si falta o no corresponde.
+    
+    Corresponde si se construyó de los mismos embeddings (fingerprint del contenido, no solo las cantidades).
+    """
+    if os.path.exists(ANN_INDEX_PATH):
+        ann = AnnIndex.load(ANN_INDEX_PATH, nprobe=ANN_NPROBE, rerank=ANN_RERANK)
+        if ann.source_fingerprint == source_fingerprint(exact):
+            index_status.update(source=ANN_INDEX_PATH, **ann_status(ann))
+            return ann
+        log.warning('ann_index_stale', "El índice ANN no corresponde al knowledge base, se reconstruye",
+                    path=ANN_INDEX_PATH)
+    
+    start = time.perf_counter()
+    ann = build_from_index(exact, mapping, ANN_PARTITION_BY, store_vectors=bool(ANN_RERANK),
+                           rerank=ANN_RERANK or 0, **({'nprobe': ANN_NPROBE} if ANN_NPROBE else {}))
+    index_status.update(source='startup', **ann_status(ann))
+    log.info('ann_index_built', "Índice ANN construido al arrancar (guardarlo con `python ann_index.py build`)",
+             seconds=round(time.perf_counter() - start, 3), **ann.params)
+    return ann
+
+def ann_status(ann):
+    return {**ann.params, 'nprobe': ann.nprobe, 'rerank': ann.rerank, 'bytes': int(ann.nbytes)}
+
+def timed(fn):
+    """Ejecutar fn y devolver (resultado, segundos)"""
+    start = time.perf_counter()
+    return fn(), time.perf_counter() - start
+
+def startup_check(fn):
+    """fn() en este proceso o, con preload, en un proceso hijo efímero (fork) que devuelve el resultado.
+    
+    Las verificaciones de arranque (paridad ONNX, gate INT8, compresión del
+    índice, prototipos de texto) infieren: en el master de gunicorn eso crea
+    pools de hilos de OpenMP antes del fork, con la configuración del master.
+    En el hijo los pools nacen y mueren con él. El resultado tiene que ser picklable.
+    """
+    if not isolate_checks:
+        return fn()
+    import multiprocessing
+    
+    context = multiprocessing.get_context('fork')
+    reader, writer = context.Pipe(duplex=False)
+    
+    def run():
+        try:
+            # Los mismos hilos intra-op que tendrá cada worker (no los del master)
+            cpu_topology.configure_torch(cpu_topology.intra_op_threads())
+            writer.send((True, fn()))
+        except BaseException as e:
+            writer.send((False, f'{type(e).__name__}: {e}'))
+    
+    process = context.Process(target=run, name='scanix-startup-check', daemon=True)
+    process.start()
+    writer.close()
+    try:
+        # Recibir antes del join: un resultado grande no entra en el buffer del pipe
+        ok, result = reader.recv()
+    except EOFError:
+        ok, result = False, None
+    finally:
+        reader.close()
+    process.join()
+    if not ok:
+        raise RuntimeError(result or f"La verificación de arranque terminó con código {process.exitcode}")
+    return result
+
+def load_models(warmup=None, preload=False):
+    """Cargar todos los modelos necesarios (YOLO, CLIP y knowledge base en paralelo).
+    
+    preload=True (master de gunicorn): sin warm-up y con las verificaciones que
+    infieren en un proceso hijo (ver startup_check); el master no infiere.
+    """
+    global detector, tiled_detector, image_encoder, knowledge_base, catalog, files_version, isolate_checks
+    
+    try:
+        log.info('models_loading', "Cargando modelos", backend=INFERENCE_BACKEND)
+        startup_phases.clear()
+        start = time.perf_counter()
         
-        # Cargar YOLO
-        yolo_model = YOLO(MODEL_PATH)
-        print("✅ YOLO cargado")
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix='scanix-load') as pool:
+            yolo_future = pool.submit(timed, load_detector)
+            clip_future = pool.submit(timed, load_image_encoder)
+            kb_future = pool.submit(timed, load_knowledge_base)
+            
+            detector, startup_phases['yolo'] = yolo_future.result()
+            log.info('yolo_loaded', "YOLO cargado", backend=INFERENCE_BACKEND, seconds=round(startup_phases['yolo'], 3))
+            image_encoder, startup_phases['clip'] = clip_future.result()
+            log.info('clip_loaded', "CLIP cargado", backend=INFERENCE_BACKEND, seconds=round(startup_phases['clip'], 3))
+            (knowledge_base, product_mapping, embedding_index), startup_phases['knowledge_base'] = kb_future.result()
+            log.info('kb_loaded', "Knowledge base cargada", seconds=round(startup_phases['knowledge_base'], 3),
+                     products=len(embedding_index), vectors=len(embedding_index.labels), index=INDEX_TYPE)
+        startup_phases['load'] = time.perf_counter() - start
         
-        # Cargar CLIP
-        clip_model = SentenceTransformer('clip-ViT-B-32')
-        print("✅ CLIP cargado")
+        # Lo que sigue puede inferir: con preload se hace en procesos hijos, ya sin hilos de carga vivos
+        isolate_checks = preload
+        # El encoder de texto se carga solo si el cache de prototipos de texto no sirve
+        encode_text = lambda texts: text_encoder(image_encoder)(texts)
+        embedding_index, product_mapping = prepare_exact_index(embedding_index, product_mapping, encode_text)
         
-        # Cargar knowledge base
-        with open(KNOWLEDGE_BASE_PATH, 'rb') as f:
-            knowledge_base = pickle.load(f)
-        print("✅ Knowledge base cargada")
+        # Cambios del catálogo hechos en caliente desde que se compiló el knowledge base
+        catalog = LiveCatalog(embedding_index, product_mapping, journal_path=CATALOG_JOURNAL_PATH,
+                              compact_rows=CATALOG_COMPACT_ROWS, compact_tombstones=CATALOG_COMPACT_TOMBSTONES,
+                              on_publish=publish_catalog, logger=log)
+        if catalog.seq:
+            log.info('catalog_replayed', "Cambios del catálogo aplicados", entries=catalog.seq,
+                     products=len(catalog.snapshot.index))
         
-        # Cargar mapeo de productos
-        with open(PRODUCT_MAPPING_PATH, 'r') as f:
-            product_mapping = json.load(f)
-        print("✅ Product mapping cargado")
+        backend_status['active'] = INFERENCE_BACKEND
+        if INFERENCE_BACKEND == 'onnx' and ONNX_PARITY_CHECK:
+            detector, image_encoder = verify_onnx_parity(detector, image_encoder)
+        if CLIP_INT8_MODE:
+            # El gate se mide contra el catálogo real (todavía no publicado en embedding_index)
+            image_encoder = select_int8_encoder(image_encoder, catalog.snapshot.index)
+        tiled_detector = load_tiled_detector(detector)
         
-        # Entrenar k-NN - usar la estructura correcta del knowledge_base
-        # El knowledge_base contiene los productos como claves
-        product_ids = list(knowledge_base.keys())
-        print(f"✅ Productos en knowledge base: {product_ids}")
+        files_version = model_files_version()
+        publish_catalog(catalog.snapshot)
         
-        # Crear un modelo k-NN simple para los 3 productos
-        nn_model = NearestNeighbors(n_neighbors=1, metric='cosine')
-        # Usar embeddings dummy por ahora (se generarán dinámicamente)
-        dummy_embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
-        nn_model.fit(dummy_embeddings)
-        print("✅ k-NN entrenado")
+        if warmup is None:
+            warmup = WARMUP_ENABLED and not preload
+        if warmup:
+            warmup_models()
         
-        print("🎉 Todos los modelos cargados exitosamente")
+        startup_phases['total'] = time.perf_counter() - start
+        log.info('models_loaded', "Todos los modelos cargados", seconds=round(startup_phases['total'], 3))
         return True
         
     except Exception as e:
-        print(f"❌ Error cargando modelos: {e}")
+        log.error('models_error', "Error cargando modelos", error=str(e))
         return False
 
-def preprocess_image(image_data):
-    """Preprocesar imagen para YOLO"""
+def publish_catalog(snapshot):
+    """Swap del índice y el mapeo a un snapshot nuevo (invalida el cache de respuestas)"""
+    global embedding_index, product_mapping, products_catalog, model_version
+    embedding_index = snapshot.index
+    product_mapping = snapshot.product_mapping
+    products_catalog = ProductCatalog(snapshot.product_mapping, snapshot.version, previous=products_catalog)
+    model_version = f'{files_version}|catalog={snapshot.version}'
+
+def start_catalog_sync():
+    """Hilo que aplica los cambios de otros workers (en cada worker, después del fork)"""
+    if catalog is not None:
+        catalog.start_sync(CATALOG_SYNC_SECONDS)
+
+def parity_image():
+    """Imagen para el chequeo de paridad: test_image.jpg si existe, si no una sintética"""
+    if os.path.exists(PARITY_IMAGE_PATH):
+        with open(PARITY_IMAGE_PATH, 'rb') as f:
+            return decode_image(f.read(), target_size=DECODE_TARGET_SIZE).array
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (DECODE_TARGET_SIZE * 3 // 4, DECODE_TARGET_SIZE, 3), dtype=np.uint8)
+
+def verify_onnx_parity(onnx_detector, onnx_encoder):
+    """Comparar el backend ONNX contra PyTorch; si no coincide, seguir con PyTorch"""
+    from onnx_backend import check_parity
+    
+    def check():
+        return check_parity(load_torch_models(), (onnx_detector, onnx_encoder), parity_image())
+    
+    start = time.perf_counter()
+    # Con preload corre en un hijo efímero: el master no infiere ni queda con los modelos de referencia
+    report = startup_check(check)
+    backend_status['parity'] = report
+    startup_phases['parity'] = time.perf_counter() - start
+    
+    if report['ok']:
+        log.info('onnx_parity_ok', "Paridad ONNX vs PyTorch OK", **report)
+        return onnx_detector, onnx_encoder
+    
+    log.warning('onnx_parity_failed', "El backend ONNX no coincide con PyTorch, usando PyTorch", **report)
+    backend_status['active'] = 'torch'
+    return load_torch_models()
+
+def load_torch_models():
+    """(detector, encoder) de PyTorch: referencia de la paridad y fallback si ONNX no coincide"""
+    return (create_detector('torch', MODEL_PATH, conf=CONFIDENCE_THRESHOLD),
+            create_image_encoder('torch', batch_size=CLIP_BATCH_SIZE))
+
+def select_int8_encoder(fp32_encoder, index):
+    """Cuantizar CLIP a INT8 y usarlo solo si pasa el gate de precisión contra FP32 (top-1 contra `index`)"""
+    from quantization import quantize_encoder, select_encoder
+    
+    def gate():
+        return select_encoder(fp32_encoder, CLIP_INT8_MODE, QUANT_SAMPLES_DIR, index,
+                              min_agreement=INT8_MIN_AGREEMENT, max_drift=INT8_MAX_DRIFT,
+                              onnx_dir=ONNX_DIR, threads=ONNX_THREADS)
+    
+    start = time.perf_counter()
+    if not isolate_checks:
+        encoder, report = gate()
+    else:
+        # El gate corre en un hijo; acá solo se reconstruye el encoder aprobado sin inferir
+        # (cuantización dinámica de torch determinística, o el grafo ONNX que el hijo dejó en disco)
+        report = startup_check(lambda: gate()[1])
+        encoder = fp32_encoder
+        if report['active'] == 'int8':
+            encoder = quantize_encoder(fp32_encoder, CLIP_INT8_MODE, onnx_dir=ONNX_DIR, threads=ONNX_THREADS)
+    quantization_status.update(active=report.pop('active'), gate=report)
+    startup_phases['quantization'] = time.perf_counter() - start
+    
+    if quantization_status['active'] == 'int8':
+        log.info('clip_int8_enabled', "CLIP INT8 activo", **report)
+    else:
+        log.warning('clip_int8_rejected', "CLIP INT8 descartado, usando FP32", **report)
+    return encoder
+
+def warmup_models():
+    """Inferencia sintética a los tamaños de producción (JIT, allocator, pools de hilos)"""
+    global warmed_up
+    
+    start = time.perf_counter()
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (DECODE_TARGET_SIZE * 3 // 4, DECODE_TARGET_SIZE, 3), dtype=np.uint8)
+    
+    # YOLO a la resolución de entrada y CLIP con un batch completo (sin tocar los caches)
+    detect_products_yolo_batch([image])
+    height, width = image.shape[:2]
+    boxes = np.tile(np.array([[0, 0, width // 2, height // 2]], dtype=np.float32), (min(CLIP_BATCH_SIZE, 8), 1))
+    embeddings = image_encoder.encode([image_encoder.pixel_values(image_encoder.prepare(image), boxes)])
+    embedding_index.search(embeddings, k=1)
+    
+    startup_phases['warmup'] = time.perf_counter() - start
+    warmed_up = True
+    log.info('warmup_done', "Warm-up completo", seconds=round(startup_phases['warmup'], 3))
+
+def is_ready():
+    """Listo para recibir tráfico: modelos cargados y, si corresponde, con warm-up"""
+    return models_ready() and (warmed_up or not WARMUP_ENABLED)
+
+def preprocess_image(image_data, target_size=None):
+    """Preprocesar imagen para YOLO (DecodedImage reducida hacia target_size, por defecto DECODE_TARGET_SIZE)"""
     try:
         # Convertir base64 a imagen
         if isinstance(image_data, str):
             image_data = base64.b64decode(image_data)
         
-        # Convertir bytes a imagen
-        image = Image.open(io.BytesIO(image_data))
-        image = image.convert('RGB')
-        
-        # Convertir a numpy array
-        image_array = np.array(image)
-        
-        return image_array
+        with STAGE_DECODE.time():
+            return decode_image(image_data, target_size=target_size or DECODE_TARGET_SIZE,
+                                max_pixels=MAX_IMAGE_PIXELS, max_bytes=MAX_UPLOAD_BYTES)
+    except ImageTooLargeError:
+        ERRORS.labels('too_large').inc()
+        raise
     except Exception as e:
-        print(f"❌ Error preprocesando imagen: {e}")
+        ERRORS.labels('decode').inc()
+        log.error('decode_error', "Error preprocesando imagen", error=str(e))
         return None
 
-def detect_products_yolo(image):
-    """Detectar productos usando YOLO"""
+def detect_products_yolo_batch(images):
+    """Detectar productos en varias imágenes con una sola llamada a YOLO (más los tiles que decida la política)"""
     try:
-        results = yolo_model(image, conf=CONFIDENCE_THRESHOLD)
+        with STAGE_YOLO.time():
+            outputs = (tiled_detector or detector).detect(images)
         
-        detections = []
-        for result in results:
-            if result.boxes is not None:
-                for box in result.boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    conf = box.conf[0].cpu().numpy()
-                    
-                    # Extraer ROI
-                    roi = image[int(y1):int(y2), int(x1):int(x2)]
-                    
-                    detections.append({
-                        'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                        'confidence': float(conf),
-                        'roi': roi
-                    })
+        batch_detections = []
+        for boxes, confs in outputs:
+            detections = []
+            for bbox, conf in zip(boxes.astype(int).tolist(), confs.tolist()):
+                detections.append({
+                    'bbox': bbox,
+                    'confidence': conf
+                })
+            batch_detections.append(detections)
         
-        return detections
+        DETECTIONS.inc(sum(len(detections) for detections in batch_detections))
+        return batch_detections
     except Exception as e:
-        print(f"❌ Error en detección YOLO: {e}")
-        return []
+        ERRORS.labels('yolo').inc()
+        log.error('yolo_error', "Error en detección YOLO", error=str(e))
+        return [[] for _ in images]
+
+def detect_products_yolo(image):
+    """Detectar productos usando YOLO"""
+    return detect_products_yolo_batch([image])[0]
 
-def recognize_product_clip(roi):
-    """Reconocer producto usando CLIP + k-NN"""
+def valid_boxes(boxes):
+    """Máscara de cajas con área positiva"""
+    return (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+
+def encode_boxes(images, boxes_per_image):
+    """Embeddings CLIP de todas las cajas de todas las imágenes (los que están en cache no pasan por CLIP)"""
+    start = time.perf_counter()
+    prepared = [image_encoder.prepare(image) for image in images]
+    counts = [len(boxes) for boxes in boxes_per_image]
+    total = sum(counts)
+    if not total:
+        return np.empty((0, embedding_index.dimension), dtype=np.float32)
+    
+    embeddings = [None] * total
+    keys = None
+    if embedding_cache is not None:
+        # dHash de todas las cajas de cada imagen con un solo roi_align
+        keys = [key for image, boxes in zip(prepared, boxes_per_image)
+                for key in dhash_from_blocks(image_encoder.block_means(image, boxes, 16, 17))]
+        embeddings = [embedding_cache.get(key) for key in keys]
+    
+    misses = np.array([i for i, embedding in enumerate(embeddings) if embedding is None], dtype=int)
+    if len(misses):
+        # Recortes de todas las cajas nuevas directo al batch de CLIP, una sola pasada
+        image_ids = np.repeat(np.arange(len(images)), counts)
+        offsets = np.cumsum([0] + counts[:-1])
+        pixel_values = [
+            image_encoder.pixel_values(prepared[i], boxes_per_image[i][misses[image_ids[misses] == i] - offsets[i]])
+            for i in np.unique(image_ids[misses])
+        ]
+        STAGE_CROP.observe(time.perf_counter() - start)
+        with STAGE_CLIP.time():
+            encoded = image_encoder.encode(pixel_values)
+        for i, embedding in zip(misses, encoded):
+            if keys is not None:
+                embedding_cache.put(keys[i], embedding)
+            embeddings[i] = embedding
+    else:
+        STAGE_CROP.observe(time.perf_counter() - start)
+    
+    return np.stack(embeddings)
+
+def match_embeddings(embeddings):
+    """Producto más similar del índice para cada embedding (None si no hay ninguno)"""
+    # Índice y mapeo del mismo snapshot aunque el catálogo cambie en el medio
+    snapshot = catalog.snapshot
+    
+    # Buscar el producto más similar para todos los ROIs a la vez
+    with STAGE_SEARCH.time():
+        scores, similarities, product_ids = snapshot.index.search_scores(embeddings, k=1)
+    if not product_ids.shape[1]:
+        # Catálogo vacío (todos los productos borrados): ningún ROI tiene candidato
+        return [None] * len(embeddings)
+    
+    recognitions = []
+    for score, similarity, product_id in zip(scores[:, 0].tolist(), similarities[:, 0].tolist(), product_ids[:, 0]):
+        if product_id is None:
+            # Sin candidatos vivos para este ROI (índice aproximado con todo borrado cerca)
+            recognitions.append(None)
+            continue
+        recognitions.append({
+            'product_id': product_id,
+            # Coseno real; el puntaje (texto por TEXT_SIMILARITY_SCALE) es el que se compara con el umbral
+            'similarity': similarity,
+            'score': score,
+            'product_info': snapshot.product_mapping.get(product_id, {})
+        })
+    
+    return recognitions
+
+def recognize_images(images, deadlines=None):
+    """Pipeline completo para un batch de imágenes: un YOLO y un CLIP para todas.
+    
+    Devuelve, por imagen, la lista de detecciones con su 'recognition' (o None).
+    Las imágenes cuyo deadline venció antes de YOLO o de CLIP no siguen en el
+    pipeline y devuelven DeadlineExceeded en su lugar.
+    """
+    expired = [None] * len(images)
+    
+    def live(stage):
+        for i, deadline in enumerate(deadlines or ()):
+            if expired[i] is None and deadline is not None and deadline.expired:
+                expired[i] = DeadlineExceeded(stage)
+        return [i for i in range(len(images)) if expired[i] is None]
+    
+    batch_detections = [[] for _ in images]
+    pending_images = live('yolo')
+    if pending_images:
+        for i, detections in zip(pending_images, detect_products_yolo_batch([images[i] for i in pending_images])):
+            batch_detections[i] = detections
+    
+    boxes_per_image = [np.array([d['bbox'] for d in detections], dtype=np.float32).reshape(-1, 4)
+                       for detections in batch_detections]
+    valid_per_image = [valid_boxes(boxes) for boxes in boxes_per_image]
+    
+    for detections in batch_detections:
+        for detection in detections:
+            detection['recognition'] = None
+    
+    # Todas las cajas válidas de todas las imágenes en un solo batch de CLIP
+    pending_images = live('clip')
     try:
-        # Generar embedding con CLIP
-        embedding = clip_model.encode([roi])
-        
-        # Buscar producto más similar
-        distances, indices = nn_model.kneighbors(embedding)
-        
-        # Obtener información del producto
-        product_id = knowledge_base['product_ids'][indices[0][0]]
-        similarity = 1 - distances[0][0]  # Convertir distancia a similitud
-        
-        # Mapear a información del producto
-        product_info = product_mapping.get(product_id, {})
-        
+        embeddings = encode_boxes([images[i] for i in pending_images],
+                                  [boxes_per_image[i][valid_per_image[i]] for i in pending_images])
+        recognitions = match_embeddings(embeddings) if len(embeddings) else []
+    except Exception as e:
+        ERRORS.labels('clip').inc()
+        log.error('clip_error', "Error en reconocimiento CLIP", error=str(e))
+        recognitions = []
+    
+    pending = [detection for i in pending_images
+               for detection, ok in zip(batch_detections[i], valid_per_image[i]) if ok]
+    for detection, recognition in zip(pending, recognitions):
+        detection['recognition'] = recognition
+    
+    return [error or detections for error, detections in zip(expired, batch_detections)]
+
+def recognize_batched(items):
+    """process_batch del micro-batcher: items (imagen, deadline)"""
+    images, deadlines = zip(*items)
+    return recognize_images(list(images), list(deadlines))
+
+def get_batcher():
+    """Scheduler de micro-batching compartido por los hilos del proceso"""
+    global batcher
+    if batcher is None:
+        batcher = MicroBatcher(recognize_batched, max_batch_size=BATCH_MAX_SIZE,
+                               max_wait_ms=BATCH_MAX_WAIT_MS, max_queue_size=BATCH_MAX_QUEUE)
+    return batcher
+
+def models_ready():
+    """Indica si todos los modelos están cargados"""
+    return all([detector, image_encoder, knowledge_base, catalog])
+
+def health_payload():
+    """Cuerpo de la respuesta de /health"""
+    return {
+        'status': 'ok',
+        'message': 'SCANIX AI Service funcionando',
+        'models_loaded': models_ready(),
+        'ready': is_ready(),
+        'startup': startup_phases,
+        'backend': backend_status,
+        'quantization': quantization_status,
+        'products': list(product_mapping.keys()) if product_mapping else [],
+        'catalog': catalog.stats() if catalog else None,
+        'index': index_status,
+        'batching': {
+            'enabled': BATCH_MAX_WAIT_MS > 0,
+            'max_wait_ms': BATCH_MAX_WAIT_MS,
+            'max_batch_size': BATCH_MAX_SIZE,
+            'queue_depth': batcher.queue_depth if batcher else 0,
+            'batches': batcher.batches if batcher else 0,
+            'items': batcher.items if batcher else 0
+        },
+        'topology': cpu_topology.describe(),
+        'tiling': tiled_detector.stats() if tiled_detector else {'mode': 'off'},
+        'admission': {
+            'max_wait_ms': ADMISSION_MAX_WAIT_MS,
+            'default_deadline_ms': DEFAULT_DEADLINE_MS,
+            **admission.stats()
+        },
+        'embedding_cache': {'enabled': True, **embedding_cache.stats()} if embedding_cache else {'enabled': False},
+        'result_cache': {'enabled': True, **result_cache.stats()} if result_cache else {'enabled': False}
+    }
+
+def readiness_payload():
+    """Cuerpo y status del readiness probe (503 hasta terminar carga y warm-up)"""
+    ready = is_ready()
+    return {
+        'status': 'ready' if ready else 'starting',
+        'models_loaded': models_ready(),
+        'warmed_up': warmed_up,
+        'startup': startup_phases
+    }, 200 if ready else 503
+
+def recognition_payload(detections, scale=1.0):
+    """Cuerpo de la respuesta de /recognize a partir de las detecciones reconocidas.
+    
+    scale lleva las cajas a coordenadas de la imagen original si se decodificó reducida.
+    """
+    if not detections:
         return {
-            'product_id': product_id,
-            'similarity': float(similarity),
-            'product_info': product_info
+            'success': True,
+            'items': [],
+            'message': 'No se detectaron productos'
         }
-    except Exception as e:
-        print(f"❌ Error en reconocimiento CLIP: {e}")
-        return None
+    
+    recognized_items = []
+    below_threshold = 0
+    for i, detection in enumerate(detections):
+        recognition = detection['recognition']
+        if recognition and recognition['score'] > SIMILARITY_THRESHOLD:
+            # Mismos campos (y mismo fallback de precio) que en /products
+            product = product_entry(recognition['product_id'], recognition['product_info'])
+            
+            item = {
+                'id': f'detection_{i}',
+                'product_id': product['product_id'],
+                'sku': product['sku'],
+                'nombre': product['nombre'],
+                'descripcion': product['descripcion'],
+                'precio': product['precio'],
+                'confidence': detection['confidence'],
+                'similarity': recognition['similarity'],
+                'bbox': [int(round(v * scale)) for v in detection['bbox']] if scale != 1.0 else detection['bbox']
+            }
+            
+            recognized_items.append(item)
+        elif recognition:
+            below_threshold += 1
+    
+    RECOGNITIONS.inc(len(recognized_items))
+    BELOW_THRESHOLD.inc(below_threshold)
+    
+    return {
+        'success': True,
+        'items': recognized_items,
+        'detections': len(detections),
+        'recognized': len(recognized_items),
+        'message': f'Se reconocieron {len(recognized_items)} producto(s)'
+    }
+
+def products_response(args, if_none_match=None):
+    """(cuerpo JSON en bytes, status, headers) de /products.
+    
+    Parámetros: categoria, sku, offset y limit. El cuerpo sale ya serializado del
+    catálogo compilado; si If-None-Match trae su ETag se responde 304 sin cuerpo.
+    """
+    products = products_catalog
+    if products is None:
+        return dumps_json({
+            'success': False,
+            'error': 'Product mapping no cargado'
+        }), 500, {}
+    
+    headers = {'ETag': products.etag, 'Cache-Control': 'no-cache'}
+    if if_none_match and etag_matches(if_none_match, products.etag):
+        return b'', 304, headers
+    
+    try:
+        offset = int(args.get('offset', 0))
+        limit = int(args['limit']) if args.get('limit') else None
+        if offset < 0 or (limit is not None and not 1 <= limit <= PRODUCTS_MAX_LIMIT):
+            raise ValueError
+    except ValueError:
+        return dumps_json({
+            'success': False,
+            'error': f'offset debe ser >= 0 y limit entre 1 y {PRODUCTS_MAX_LIMIT}'
+        }), 400, {}
+    
+    body = products.products_body(category=args.get('categoria') or None, offset=offset, limit=limit,
+                                  sku=args.get('sku') or None)
+    return body, 200, headers
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match ('*' o lista de ETags, débiles o fuertes) contra el ETag actual"""
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
+
+def identify_boxes(image, boxes):
+    """(product_id, similarity, score) de cada caja de una imagen (CLIP + índice)"""
+    recognitions = match_embeddings(encode_boxes([image], [boxes]))
+    return [(r['product_id'], r['similarity'], r['score']) if r else (None, 0.0, 0.0) for r in recognitions]
+
+def stream_sessions_unavailable():
+    """(payload, status) si no se pueden abrir sesiones HTTP de streaming en este despliegue, si no None"""
+    if not models_ready():
+        return {
+            'success': False,
+            'error': 'Modelos no cargados'
+        }, 500
+    if cpu_topology.worker_count() > 1 and not STREAM_STICKY:
+        # Los frames siguientes caerían en otros workers, sin el tracker de la sesión
+        return {
+            'success': False,
+            'error': ('Las sesiones de streaming HTTP necesitan afinidad por sesión con varios workers '
+                      '(SCANIX_STREAM_STICKY=1); usar el WebSocket /stream o un solo worker')
+        }, 501
+    return None
+
+def create_stream_session():
+    """Nueva sesión de streaming, o None si ya hay STREAM_MAX_SESSIONS abiertas"""
+    tracker = ByteTracker(high_threshold=CONFIDENCE_THRESHOLD, low_threshold=TRACK_LOW_CONFIDENCE,
+                          max_lost=TRACK_MAX_LOST, min_hits=TRACK_MIN_HITS)
+    session = StreamSession(identify_boxes, similarity_threshold=SIMILARITY_THRESHOLD, margin=TRACK_MARGIN,
+                            recheck_interval=TRACK_RECHECK_FRAMES, max_checks=TRACK_MAX_CHECKS, tracker=tracker)
+    return stream_sessions.add(session)
+
+def basket_payload(session):
+    """Productos y cantidades de la canasta de una sesión"""
+    return [{
+        'product_id': product_id,
+        'sku': product_mapping.get(product_id, {}).get('sku', ''),
+        'nombre': product_mapping.get(product_id, {}).get('nombre', ''),
+        'quantity': quantity
+    } for product_id, quantity in sorted(session.basket.items())]
+
+def stream_frame_data(session, image_data, deadline=None):
+    """Decodificar un frame, trackear y emitir los eventos de la canasta; devuelve (payload, status)"""
+    deadline = deadline or Deadline()
+    try:
+        started = admission.acquire('interactive', deadline)
+    except (Overloaded, DeadlineExceeded) as e:
+        return rejection_payload(e, 'interactive')
+    try:
+        return track_frame(session, image_data, deadline)
+    except DeadlineExceeded as e:
+        return rejection_payload(e, 'interactive')
+    finally:
+        admission.release(started)
+
+def track_frame(session, image_data, deadline):
+    """stream_frame_data ya admitido"""
+    deadline.check('decode')
+    try:
+        decoded = preprocess_image(image_data)
+    except ImageTooLargeError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 413
+    
+    if decoded is None:
+        return {
+            'success': False,
+            'error': 'Error procesando imagen'
+        }, 400
+    image = decoded.array
+    
+    # YOLO con umbral bajo: las detecciones dudosas solo sirven para continuar tracks
+    deadline.check('yolo')
+    with STAGE_YOLO.time():
+        boxes, scores = detector.detect([image], conf=min(TRACK_LOW_CONFIDENCE, CONFIDENCE_THRESHOLD))[0]
+    valid = valid_boxes(boxes)
+    
+    with session.lock:
+        tracks, events, identified = session.process(boxes[valid], scores[valid], image)
+        frame = session.frames
+        basket = basket_payload(session)
+        tracks = [{
+            'track_id': track.id,
+            'bbox': [int(round(v * decoded.scale)) for v in track.box.tolist()],
+            'confidence': track.score,
+            'product_id': track.product_id,
+            'similarity': track.similarity
+        } for track in tracks if track.confirmed and not track.lost]
+    
+    STREAM_FRAMES.inc()
+    STREAM_IDENTIFIED.inc(identified)
+    for event in events:
+        info = product_mapping.get(event['product_id'], {})
+        event.update(sku=info.get('sku', ''), nombre=info.get('nombre', ''))
+    
+    return {
+        'success': True,
+        'session_id': session.id,
+        'frame': frame,
+        'events': events,
+        'basket': basket,
+        'tracks': tracks,
+        'identified': identified
+    }, 200
+
+def decode_bulk_item(image_data):
+    """Decodificar una imagen de un lote (los errores quedan en su línea NDJSON)"""
+    try:
+        decoded = preprocess_image(image_data, RECOGNIZE_DECODE_SIZE)
+    except ImageTooLargeError as e:
+        raise BulkItemError(413, str(e))
+    if decoded is None:
+        raise BulkItemError(400, 'Error procesando imagen')
+    return decoded
+
+def recognize_bulk_batch(decoded_images):
+    """Un YOLO y un CLIP para todo el lote; payload de /recognize por imagen.
+    
+    Cada lote espera su turno con prioridad batch: cede el lugar a los
+    requests interactivos pero no se descarta (el trabajo ya fue aceptado).
+    """
+    try:
+        started = admission.acquire('batch', shed=False)
+    except (Overloaded, DeadlineExceeded) as e:
+        payload, status = rejection_payload(e, 'batch')
+        raise BulkItemError(status, payload.pop('error'),
+                            **{key: value for key, value in payload.items() if key != 'success'})
+    try:
+        batch_detections = recognize_images([decoded.array for decoded in decoded_images])
+    finally:
+        admission.release(started, observe=False)
+    return [recognition_payload(detections, decoded.scale)
+            for detections, decoded in zip(batch_detections, decoded_images)]
+
+def recognize_bulk_items(items, batch_size=None):
+    """Resultados (uno por imagen, en orden) para un iterable de (nombre, bytes)"""
+    return recognize_bulk(items, decode_bulk_item, recognize_bulk_batch,
+                          batch_size=batch_size or BULK_BATCH_SIZE, decode_workers=BULK_DECODE_THREADS)
+
+def ndjson_line(result):
+    """Una línea NDJSON compacta (mismo encoder que jsonify)"""
+    return app.json.dumps(result, separators=(',', ':')) + '\n'
+
+def request_deadline(headers):
+    """Deadline del request: X-Scanix-Deadline-Ms (milisegundos que el cliente espera) o el default"""
+    return Deadline.from_header(headers.get(DEADLINE_HEADER), DEFAULT_DEADLINE_MS)
+
+def request_priority(headers, default='interactive'):
+    """Clase de prioridad del request (X-Scanix-Priority)"""
+    priority = (headers.get(PRIORITY_HEADER) or default).strip().lower()
+    return priority if priority in PRIORITIES else default
+
+def rejection_payload(error, priority):
+    """(payload, status) de un request sin lugar en la cola (503) o con el deadline vencido (504)"""
+    if isinstance(error, Overloaded):
+        REJECTED.labels(priority).inc()
+        return {
+            'success': False,
+            'error': str(error),
+            'retry_after': error.retry_after
+        }, 503
+    DEADLINE_EXPIRED.labels(error.stage).inc()
+    return {
+        'success': False,
+        'error': str(error),
+        'stage': error.stage
+    }, 504
+
+def shareable_result(result):
+    """Si un (payload, status) sirve a los requests coalescidos con el que lo calculó.
+    
+    Los 503/504 del control de admisión dependen de la cola y del deadline de
+    ese request: los coalescidos (quizás con más margen) reintentan por su cuenta.
+    """
+    return result[1] not in (503, 504)
+
+def retry_after_headers(payload):
+    """Header Retry-After para las respuestas 503 del control de admisión"""
+    if 'retry_after' in payload:
+        return {'Retry-After': str(payload['retry_after'])}
+    return {}
+
+def recognize_image_data(image_data, deadline=None, priority='interactive'):
+    """Admitir, decodificar y reconocer una imagen; devuelve (payload, status)"""
+    deadline = deadline or Deadline()
+    try:
+        started = admission.acquire(priority, deadline)
+    except (Overloaded, DeadlineExceeded) as e:
+        return rejection_payload(e, priority)
+    try:
+        return recognize_admitted(image_data, deadline)
+    except DeadlineExceeded as e:
+        return rejection_payload(e, priority)
+    finally:
+        admission.release(started)
+
+def recognize_admitted(image_data, deadline):
+    """recognize_image_data ya admitido; el trabajo vencido se corta antes de cada etapa"""
+    deadline.check('decode')
+    try:
+        decoded = preprocess_image(image_data, RECOGNIZE_DECODE_SIZE)
+    except ImageTooLargeError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 413
+    
+    if decoded is None:
+        return {
+            'success': False,
+            'error': 'Error procesando imagen'
+        }, 400
+    image = decoded.array
+    
+    # Detectar y reconocer productos (agrupado con otros requests si hay micro-batching)
+    if BATCH_MAX_WAIT_MS > 0:
+        try:
+            detections = get_batcher().run((image, deadline))
+        except QueueFullError as e:
+            ERRORS.labels('queue_full').inc()
+            return {
+                'success': False,
+                'error': str(e)
+            }, 503
+    else:
+        detections = recognize_images([image], [deadline])[0]
+        if isinstance(detections, DeadlineExceeded):
+            raise detections
+    
+    return recognition_payload(detections, decoded.scale), 200
+
+def admin_error(headers):
+    """(payload, status) si el request no puede usar /admin/*, o None.
+    
+    El token va en 'Authorization: Bearer <token>' o en 'X-Scanix-Admin-Token'.
+    """
+    if not ADMIN_TOKEN:
+        return {
+            'success': False,
+            'error': 'API de administración deshabilitada (configurar SCANIX_ADMIN_TOKEN)'
+        }, 403
+    
+    token = headers.get('X-Scanix-Admin-Token', '')
+    authorization = headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return {
+            'success': False,
+            'error': 'Token de administración inválido'
+        }, 401
+    
+    if catalog is None:
+        return {
+            'success': False,
+            'error': 'Modelos no cargados'
+        }, 500
+    return None
+
+def parse_admin_fields(info, replace):
+    """Datos del producto (JSON o texto JSON de un campo multipart) y flag de reemplazo"""
+    if isinstance(info, str):
+        try:
+            info = json.loads(info) if info.strip() else None
+        except ValueError:
+            raise CatalogError("El campo 'info' no es JSON válido")
+    if info is not None and not isinstance(info, dict):
+        raise CatalogError("El campo 'info' debe ser un objeto")
+    if isinstance(replace, str):
+        replace = replace.strip().lower() in ('1', 'true', 'yes', 'si')
+    return info, bool(replace)
+
+def encode_sample_images(images_data):
+    """Embeddings CLIP de fotos de muestra de un producto (la imagen completa, sin YOLO)"""
+    pixel_values = []
+    for image_data in images_data:
+        decoded = preprocess_image(image_data)
+        if decoded is None:
+            raise CatalogError('Error procesando imagen de muestra')
+        height, width = decoded.array.shape[:2]
+        box = np.array([[0, 0, width, height]], dtype=np.float32)
+        pixel_values.append(image_encoder.pixel_values(image_encoder.prepare(decoded.array), box))
+    
+    with STAGE_CLIP.time():
+        return image_encoder.encode(pixel_values)
+
+def upsert_product_data(product_id, info=None, embeddings=None, images_data=(), replace=False):
+    """Crear o actualizar un producto del catálogo en caliente; devuelve (payload, status)"""
+    try:
+        info, replace = parse_admin_fields(info, replace)
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        if images_data:
+            encoded = encode_sample_images(images_data)
+            embeddings = encoded if embeddings is None else np.concatenate([embeddings.reshape(-1, encoded.shape[1]), encoded])
+        snapshot = catalog.upsert(product_id, info, embeddings, replace=replace)
+    except ImageTooLargeError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 413
+    except (CatalogError, ValueError) as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 400
+    
+    return {
+        'success': True,
+        'product_id': product_id,
+        'product': snapshot.product_mapping[product_id],
+        'catalog': catalog.stats()
+    }, 200
+
+def remove_product_data(product_id):
+    """Borrar un producto del catálogo en caliente; devuelve (payload, status)"""
+    try:
+        catalog.remove(product_id)
+    except CatalogError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 404
+    return {
+        'success': True,
+        'product_id': product_id,
+        'catalog': catalog.stats()
+    }, 200
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """Upload mayor que MAX_CONTENT_LENGTH (o SCANIX_BULK_MAX_UPLOAD_MB en /recognize/batch)"""
+    ERRORS.labels('too_large').inc()
+    return jsonify({
+        'success': False,
+        'error': e.description
+    }), 413
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check del servicio"""
-    return jsonify({
-        'status': 'ok',
-        'message': 'SCANIX AI Service funcionando',
-        'models_loaded': all([yolo_model, clip_model, knowledge_base, nn_model]),
-        'products': list(product_mapping.keys()) if product_mapping else []
-    })
+    return jsonify(health_payload())
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: el proceso responde (no toca los modelos)"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: modelos cargados y con warm-up"""
+    payload, status = readiness_payload()
+    return jsonify(payload), status
+
+def metrics_body():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    return REGISTRY.render().encode('utf-8')
+
+def serialize(payload):
+    """Cuerpo JSON de la respuesta (medido como etapa 'serialize')"""
+    with STAGE_SERIALIZE.time():
+        return app.json.response(payload)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas para Prometheus"""
+    return app.response_class(metrics_body(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route('/recognize', methods=['POST'])
 def recognize():
     """Reconocer productos en imagen"""
+    IN_FLIGHT.inc()
     try:
-        if not all([yolo_model, clip_model, knowledge_base, nn_model]):
+        if not models_ready():
             return jsonify({
                 'success': False,
                 'error': 'Modelos no cargados'
@@ -178,93 +1298,223 @@ def recognize():
         
         # Leer imagen
         image_data = file.read()
-        image = preprocess_image(image_data)
-        
-        if image is None:
-            return jsonify({
-                'success': False,
-                'error': 'Error procesando imagen'
-            }), 400
         
-        # Detectar productos con YOLO
-        detections = detect_products_yolo(image)
+        deadline = request_deadline(request.headers)
+        priority = request_priority(request.headers)
         
-        if not detections:
-            return jsonify({
-                'success': True,
-                'items': [],
-                'message': 'No se detectaron productos'
-            })
-        
-        # Reconocer cada producto
-        recognized_items = []
-        for i, detection in enumerate(detections):
-            roi = detection['roi']
-            
-            # Reconocer con CLIP
-            recognition = recognize_product_clip(roi)
-            
-            if recognition and recognition['similarity'] > 0.7:  # Umbral de similitud
-                product_info = recognition['product_info']
-                
-                item = {
-                    'id': f'detection_{i}',
-                    'product_id': recognition['product_id'],
-                    'sku': product_info.get('sku', ''),
-                    'nombre': product_info.get('nombre', ''),
-                    'descripcion': product_info.get('descripcion', ''),
-                    'precio': product_info.get('precio', 0),
-                    'confidence': detection['confidence'],
-                    'similarity': recognition['similarity'],
-                    'bbox': detection['bbox']
-                }
-                
-                recognized_items.append(item)
+        # Reintentos y duplicados: misma imagen + mismos modelos -> misma respuesta
+        if result_cache is None:
+            (payload, status), cache_hit = recognize_image_data(image_data, deadline, priority), False
+        else:
+            try:
+                (payload, status), cache_hit = result_cache.get_or_compute(
+                    content_key(image_data, model_version),
+                    lambda: recognize_image_data(image_data, deadline, priority),
+                    cacheable=lambda result: result[1] == 200,
+                    shareable=shareable_result,
+                    timeout=deadline.remaining()
+                )
+            except TimeoutError:
+                # Coalescido con otro request: se le venció su propio deadline esperando
+                (payload, status), cache_hit = rejection_payload(DeadlineExceeded('cache'), priority), False
         
-        return jsonify({
-            'success': True,
-            'items': recognized_items,
-            'detections': len(detections),
-            'recognized': len(recognized_items),
-            'message': f'Se reconocieron {len(recognized_items)} producto(s)'
-        })
+        if status == 200:
+            payload = {**payload, 'cache_hit': cache_hit}
+        return serialize(payload), status, retry_after_headers(payload)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error en reconocimiento: {e}")
+        ERRORS.labels('internal').inc()
+        log.error('recognize_error', "Error en reconocimiento", error=str(e))
         return jsonify({
             'success': False,
             'error': f'Error interno: {str(e)}'
         }), 500
+    finally:
+        IN_FLIGHT.dec()
 
-@app.route('/products', methods=['GET'])
-def get_products():
-    """Obtener lista de productos disponibles"""
-    if not product_mapping:
+def spool_bulk_request():
+    """Imágenes del request (archivos multipart, tar/zip subidos o un tar/zip crudo) fuera del request"""
+    uploads = UploadSpool()
+    if request.files:
+        for field in request.files:
+            for file in request.files.getlist(field):
+                uploads.add(file.filename or field, file.stream)
+    elif request.content_length:
+        uploads.add('body', request.stream, archive=True)
+    return uploads
+
+@app.route('/recognize/batch', methods=['POST'])
+def recognize_batch():
+    """Reconocer muchas imágenes; una línea NDJSON por imagen a medida que terminan"""
+    if not models_ready():
         return jsonify({
             'success': False,
-            'error': 'Product mapping no cargado'
+            'error': 'Modelos no cargados'
         }), 500
     
-    products = []
-    for product_id, info in product_mapping.items():
-        products.append({
-            'product_id': product_id,
-            'sku': info.get('sku', ''),
-            'nombre': info.get('nombre', ''),
-            'descripcion': info.get('descripcion', ''),
-            'precio': info.get('precio', 0)
-        })
+    # Con la cola saturada se rechaza antes de recibir las imágenes
+    try:
+        admission.check('batch')
+    except Overloaded as e:
+        payload, status = rejection_payload(e, 'batch')
+        return jsonify(payload), status, retry_after_headers(payload)
+    
+    # Los archivos del request se cierran antes de terminar de enviar la respuesta
+    uploads = spool_bulk_request()
+    if not len(uploads):
+        uploads.close()
+        return jsonify({
+            'success': False,
+            'error': 'No se proporcionaron imágenes'
+        }), 400
+    
+    def generate():
+        for result in recognize_bulk_items(uploads.items()):
+            yield ndjson_line(result)
     
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+@app.route('/stream/sessions', methods=['POST'])
+def open_stream_session():
+    """Abrir una sesión de streaming (una por cámara)"""
+    unavailable = stream_sessions_unavailable()
+    if unavailable is not None:
+        payload, status = unavailable
+        return jsonify(payload), status
+    
+    session = create_stream_session()
+    if session is None:
+        return jsonify({
+            'success': False,
+            'error': 'Demasiadas sesiones de streaming abiertas'
+        }), 503
+    return jsonify({
+        'success': True,
+        'session_id': session.id
+    }), 201
+
+@app.route('/stream/sessions/<session_id>/frames', methods=['POST'])
+def stream_frame(session_id):
+    """Procesar el siguiente frame de una sesión y devolver los eventos de la canasta"""
+    try:
+        session = stream_sessions.get(session_id)
+        if session is None:
+            return jsonify({
+                'success': False,
+                'error': 'Sesión inexistente o expirada'
+            }), 404
+        
+        if 'image' not in request.files:
+            return jsonify({
+                'success': False,
+                'error': 'No se proporcionó imagen'
+            }), 400
+        
+        payload, status = stream_frame_data(session, request.files['image'].read(), request_deadline(request.headers))
+        return serialize(payload), status, retry_after_headers(payload)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        ERRORS.labels('internal').inc()
+        log.error('stream_error', "Error en streaming", error=str(e))
+        return jsonify({
+            'success': False,
+            'error': f'Error interno: {str(e)}'
+        }), 500
+
+@app.route('/stream/sessions/<session_id>', methods=['DELETE'])
+def close_stream_session(session_id):
+    """Cerrar una sesión y devolver la canasta final"""
+    session = stream_sessions.remove(session_id)
+    if session is None:
+        return jsonify({
+            'success': False,
+            'error': 'Sesión inexistente o expirada'
+        }), 404
     return jsonify({
         'success': True,
-        'products': products
+        'session_id': session.id,
+        'frames': session.frames,
+        'basket': basket_payload(session)
     })
 
+@app.route('/products', methods=['GET'])
+def get_products():
+    """Obtener lista de productos disponibles (filtro por categoría o SKU, paginación, ETag)"""
+    body, status, headers = products_response(request.args, request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers, mimetype='application/json')
+
+@app.route('/admin/catalog', methods=['GET'])
+def admin_catalog():
+    """Estado del catálogo vivo (versión, filas pendientes de compactar, tombstones)"""
+    error = admin_error(request.headers)
+    if error:
+        return jsonify(error[0]), error[1]
+    return jsonify({
+        'success': True,
+        'catalog': catalog.stats()
+    })
+
+@app.route('/admin/catalog/compact', methods=['POST'])
+def admin_compact_catalog():
+    """Compactar el índice ahora (las búsquedas siguen con el snapshot anterior)"""
+    error = admin_error(request.headers)
+    if error:
+        return jsonify(error[0]), error[1]
+    catalog.compact()
+    return jsonify({
+        'success': True,
+        'catalog': catalog.stats()
+    })
+
+@app.route('/admin/products/<product_id>', methods=['PUT'])
+def admin_upsert_product(product_id):
+    """Crear o actualizar un producto: datos en 'info' y muestras como fotos ('images') o 'embeddings'"""
+    error = admin_error(request.headers)
+    if error:
+        return jsonify(error[0]), error[1]
+    
+    try:
+        if request.is_json:
+            body = request.get_json(silent=True)
+            body = body if isinstance(body, dict) else {}
+            payload, status = upsert_product_data(product_id, body.get('info'), body.get('embeddings'),
+                                                  replace=body.get('replace', False))
+        else:
+            images_data = [file.read() for file in request.files.getlist('images')]
+            payload, status = upsert_product_data(product_id, request.form.get('info'), images_data=images_data,
+                                                  replace=request.form.get('replace', False))
+        return jsonify(payload), status
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        ERRORS.labels('internal').inc()
+        log.error('catalog_error', "Error actualizando el catálogo", error=str(e))
+        return jsonify({
+            'success': False,
+            'error': f'Error interno: {str(e)}'
+        }), 500
+
+@app.route('/admin/products/<product_id>', methods=['DELETE'])
+def admin_remove_product(product_id):
+    """Borrar un producto del catálogo"""
+    error = admin_error(request.headers)
+    if error:
+        return jsonify(error[0]), error[1]
+    payload, status = remove_product_data(product_id)
+    return jsonify(payload), status
+
 if __name__ == '__main__':
     print("🚀 Iniciando SCANIX AI Service...")
     
     # Verificar archivos
-    required_files = [MODEL_PATH, KNOWLEDGE_BASE_PATH, PRODUCT_MAPPING_PATH]
+    required_files = [MODEL_PATH]
+    if not os.path.exists(KB_BUNDLE_PATH):
+        required_files += [KNOWLEDGE_BASE_PATH, PRODUCT_MAPPING_PATH]
     missing_files = [f for f in required_files if not os.path.exists(f)]
     
     if missing_files:
@@ -276,6 +1526,7 @@ if __name__ == '__main__':
     if not load_models():
         print("❌ Error cargando modelos")
         exit(1)
+    start_catalog_sync()
     
     print("🌐 Servidor iniciando en http://localhost:5001")
     app.run(host='0.0.0.0', port=5001, debug=True)
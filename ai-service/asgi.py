@@ -0,0 +1,557 @@
+"""
+Variante asíncrona (ASGI) de SCANIX AI Service
+
+Mismo contrato que app.py (/health, /recognize, /stream, /products, /admin) y mismos bytes de
+respuesta (se serializa con el JSON provider de Flask), pero los uploads se
+reciben sin bloquear el event loop: el decode corre en un pool de hilos y la
+inferencia en un executor dedicado con concurrencia acotada, así las
+conexiones lentas o inactivas no ocupan capacidad de inferencia. La espera
+en la cola de admisión (ver admission.py) también ocurre en el event loop,
+sin ocupar hilos.
+
+Además de las rutas HTTP de streaming, /stream acepta un WebSocket: cada
+mensaje binario es un frame (JPEG/PNG) y por cada uno se responde un JSON
+con los eventos de la canasta; al cerrar se envía la canasta final.
+
+Uso:
+    cd ai-service
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+"""
+
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import app as service
+from bulk import SPOOL_BYTES, UploadSpool
+from result_cache import RETRY
+
+# Configuración
+DECODE_THREADS = int(os.environ.get('SCANIX_DECODE_THREADS', os.cpu_count() or 1))
+INFERENCE_CONCURRENCY = int(os.environ.get('SCANIX_INFERENCE_CONCURRENCY', 1))
+
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix='scanix-decode')
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_CONCURRENCY, thread_name_prefix='scanix-inference')
+
+
+def json_response(payload, status=200):
+    """Respuesta JSON idéntica byte a byte a la de jsonify en app.py"""
+    body = service.app.json.response(payload).get_data()
+    return Response(body, status_code=status, media_type='application/json')
+
+
+def json_body(payload):
+    """Texto JSON (para mensajes de WebSocket), igual al de json_response"""
+    return service.app.json.response(payload).get_data(as_text=True)
+
+
+def serialized_response(payload, status=200):
+    """Como json_response, midiendo la serialización en la etapa 'serialize'"""
+    body = service.serialize(payload).get_data()
+    return Response(body, status_code=status, headers=service.retry_after_headers(payload),
+                    media_type='application/json')
+
+
+async def run_recognition(image, deadline):
+    """Detectar y reconocer sin bloquear el event loop"""
+    if service.BATCH_MAX_WAIT_MS > 0:
+        return await asyncio.wrap_future(service.get_batcher().submit((image, deadline)))
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(inference_executor, service.recognize_images, [image], [deadline])
+    if isinstance(results[0], service.DeadlineExceeded):
+        raise results[0]
+    return results[0]
+
+
+async def admitted(priority, deadline, work):
+    """Esperar lugar en la cola de admisión sin bloquear el event loop y correr work();
+    devuelve (payload, status), con 503/504 si no hubo lugar o venció el deadline"""
+    try:
+        started = await service.admission.acquire_async(priority, deadline)
+    except (service.Overloaded, service.DeadlineExceeded) as e:
+        return service.rejection_payload(e, priority)
+    try:
+        return await work()
+    except service.DeadlineExceeded as e:
+        return service.rejection_payload(e, priority)
+    finally:
+        service.admission.release(started)
+
+
+async def recognize_image_data(image_data, deadline, priority='interactive'):
+    """Admitir, decodificar (pool de hilos) y reconocer una imagen; devuelve (payload, status)"""
+    return await admitted(priority, deadline, lambda: recognize_admitted(image_data, deadline))
+
+
+async def recognize_admitted(image_data, deadline):
+    """recognize_image_data ya admitido (el trabajo vencido se corta antes de cada etapa)"""
+    loop = asyncio.get_running_loop()
+    deadline.check('decode')
+    try:
+        decoded = await loop.run_in_executor(decode_executor, service.preprocess_image, image_data,
+                                             service.RECOGNIZE_DECODE_SIZE)
+    except service.ImageTooLargeError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }, 413
+
+    if decoded is None:
+        return {
+            'success': False,
+            'error': 'Error procesando imagen'
+        }, 400
+
+    try:
+        detections = await run_recognition(decoded.array, deadline)
+    except service.QueueFullError as e:
+        service.ERRORS.labels('queue_full').inc()
+        return {
+            'success': False,
+            'error': str(e)
+        }, 503
+
+    return service.recognition_payload(detections, decoded.scale), 200
+
+
+async def cached_recognition(image_data, deadline, priority):
+    """Como ResultCache.get_or_compute, pero esperando sin bloquear el event loop"""
+    cache = service.result_cache
+    if cache is None:
+        return await recognize_image_data(image_data, deadline, priority), False
+
+    loop = asyncio.get_running_loop()
+    key = await loop.run_in_executor(decode_executor, service.content_key, image_data, service.model_version)
+    while True:
+        result = cache.lookup(key)
+        if result is not None:
+            return result, True
+
+        future, leader = cache.begin(key)
+        if not leader:
+            try:
+                # shield: si vence el deadline propio, el cálculo del líder sigue para los demás
+                result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), deadline.remaining())
+            except TimeoutError:
+                return service.rejection_payload(service.DeadlineExceeded('cache'), priority), False
+            if result is RETRY:
+                # El líder fue rechazado o se le venció el deadline: reintentar por cuenta propia
+                continue
+            return result, True
+
+        try:
+            result = await recognize_image_data(image_data, deadline, priority)
+        except Exception as e:
+            cache.fail(key, e)
+            raise
+        if not service.shareable_result(result):
+            cache.abandon(key)
+        else:
+            cache.finish(key, result, result[1] == 200)
+        return result, False
+
+
+async def health(request):
+    """Health check del servicio"""
+    return json_response(service.health_payload())
+
+
+async def liveness(request):
+    """Liveness probe: el proceso responde (no toca los modelos)"""
+    return json_response({'status': 'ok'})
+
+
+async def readiness(request):
+    """Readiness probe: modelos cargados y con warm-up"""
+    payload, status = service.readiness_payload()
+    return json_response(payload, status)
+
+
+async def metrics(request):
+    """Métricas para Prometheus"""
+    return Response(service.metrics_body(), headers={'content-type': service.METRICS_CONTENT_TYPE})
+
+
+async def recognize(request):
+    """Reconocer productos en imagen"""
+    service.IN_FLIGHT.inc()
+    try:
+        if not service.models_ready():
+            return json_response({
+                'success': False,
+                'error': 'Modelos no cargados'
+            }, 500)
+
+        # Obtener imagen (el multipart se recibe de forma asíncrona)
+        form = await request.form()
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            return json_response({
+                'success': False,
+                'error': 'No se proporcionó imagen'
+            }, 400)
+
+        if file.filename == '':
+            return json_response({
+                'success': False,
+                'error': 'Archivo vacío'
+            }, 400)
+
+        image_data = await file.read()
+        (payload, status), cache_hit = await cached_recognition(image_data, service.request_deadline(request.headers),
+                                                                service.request_priority(request.headers))
+
+        if status == 200:
+            payload = {**payload, 'cache_hit': cache_hit}
+        return serialized_response(payload, status)
+
+    except Exception as e:
+        service.ERRORS.labels('internal').inc()
+        service.log.error('recognize_error', "Error en reconocimiento", error=str(e))
+        return json_response({
+            'success': False,
+            'error': f'Error interno: {str(e)}'
+        }, 500)
+    finally:
+        service.IN_FLIGHT.dec()
+
+
+class UploadTooLarge(Exception):
+    """El body del request pasó el límite de bytes"""
+
+
+def limited_request(request, limit):
+    """El mismo request, pero leer más de `limit` bytes de body corta con UploadTooLarge.
+
+    Cuenta lo recibido (no solo el Content-Length), así también se cortan
+    los uploads chunked sin largo declarado.
+    """
+    received = 0
+
+    async def receive():
+        nonlocal received
+        message = await request.receive()
+        if message['type'] == 'http.request':
+            received += len(message.get('body', b''))
+            if received > limit:
+                raise UploadTooLarge()
+        return message
+
+    return Request(request.scope, receive)
+
+
+def upload_too_large(limit):
+    """413 como el de MAX_CONTENT_LENGTH en app.py"""
+    service.ERRORS.labels('too_large').inc()
+    return json_response({
+        'success': False,
+        'error': f'El request supera el máximo de {limit // (1024 * 1024)} MB'
+    }, 413)
+
+
+def spool_uploads(files):
+    uploads = UploadSpool()
+    for file in files:
+        file.file.seek(0)
+        uploads.add(file.filename or 'image', file.file)
+    return uploads
+
+
+async def recognize_batch(request):
+    """Reconocer muchas imágenes; una línea NDJSON por imagen a medida que terminan"""
+    if not service.models_ready():
+        return json_response({
+            'success': False,
+            'error': 'Modelos no cargados'
+        }, 500)
+
+    # Con la cola saturada se rechaza antes de recibir las imágenes
+    try:
+        service.admission.check('batch')
+    except service.Overloaded as e:
+        return serialized_response(*service.rejection_payload(e, 'batch'))
+
+    # Mismos límites que /recognize/batch en app.py (SCANIX_BULK_MAX_UPLOAD_MB y SCANIX_BULK_MAX_FILES)
+    limit = service.BULK_MAX_UPLOAD_BYTES
+    if int(request.headers.get('content-length') or 0) > limit:
+        return upload_too_large(limit)
+    request = limited_request(request, limit)
+
+    loop = asyncio.get_running_loop()
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        try:
+            form = await request.form(max_files=service.BULK_MAX_FILES, max_part_size=service.MAX_UPLOAD_BYTES)
+        except UploadTooLarge:
+            return upload_too_large(limit)
+        except HTTPException as e:
+            # Multipart inválido o con más de SCANIX_BULK_MAX_FILES archivos
+            return json_response({
+                'success': False,
+                'error': e.detail
+            }, e.status_code)
+        files = [value for _, value in form.multi_items() if not isinstance(value, str)]
+        uploads = await loop.run_in_executor(decode_executor, spool_uploads, files)
+    else:
+        # tar/zip crudo: se vuelca a un archivo temporal sin bloquear el event loop
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        try:
+            async for chunk in request.stream():
+                body.write(chunk)
+        except UploadTooLarge:
+            body.close()
+            return upload_too_large(limit)
+        uploads = UploadSpool()
+        if body.tell():
+            body.seek(0)
+            uploads.add('body', body, archive=True)
+
+    if not len(uploads):
+        uploads.close()
+        return json_response({
+            'success': False,
+            'error': 'No se proporcionaron imágenes'
+        }, 400)
+
+    def generate():
+        # Starlette itera los generadores síncronos en su threadpool
+        for result in service.recognize_bulk_items(uploads.items()):
+            yield service.ndjson_line(result)
+
+    return StreamingResponse(generate(), media_type=service.NDJSON_MIMETYPE)
+
+
+async def open_stream_session(request):
+    """Abrir una sesión de streaming (una por cámara)"""
+    unavailable = service.stream_sessions_unavailable()
+    if unavailable is not None:
+        return json_response(*unavailable)
+
+    session = service.create_stream_session()
+    if session is None:
+        return json_response({
+            'success': False,
+            'error': 'Demasiadas sesiones de streaming abiertas'
+        }, 503)
+    return json_response({
+        'success': True,
+        'session_id': session.id
+    }, 201)
+
+
+async def stream_frame(request):
+    """Procesar el siguiente frame de una sesión y devolver los eventos de la canasta"""
+    try:
+        session = service.stream_sessions.get(request.path_params['session_id'])
+        if session is None:
+            return json_response({
+                'success': False,
+                'error': 'Sesión inexistente o expirada'
+            }, 404)
+
+        form = await request.form()
+        file = form.get('image')
+        if file is None or isinstance(file, str):
+            return json_response({
+                'success': False,
+                'error': 'No se proporcionó imagen'
+            }, 400)
+
+        payload, status = await stream_frame_data(session, await file.read(), service.request_deadline(request.headers))
+        return serialized_response(payload, status)
+
+    except Exception as e:
+        service.ERRORS.labels('internal').inc()
+        service.log.error('stream_error', "Error en streaming", error=str(e))
+        return json_response({
+            'success': False,
+            'error': f'Error interno: {str(e)}'
+        }, 500)
+
+
+async def stream_frame_data(session, image_data, deadline):
+    """Como service.stream_frame_data, admitiendo en el event loop y trackeando en el executor"""
+    loop = asyncio.get_running_loop()
+    return await admitted('interactive', deadline, lambda: loop.run_in_executor(
+        inference_executor, service.track_frame, session, image_data, deadline))
+
+
+async def close_stream_session(request):
+    """Cerrar una sesión y devolver la canasta final"""
+    session = service.stream_sessions.remove(request.path_params['session_id'])
+    if session is None:
+        return json_response({
+            'success': False,
+            'error': 'Sesión inexistente o expirada'
+        }, 404)
+    return json_response({
+        'success': True,
+        'session_id': session.id,
+        'frames': session.frames,
+        'basket': service.basket_payload(session)
+    })
+
+
+async def stream_websocket(websocket):
+    """Streaming por WebSocket: un frame binario por mensaje, un JSON de eventos por frame"""
+    await websocket.accept()
+    session = service.create_stream_session() if service.models_ready() else None
+    if session is None:
+        await websocket.send_text(json_body({
+            'success': False,
+            'error': 'Modelos no cargados' if not service.models_ready() else 'Demasiadas sesiones de streaming abiertas'
+        }))
+        await websocket.close(code=1013)
+        return
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('bytes') is None:
+                # Mensaje de texto: 'close' termina la sesión, el resto se ignora
+                if (message.get('text') or '').strip() == 'close':
+                    break
+                continue
+            payload, _ = await stream_frame_data(session, message['bytes'],
+                                                 service.request_deadline(websocket.headers))
+            await websocket.send_text(service.serialize(payload).get_data(as_text=True))
+
+        await websocket.send_text(json_body({
+            'success': True,
+            'session_id': session.id,
+            'frames': session.frames,
+            'basket': service.basket_payload(session),
+            'closed': True
+        }))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        service.stream_sessions.remove(session.id)
+
+
+async def get_products(request):
+    """Obtener lista de productos disponibles (filtro por categoría o SKU, paginación, ETag)"""
+    body, status, headers = service.products_response(request.query_params, request.headers.get('if-none-match'))
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+async def admin_catalog(request):
+    """Estado del catálogo vivo"""
+    error = service.admin_error(request.headers)
+    if error:
+        return json_response(*error)
+    return json_response({
+        'success': True,
+        'catalog': service.catalog.stats()
+    })
+
+
+async def admin_compact_catalog(request):
+    """Compactar el índice ahora (fuera del event loop)"""
+    error = service.admin_error(request.headers)
+    if error:
+        return json_response(*error)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(decode_executor, service.catalog.compact)
+    return json_response({
+        'success': True,
+        'catalog': service.catalog.stats()
+    })
+
+
+async def admin_upsert_product(request):
+    """Crear o actualizar un producto: datos en 'info' y muestras como fotos ('images') o 'embeddings'"""
+    error = service.admin_error(request.headers)
+    if error:
+        return json_response(*error)
+
+    product_id = request.path_params['product_id']
+    loop = asyncio.get_running_loop()
+    try:
+        if request.headers.get('content-type', '').startswith('application/json'):
+            try:
+                body = await request.json()
+            except ValueError:
+                body = {}
+            if not isinstance(body, dict):
+                body = {}
+            payload, status = await loop.run_in_executor(
+                inference_executor, lambda: service.upsert_product_data(
+                    product_id, body.get('info'), body.get('embeddings'), replace=body.get('replace', False)))
+        else:
+            form = await request.form()
+            images_data = [await file.read() for file in form.getlist('images') if not isinstance(file, str)]
+            payload, status = await loop.run_in_executor(
+                inference_executor, lambda: service.upsert_product_data(
+                    product_id, form.get('info'), images_data=images_data, replace=form.get('replace', False)))
+        return json_response(payload, status)
+
+    except Exception as e:
+        service.ERRORS.labels('internal').inc()
+        service.log.error('catalog_error', "Error actualizando el catálogo", error=str(e))
+        return json_response({
+            'success': False,
+            'error': f'Error interno: {str(e)}'
+        }, 500)
+
+
+async def admin_remove_product(request):
+    """Borrar un producto del catálogo"""
+    error = service.admin_error(request.headers)
+    if error:
+        return json_response(*error)
+    return json_response(*service.remove_product_data(request.path_params['product_id']))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(inference_executor, service.load_models):
+        raise RuntimeError("Error cargando modelos")
+    service.start_catalog_sync()
+    yield
+    decode_executor.shutdown(wait=False)
+    inference_executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        Route('/health/live', liveness, methods=['GET']),
+        Route('/health/ready', readiness, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/recognize', recognize, methods=['POST']),
+        Route('/recognize/batch', recognize_batch, methods=['POST']),
+        Route('/stream/sessions', open_stream_session, methods=['POST']),
+        Route('/stream/sessions/{session_id}/frames', stream_frame, methods=['POST']),
+        Route('/stream/sessions/{session_id}', close_stream_session, methods=['DELETE']),
+        WebSocketRoute('/stream', stream_websocket),
+        Route('/products', get_products, methods=['GET']),
+        Route('/admin/catalog', admin_catalog, methods=['GET']),
+        Route('/admin/catalog/compact', admin_compact_catalog, methods=['POST']),
+        Route('/admin/products/{product_id}', admin_upsert_product, methods=['PUT']),
+        Route('/admin/products/{product_id}', admin_remove_product, methods=['DELETE']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Iniciando SCANIX AI Service (ASGI)...")
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -0,0 +1,93 @@
+"""
+Micro-batching dinámico para SCANIX AI Service
+
+Los requests concurrentes encolan su imagen y esperan el resultado; un hilo
+de fondo junta los trabajos durante una ventana corta (o hasta llenar el
+batch) y los procesa con una sola llamada batcheada a YOLO y a CLIP.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFullError(Exception):
+    """La cola del scheduler está llena"""
+
+
+class MicroBatcher:
+    """Agrupa trabajos concurrentes y los procesa en batch con process_batch(items) -> results"""
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10, max_queue_size=64):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        # El hilo se crea con el primer trabajo: los hilos no sobreviven al fork de gunicorn
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='scanix-batcher', daemon=True)
+                    self._thread.start()
+
+    def submit(self, item):
+        """Encolar un trabajo y devolver un Future con su resultado"""
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            raise QueueFullError(f"Cola de inferencia llena ({self.max_queue_size})")
+        return future
+
+    def run(self, item, timeout=None):
+        """Encolar un trabajo y esperar su resultado"""
+        return self.submit(item).result(timeout=timeout)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # process_batch puede devolver una excepción para un trabajo puntual
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Benchmark reproducible del pipeline de reconocimiento de SCANIX AI Service
+
+Modos:
+    offline  importa app.py, carga los modelos y mide cada etapa del pipeline
+             (decode, YOLO, ROIs, CLIP, búsqueda, JSON) y el throughput
+             end-to-end de recognize_image_data a distintas concurrencias
+    server   mide POST /recognize contra un servidor: --url, o --start-server
+             para levantar uno local con gunicorn
+
+Entradas: test_image.jpg y fotos sintéticas con 1-50 objetos (semilla fija).
+Resultados en JSON (y opcionalmente CSV) con p50/p95/p99 en ms y RSS en MB;
+con --baseline se comparan contra una corrida guardada y el script sale con
+código 1 si alguna métrica empeora más que --max-regression.
+
+Uso:
+    python benchmark.py offline --out bench.json
+    python benchmark.py offline --baseline bench-baseline.json --max-regression 0.15
+    python benchmark.py server --start-server --concurrency 1,4,8
+    python benchmark.py offline --save-baseline bench-baseline.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEST_IMAGE_PATH = os.path.join(BASE_DIR, '..', 'test_image.jpg')
+DEFAULT_OBJECT_COUNTS = (1, 5, 10, 25, 50)
+STAGES = ('decode', 'detect', 'roi', 'clip', 'search', 'serialize')
+
+
+def percentiles(samples_ms):
+    """Resumen de una lista de latencias en ms"""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if not len(samples):
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        'count': len(samples),
+        'mean': float(samples.mean()),
+        'p50': float(p50),
+        'p95': float(p95),
+        'p99': float(p99)
+    }
+
+
+def rss_mb(pid=None):
+    """RSS actual en MB de un proceso y sus hijos directos (Linux), o None"""
+    pid = pid or os.getpid()
+    try:
+        pids = [pid]
+        with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+            pids += [int(child) for child in f.read().split()]
+        total = 0
+        for p in pids:
+            with open(f'/proc/{p}/statm', 'r') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        return total / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    """Pico de RSS de este proceso en MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def synthetic_image(num_objects, size=(4000, 3000), seed=0):
+    """Foto sintética de góndola con num_objects productos en grilla -> (jpeg, cajas xyxy)"""
+    rng = np.random.default_rng(seed + num_objects)
+    width, height = size
+    # Fondo con gradiente y ruido (para que el JPEG tenga un tamaño realista)
+    gradient = np.linspace(60, 200, width, dtype=np.float32)[None, :, None]
+    image = gradient + rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+
+    cols = int(np.ceil(np.sqrt(num_objects * width / height)))
+    rows = int(np.ceil(num_objects / cols))
+    cell_w, cell_h = width / cols, height / rows
+    boxes = []
+    for i in range(num_objects):
+        row, col = divmod(i, cols)
+        x1 = int(col * cell_w + cell_w * 0.1)
+        y1 = int(row * cell_h + cell_h * 0.1)
+        x2 = int((col + 1) * cell_w - cell_w * 0.1)
+        y2 = int((row + 1) * cell_h - cell_h * 0.1)
+        color = rng.integers(0, 256, 3)
+        stripes = (np.arange(y2 - y1)[:, None] // max(1, (y2 - y1) // 8)) % 2 * 40
+        image[y1:y2, x1:x2] = color + stripes[:, :, None]
+        boxes.append([x1, y1, x2, y2])
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue(), np.array(boxes, dtype=np.float32)
+
+
+def load_inputs(object_counts=DEFAULT_OBJECT_COUNTS, size=(4000, 3000), seed=0):
+    """[(nombre, bytes JPEG, cajas o None)]; las cajas de test_image.jpg salen de YOLO"""
+    inputs = []
+    if os.path.exists(TEST_IMAGE_PATH):
+        with open(TEST_IMAGE_PATH, 'rb') as f:
+            inputs.append(('test_image', f.read(), None))
+    for count in object_counts:
+        data, boxes = synthetic_image(count, size=size, seed=seed)
+        inputs.append((f'synthetic_{count}', data, boxes))
+    return inputs
+
+
+def measure(fn, iterations, warmup):
+    """Llamar fn warmup + iterations veces; devuelve (último resultado, latencias en ms)"""
+    result = None
+    for _ in range(warmup):
+        result = fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, samples
+
+
+def run_concurrent(call, payloads, concurrency, total):
+    """Ejecutar `total` llamadas repartidas en `concurrency` hilos -> (latencias ms, segundos)"""
+    def timed_call(i):
+        start = time.perf_counter()
+        call(payloads[i % len(payloads)])
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed_call, range(total)))
+    return latencies, time.perf_counter() - start
+
+
+def throughput_results(call, payloads, concurrency_levels, requests_per_level):
+    results = {}
+    for concurrency in concurrency_levels:
+        run_concurrent(call, payloads, concurrency, concurrency)  # calentar hilos y conexiones
+        latencies, seconds = run_concurrent(call, payloads, concurrency, requests_per_level)
+        results[f'c{concurrency}'] = {
+            'concurrency': concurrency,
+            'requests': requests_per_level,
+            'seconds': seconds,
+            'rps': requests_per_level / seconds,
+            'latency_ms': percentiles(latencies)
+        }
+        print(f"  concurrencia {concurrency}: {requests_per_level / seconds:.2f} req/s, "
+              f"p95 {results[f'c{concurrency}']['latency_ms']['p95']:.1f} ms")
+    return results
+
+
+def run_offline(args, inputs):
+    """Medir etapas y throughput llamando directamente a las funciones de app.py"""
+    os.chdir(BASE_DIR)
+    sys.path.insert(0, BASE_DIR)
+    import app as service
+
+    if not service.load_models(warmup=True):
+        raise RuntimeError("No se pudieron cargar los modelos")
+    if not args.with_caches:
+        # Medir el trabajo real: sin respuestas ni embeddings cacheados
+        service.result_cache = None
+        service.embedding_cache = None
+
+    encoder = service.image_encoder
+    stages = {}
+    for name, data, boxes in inputs:
+        print(f"⏱️ Etapas: {name}")
+        timings = {}
+        decoded, timings['decode'] = measure(lambda: service.preprocess_image(data, service.RECOGNIZE_DECODE_SIZE), args.iterations, args.warmup)
+        image = decoded.array
+        detections, timings['detect'] = measure(lambda: service.detect_products_yolo_batch([image])[0],
+                                                args.iterations, args.warmup)
+
+        # Cajas conocidas de la imagen sintética (llevadas a la escala decodificada) o las de YOLO
+        if boxes is None:
+            boxes = np.array([d['bbox'] for d in detections], dtype=np.float32).reshape(-1, 4)
+        else:
+            boxes = boxes / decoded.scale
+        if not len(boxes):
+            height, width = image.shape[:2]
+            boxes = np.array([[0, 0, width, height]], dtype=np.float32)
+
+        def extract_rois():
+            prepared = encoder.prepare(image)
+            encoder.block_means(prepared, boxes, 16, 17)
+            return encoder.pixel_values(prepared, boxes)
+
+        pixel_values, timings['roi'] = measure(extract_rois, args.iterations, args.warmup)
+        embeddings, timings['clip'] = measure(lambda: encoder.encode([pixel_values]), args.iterations, args.warmup)
+        recognitions, timings['search'] = measure(lambda: service.match_embeddings(embeddings),
+                                                  args.iterations, args.warmup)
+
+        fake_detections = [{'bbox': box, 'confidence': 0.9, 'recognition': recognition}
+                           for box, recognition in zip(boxes.astype(int).tolist(), recognitions)]
+        payload = service.recognition_payload(fake_detections, decoded.scale)
+        _, timings['serialize'] = measure(lambda: service.app.json.response(payload).get_data(),
+                                          args.iterations, args.warmup)
+
+        stages[name] = {'boxes': len(boxes), **{stage: percentiles(timings[stage]) for stage in STAGES}}
+
+    print("⏱️ Throughput end-to-end (recognize_image_data)")
+    payloads = [data for _, data, _ in inputs]
+    throughput = throughput_results(service.recognize_image_data, payloads,
+                                    args.concurrency, args.requests)
+
+    return {
+        'stages': stages,
+        'throughput': throughput,
+        'rss_mb': {'current': rss_mb(), 'peak': peak_rss_mb()}
+    }
+
+
+def start_server(port, with_caches):
+    """Levantar gunicorn local y esperar a /health/ready -> Popen"""
+    import requests
+
+    env = dict(os.environ, SCANIX_BIND=f'127.0.0.1:{port}')
+    if not with_caches:
+        env.update(SCANIX_RESULT_CACHE_ENTRIES='0', SCANIX_EMBED_CACHE_ENTRIES='0')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=BASE_DIR, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {server.returncode})")
+        try:
+            if requests.get(f'{url}/health/ready', timeout=2).status_code == 200:
+                return server, url
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    server.terminate()
+    raise RuntimeError("El servidor no quedó ready en 300s")
+
+
+def run_server(args, inputs):
+    """Medir POST /recognize contra un servidor HTTP"""
+    import requests
+
+    server = None
+    url = args.url.rstrip('/')
+    if args.start_server:
+        server, url = start_server(args.port, args.with_caches)
+
+    try:
+        session = requests.Session()
+
+        def post(data):
+            response = session.post(f'{url}/recognize', files={'image': ('bench.jpg', data, 'image/jpeg')}, timeout=60)
+            response.raise_for_status()
+            return response
+
+        stages = {}
+        for name, data, _ in inputs:
+            print(f"⏱️ Request: {name}")
+            _, samples = measure(lambda: post(data), args.iterations, args.warmup)
+            stages[name] = {'request': percentiles(samples)}
+
+        print("⏱️ Throughput end-to-end (POST /recognize)")
+        throughput = throughput_results(post, [data for _, data, _ in inputs], args.concurrency, args.requests)
+        health = session.get(f'{url}/health', timeout=10).json()
+        return {
+            'url': url,
+            'stages': stages,
+            'throughput': throughput,
+            'rss_mb': {'current': rss_mb(server.pid) if server else None},
+            'server_health': health
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def flatten_metrics(results):
+    """{nombre de métrica: valor} comparables entre corridas"""
+    metrics = {}
+    for name, stages in results.get('stages', {}).items():
+        for stage, stats in stages.items():
+            if isinstance(stats, dict):
+                for key in ('p50', 'p95', 'p99'):
+                    if key in stats:
+                        metrics[f'stage.{name}.{stage}.{key}'] = stats[key]
+    for level, stats in results.get('throughput', {}).items():
+        metrics[f'throughput.{level}.rps'] = stats['rps']
+        for key in ('p50', 'p95', 'p99'):
+            metrics[f'throughput.{level}.{key}'] = stats['latency_ms'][key]
+    for key, value in results.get('rss_mb', {}).items():
+        if value is not None:
+            metrics[f'rss_mb.{key}'] = value
+    return metrics
+
+
+def compare(metrics, baseline, max_regression, noise_floor_ms):
+    """Métricas que empeoraron más que max_regression respecto del baseline"""
+    regressions = []
+    for name, base in baseline.items():
+        value = metrics.get(name)
+        if value is None or not base:
+            continue
+        higher_is_better = name.endswith('.rps')
+        if higher_is_better:
+            change = (base - value) / base
+        else:
+            # Latencias por debajo del piso de ruido no se comparan
+            if not name.startswith('rss_mb') and max(base, value) < noise_floor_ms:
+                continue
+            change = (value - base) / base
+        if change > max_regression:
+            regressions.append({'metric': name, 'baseline': base, 'value': value, 'change': change})
+    return regressions
+
+
+def write_csv(path, metrics):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['metric', 'value'])
+        for name, value in sorted(metrics.items()):
+            writer.writerow([name, f'{value:.6g}'])
+
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark del pipeline de reconocimiento de SCANIX')
+    parser.add_argument('mode', choices=['offline', 'server'])
+    parser.add_argument('--iterations', type=int, default=20, help='Repeticiones medidas por etapa')
+    parser.add_argument('--warmup', type=int, default=3, help='Repeticiones sin medir por etapa')
+    parser.add_argument('--concurrency', default='1,4', help='Niveles de concurrencia, separados por coma')
+    parser.add_argument('--requests', type=int, default=40, help='Requests por nivel de concurrencia')
+    parser.add_argument('--objects', default=','.join(map(str, DEFAULT_OBJECT_COUNTS)),
+                        help='Cantidad de objetos de las imágenes sintéticas')
+    parser.add_argument('--image-size', type=parse_size, default=(4000, 3000), help='Tamaño de las sintéticas (WxH)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--with-caches', action='store_true', help='No desactivar los caches de respuestas y embeddings')
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--start-server', action='store_true', help='Levantar gunicorn local para el modo server')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--out', default='benchmark-results.json')
+    parser.add_argument('--csv', help='Escribir además las métricas en CSV')
+    parser.add_argument('--baseline', help='JSON de una corrida anterior para comparar')
+    parser.add_argument('--save-baseline', help='Guardar esta corrida como baseline')
+    parser.add_argument('--max-regression', type=float, default=0.15, help='Empeoramiento relativo tolerado')
+    parser.add_argument('--noise-floor-ms', type=float, default=0.5, help='Latencias menores no se comparan')
+    args = parser.parse_args(argv)
+    args.concurrency = [int(c) for c in args.concurrency.split(',') if c]
+
+    inputs = load_inputs([int(n) for n in args.objects.split(',') if n], size=args.image_size, seed=args.seed)
+    print(f"🚀 Benchmark {args.mode}: {len(inputs)} entradas, {args.iterations} iteraciones")
+
+    try:
+        results = run_offline(args, inputs) if args.mode == 'offline' else run_server(args, inputs)
+    except Exception as e:
+        print(f"❌ Error en el benchmark: {e}")
+        return 2
+
+    results['config'] = {
+        'mode': args.mode,
+        'iterations': args.iterations,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'objects': args.objects,
+        'image_size': list(args.image_size),
+        'seed': args.seed,
+        'with_caches': args.with_caches,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    metrics = flatten_metrics(results)
+    results['metrics'] = metrics
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"✅ Resultados en {args.out}")
+    if args.csv:
+        write_csv(args.csv, metrics)
+        print(f"✅ Métricas en {args.csv}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"✅ Baseline guardado en {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('metrics', {})
+        regressions = compare(metrics, baseline, args.max_regression, args.noise_floor_ms)
+        if regressions:
+            print(f"❌ {len(regressions)} regresión(es) mayores a {args.max_regression:.0%}:")
+            for r in regressions:
+                print(f"  {r['metric']}: {r['baseline']:.3f} -> {r['value']:.3f} ({r['change']:+.1%})")
+            return 1
+        print(f"✅ Sin regresiones respecto de {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Reconocimiento masivo de SCANIX AI Service (/recognize/batch y CLI)
+
+Las fotos de auditoría de góndola se procesan en lotes reales: el decode de
+las próximas imágenes corre en un pool de hilos mientras YOLO y CLIP
+procesan el lote actual, y por cada imagen sale una línea NDJSON en cuanto
+termina su lote. Un error en una imagen (formato, tamaño) queda en su línea
+y no corta el resto del trabajo. En memoria hay como mucho dos lotes de
+imágenes, sin importar cuántas tenga el trabajo.
+
+Uso:
+    python bulk.py fotos/ --out resultados.ndjson
+    curl -F images=@a.jpg -F images=@b.jpg http://localhost:5001/recognize/batch
+    curl -H 'Content-Type: application/x-tar' --data-binary @fotos.tar http://localhost:5001/recognize/batch
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.zip')
+# Cuerpos crudos más grandes que esto se vuelcan a disco mientras se leen
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+class BulkItemError(Exception):
+    """Error de una imagen del lote (se reporta en su línea, con su status HTTP y campos extra)"""
+
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def is_image_name(name):
+    base = os.path.basename(name)
+    return not base.startswith('.') and '__MACOSX' not in name and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def is_archive_name(name):
+    return (name or '').lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def spool(stream, chunk_size=1024 * 1024):
+    """Copiar un stream no seekable a un archivo temporal (en memoria si es chico)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def iter_archive(fileobj):
+    """(nombre, bytes) de cada imagen de un tar (opcionalmente comprimido) o zip, de a una"""
+    if not fileobj.seekable():
+        fileobj = spool(fileobj)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image_name(info.filename):
+                    yield info.filename, archive.read(info)
+        return
+
+    fileobj.seek(0)
+    try:
+        # Modo stream: se lee cada miembro en orden, sin índice en memoria
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile() and is_image_name(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    except tarfile.TarError as e:
+        raise BulkItemError(400, f"Archivo comprimido inválido: {e}")
+
+
+class UploadSpool:
+    """Copia de los archivos de un request que sobrevive al request.
+
+    Las imágenes se concatenan en un único archivo temporal (en memoria hasta
+    SPOOL_BYTES, después en disco) y se leen de a una al procesar; los tar/zip
+    se guardan aparte y se expanden recién al iterar.
+    """
+
+    def __init__(self):
+        self._images = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self._entries = []  # (nombre, offset, largo) de imágenes o (nombre, archivo, None) de tar/zip
+
+    def add(self, name, stream, archive=None):
+        if archive if archive is not None else is_archive_name(name):
+            self._entries.append((name, spool(stream), None))
+            return
+        offset = self._images.tell()
+        shutil.copyfileobj(stream, self._images)
+        self._entries.append((name, offset, self._images.tell() - offset))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def items(self):
+        """(nombre, bytes) de cada imagen, expandiendo los tar/zip"""
+        try:
+            for name, source, length in self._entries:
+                if length is None:
+                    yield from iter_archive(source)
+                else:
+                    self._images.seek(source)
+                    yield name, self._images.read(length)
+        finally:
+            self.close()
+
+    def close(self):
+        self._images.close()
+        for _, source, length in self._entries:
+            if length is None:
+                source.close()
+
+
+def iter_directory(path):
+    """(ruta relativa, bytes) de cada imagen de un directorio, recorriéndolo en orden y de a una"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if is_image_name(name):
+                full_path = os.path.join(root, name)
+                with open(full_path, 'rb') as f:
+                    yield os.path.relpath(full_path, path), f.read()
+
+
+def recognize_bulk(items, decode, recognize_batch, batch_size=8, decode_workers=4):
+    """Reconocer (nombre, bytes) en lotes; genera un dict por imagen, en orden.
+
+    decode(bytes) -> imagen decodificada (o BulkItemError);
+    recognize_batch([imagen decodificada]) -> [payload por imagen] (o BulkItemError
+    para todo el lote).
+    """
+    def line(index, name, status, payload):
+        return {'index': index, 'name': name, 'status': status, **payload}
+
+    def flush(pending):
+        batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+        decoded, results = [], {}
+        for index, name, future in batch:
+            try:
+                decoded.append((index, future.result()))
+            except BulkItemError as e:
+                results[index] = (e.status, {'success': False, 'error': str(e), **e.details})
+            except Exception as e:
+                results[index] = (400, {'success': False, 'error': f'Error procesando imagen: {e}'})
+
+        if decoded:
+            try:
+                payloads = recognize_batch([image for _, image in decoded])
+                for (index, _), payload in zip(decoded, payloads):
+                    results[index] = (200, payload)
+            except BulkItemError as e:
+                # El lote entero no se procesó (p. ej. servicio saturado o deadline vencido)
+                for index, _ in decoded:
+                    results[index] = (e.status, {'success': False, 'error': str(e), **e.details})
+            except Exception as e:
+                for index, _ in decoded:
+                    results[index] = (500, {'success': False, 'error': f'Error interno: {e}'})
+
+        for index, name, _ in batch:
+            status, payload = results[index]
+            yield line(index, name, status, payload)
+
+    with ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix='scanix-bulk') as pool:
+        pending = deque()
+        items = iter(items)
+        index = 0
+        while True:
+            try:
+                name, data = next(items)
+            except StopIteration:
+                break
+            except BulkItemError as e:
+                # El archivo dejó de poder leerse: reportarlo y terminar con lo que ya se leyó
+                pending.append((index, None, pool.submit(_raise, e)))
+                break
+            pending.append((index, name, pool.submit(decode, data)))
+            index += 1
+            # Se decodifica un lote por delante del que se está reconociendo
+            if len(pending) >= 2 * batch_size:
+                yield from flush(pending)
+        while pending:
+            yield from flush(pending)
+
+
+def _raise(error):
+    raise error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reconocer todas las imágenes de un directorio (NDJSON)')
+    parser.add_argument('directory')
+    parser.add_argument('--out', help='Archivo NDJSON de salida (por defecto stdout)')
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ No existe el directorio {args.directory}", file=sys.stderr)
+        return 1
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    directory = os.path.abspath(args.directory)
+    out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+    os.chdir(base_dir)
+    sys.path.insert(0, base_dir)
+    import app as service
+
+    if not service.load_models():
+        print("❌ Error cargando modelos", file=sys.stderr)
+        return 1
+
+    processed = failed = 0
+    try:
+        for result in service.recognize_bulk_items(iter_directory(directory), batch_size=args.batch_size):
+            out.write(service.ndjson_line(result))
+            out.flush()
+            processed += 1
+            failed += result['status'] != 200
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"🎉 {processed} imágenes procesadas ({failed} con error)", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
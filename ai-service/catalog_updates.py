@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+Actualizaciones en caliente del catálogo de SCANIX AI Service
+
+Agregar, actualizar o borrar productos y sus muestras sin reiniciar el
+servicio (sin recargar YOLO ni CLIP):
+
+- El índice vivo es la base compactada (EmbeddingIndex, posiblemente el
+  memmap del bundle) más un segmento de filas agregadas y tombstones para
+  los productos borrados o reemplazados. Cada cambio arma un índice y un
+  mapeo nuevos (copiando solo el segmento agregado) y los publica con una
+  única asignación: los requests en curso terminan con el snapshot que
+  tomaron y nunca esperan a una actualización.
+- Cuando el segmento agregado o los tombstones crecen, un hilo de fondo
+  compacta todo en una base nueva y la publica de la misma forma.
+- Cada cambio se agrega a un journal NDJSON (con flock) antes de publicarse:
+  sobrevive a reinicios y los demás workers de gunicorn lo aplican al
+  sincronizar, en el mismo orden.
+
+Uso (contra el servicio corriendo, con SCANIX_ADMIN_TOKEN configurado):
+    python catalog_updates.py upsert agua_villavicencio_500ml --sku AGU-001 \\
+        --nombre "Agua Villavicencio 500ml" --categoria Aguas --precio 700 --images fotos/*.jpg
+    python catalog_updates.py remove agua_villavicencio_500ml
+    python catalog_updates.py import-dataset ../DATASET-BEBIDAS-ARGENTINA.json --images-dir fotos/
+    python catalog_updates.py stats
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+from ann_index import AnnIndex
+from embedding_index import normalize_rows, top_k
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso escribe el journal
+    fcntl = None
+
+# Compactar con más filas agregadas o productos borrados que esto
+COMPACT_ROWS = 4096
+COMPACT_TOMBSTONES = 256
+SYNC_INTERVAL = 1.0
+
+# Snapshot inmutable que usa un request de punta a punta
+CatalogSnapshot = namedtuple('CatalogSnapshot', ['index', 'product_mapping', 'version'])
+
+
+class CatalogError(Exception):
+    """Cambio de catálogo inválido (producto inexistente, embeddings mal formados...)"""
+
+
+class LiveIndex:
+    """Índice de solo lectura: base compactada + filas agregadas + tombstones.
+
+    Cada producto ocupa un slot; los slots [0, len(base)) son los productos
+    de la base y los siguientes los agregados después. Reemplazar las
+    muestras de un producto marca su slot con tombstone y abre uno nuevo.
+
+    La base puede ser exacta (EmbeddingIndex) o aproximada (AnnIndex); con
+    la aproximada se combinan sus candidatos con los de las filas agregadas.
+    """
+
+    def __init__(self, base, slot_ids, delta_embeddings, delta_labels, tombstones):
+        self.base = base
+        self.slot_ids = slot_ids
+        # Filas agregadas (R, D) normalizadas, agrupadas por slot
+        self.delta_embeddings = delta_embeddings
+        self.delta_labels = delta_labels
+        self.tombstones = tombstones
+
+        self.delta_offsets = (np.flatnonzero(np.r_[True, np.diff(delta_labels) != 0])
+                              if len(delta_labels) else np.empty(0, dtype=np.int64))
+        self.delta_slots = delta_labels[self.delta_offsets]
+        self.live_slots = np.flatnonzero(~tombstones)
+        self.product_ids = slot_ids[self.live_slots]
+        self.slots = {product_id: int(slot) for product_id, slot in zip(self.product_ids, self.live_slots)}
+
+    @classmethod
+    def from_base(cls, base):
+        return cls(base, np.asarray(base.product_ids, dtype=object), np.empty((0, base.dimension), dtype=np.float32),
+                   np.empty(0, dtype=np.int32), np.zeros(len(base), dtype=bool))
+
+    @property
+    def dimension(self):
+        return self.base.dimension
+
+    @property
+    def pending_rows(self):
+        return len(self.delta_labels)
+
+    @property
+    def pending_tombstones(self):
+        return int(self.tombstones.sum())
+
+    def __len__(self):
+        return len(self.live_slots)
+
+    def search(self, queries, k=1):
+        """Top-k productos vivos más similares para cada query (mismo contrato que EmbeddingIndex.search)"""
+        _, similarities, product_ids = self.search_scores(queries, k)
+        return similarities, product_ids
+
+    def search_scores(self, queries, k=1):
+        """Como search, con el puntaje por el que se ordenó (ver EmbeddingIndex.search_scores)"""
+        if isinstance(self.base, AnnIndex):
+            if not self.pending_rows and not self.pending_tombstones and len(self.base):
+                similarities, product_ids = self.base.search(queries, k)
+            else:
+                similarities, product_ids = self._search_candidates(queries, k)
+            # Sin filas de texto: el puntaje es la similitud
+            return similarities, similarities, product_ids
+
+        if not self.pending_rows and not self.pending_tombstones and len(self.base):
+            return self.base.search_scores(queries, k)
+
+        queries = normalize_rows(queries)
+        scores = np.full((len(queries), len(self.slot_ids)), -np.inf, dtype=np.float32)
+        from_text = None
+        if len(self.base):
+            base_scores, base_text = self.base.product_scores(queries)
+            scores[:, :len(self.base)] = base_scores
+            if base_text is not None:
+                from_text = np.zeros(scores.shape, dtype=bool)
+                from_text[:, :len(self.base)] = base_text
+        if self.pending_rows:
+            delta = self._delta_similarities(queries)
+            # Muestras agregadas a un producto de la base: se queda el máximo
+            if from_text is not None:
+                from_text[:, self.delta_slots] &= delta <= scores[:, self.delta_slots]
+            scores[:, self.delta_slots] = np.maximum(scores[:, self.delta_slots], delta)
+
+        top_scores, top = top_k(scores[:, self.live_slots], k)
+        if from_text is not None:
+            from_text = np.take_along_axis(from_text[:, self.live_slots], top, axis=1)
+            return top_scores, self.base.similarities(top_scores, from_text), self.product_ids[top]
+        return top_scores, top_scores, self.product_ids[top]
+
+    def _delta_similarities(self, queries):
+        """Similitud (Q, U) contra cada slot con filas agregadas (self.delta_slots)"""
+        delta = queries @ self.delta_embeddings.T
+        if len(self.delta_offsets) != len(self.delta_labels):
+            delta = np.maximum.reduceat(delta, self.delta_offsets, axis=1)
+        return delta
+
+    def _search_candidates(self, queries, k):
+        """Top-k con base aproximada: candidatos de la base + filas agregadas, sin los borrados"""
+        queries = normalize_rows(queries)
+        k = min(k, len(self.live_slots))
+        # Pedir de más por si algunos candidatos de la base están borrados
+        similarities, slots = self.base.search_labels(queries, k + self.pending_tombstones)
+        if self.pending_rows:
+            delta = self._delta_similarities(queries)
+            similarities = np.concatenate([similarities, delta], axis=1)
+            slots = np.concatenate([slots, np.broadcast_to(self.delta_slots, delta.shape)], axis=1)
+        dead = (slots < 0) | self.tombstones[slots]
+
+        out_similarities = np.full((len(queries), k), -1.0, dtype=np.float32)
+        out_ids = np.full((len(queries), k), None, dtype=object)
+        for i in range(len(queries)):
+            order = np.argsort(-similarities[i], kind='stable')
+            order = order[~dead[i, order]]
+            # Un producto puede venir de la base y de las filas agregadas: queda el máximo (el primero)
+            _, first = np.unique(slots[i, order], return_index=True)
+            best = order[np.sort(first)[:k]]
+            out_similarities[i, :len(best)] = similarities[i, best]
+            out_ids[i, :len(best)] = self.slot_ids[slots[i, best]]
+        return out_similarities, out_ids
+
+    def append(self, product_id, embeddings, replace=False):
+        """Índice nuevo con las filas agregadas al producto (en un slot nuevo si replace o si no existe)"""
+        slot = self.slots.get(product_id)
+        tombstones = self.tombstones
+        slot_ids = self.slot_ids
+        if slot is None or replace:
+            if slot is not None:
+                tombstones = tombstones.copy()
+                tombstones[slot] = True
+            slot = len(slot_ids)
+            slot_ids = np.append(slot_ids, np.array([product_id], dtype=object))
+            tombstones = np.append(tombstones, False)
+
+        delta_embeddings = np.concatenate([self.delta_embeddings, embeddings])
+        delta_labels = np.concatenate([self.delta_labels, np.full(len(embeddings), slot, dtype=np.int32)])
+        # Mantener las filas agrupadas por slot para el reduceat
+        order = np.argsort(delta_labels, kind='stable')
+        return LiveIndex(self.base, slot_ids, np.ascontiguousarray(delta_embeddings[order]),
+                         delta_labels[order], tombstones)
+
+    def remove(self, product_id):
+        """Índice nuevo con el producto marcado como borrado"""
+        slot = self.slots.get(product_id)
+        if slot is None:
+            return self
+        tombstones = self.tombstones.copy()
+        tombstones[slot] = True
+        return LiveIndex(self.base, self.slot_ids, self.delta_embeddings, self.delta_labels, tombstones)
+
+    def compact(self):
+        """Índice equivalente sin filas agregadas ni tombstones (una base nueva)"""
+        keep = ~self.tombstones
+        if isinstance(self.base, AnnIndex):
+            # Mismos cuantizadores: se sacan las filas borradas y se codifican las agregadas
+            return LiveIndex.from_base(self.base.compact(keep, self.delta_embeddings, self.delta_labels,
+                                                         list(self.product_ids)))
+        base_rows = keep[self.base.labels]
+        delta_rows = keep[self.delta_labels]
+        embeddings = np.concatenate([self.base.vectors(base_rows), self.delta_embeddings[delta_rows]])
+        slots = np.concatenate([self.base.labels[base_rows], self.delta_labels[delta_rows]])
+        # Slots vivos renumerados en orden: coinciden con self.product_ids
+        position = (np.cumsum(keep) - 1).astype(np.int32)
+        labels = position[slots]
+        order = np.argsort(labels, kind='stable')
+        text = {}
+        if self.base.text_vectors is not None:
+            # Filas de texto de los productos de la base que siguen vivos
+            kept = keep[self.base.text_labels]
+            text = {'text_vectors': self.base.text_vectors[kept], 'text_labels': position[self.base.text_labels[kept]]}
+        # Misma representación que la base (float16 / PQ con los mismos codebooks)
+        return LiveIndex.from_base(self.base.with_rows(embeddings[order], labels[order], list(self.product_ids),
+                                                       **text))
+
+
+def encode_vectors(embeddings):
+    """float32 little endian en base64 (para el journal)"""
+    return base64.b64encode(np.ascontiguousarray(embeddings, dtype='<f4').tobytes()).decode('ascii')
+
+
+def decode_vectors(data, dimension):
+    return np.frombuffer(base64.b64decode(data), dtype='<f4').reshape(-1, dimension)
+
+
+class LiveCatalog:
+    """Índice + mapeo de productos actualizables en caliente.
+
+    Las lecturas solo toman `snapshot` (una referencia); las escrituras se
+    serializan con un lock propio y con flock sobre el journal entre procesos.
+    on_publish(snapshot) se llama después de cada swap.
+    """
+
+    def __init__(self, index, product_mapping, journal_path=None, compact_rows=COMPACT_ROWS,
+                 compact_tombstones=COMPACT_TOMBSTONES, on_publish=None, logger=None):
+        if not isinstance(index, LiveIndex):
+            index = LiveIndex.from_base(index)
+        self.journal_path = journal_path
+        self.compact_rows = compact_rows
+        self.compact_tombstones = compact_tombstones
+        self.on_publish = on_publish
+        self.log = logger
+        self.seq = 0
+        self.compactions = 0
+        self.last_update = None
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._sync_pid = None
+        self.snapshot = CatalogSnapshot(index, dict(product_mapping), '0')
+
+        # Cambios de ejecuciones anteriores (y de otros workers)
+        if journal_path and os.path.exists(journal_path):
+            with self._lock:
+                self._replay()
+                self._compact_locked()
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version,
+            'products': len(snapshot.product_mapping),
+            'indexed_products': len(snapshot.index),
+            'pending_rows': snapshot.index.pending_rows,
+            'tombstones': snapshot.index.pending_tombstones,
+            'compactions': self.compactions,
+            'last_update': self.last_update,
+            'journal': self.journal_path
+        }
+
+    # Cambios
+
+    def upsert(self, product_id, info=None, embeddings=None, replace=False):
+        """Crear o actualizar un producto (datos y/o muestras); devuelve el snapshot nuevo"""
+        entry = {'op': 'upsert', 'product_id': product_id, 'info': info, 'replace': bool(replace)}
+        if embeddings is not None and len(embeddings):
+            embeddings = self._check_embeddings(embeddings)
+            entry.update(dimension=embeddings.shape[1], embeddings=encode_vectors(embeddings))
+        return self._commit(entry)
+
+    def remove(self, product_id):
+        """Borrar un producto (tombstone en el índice); devuelve el snapshot nuevo"""
+        return self._commit({'op': 'remove', 'product_id': product_id})
+
+    def compact(self):
+        """Compactar ya (bloquea solo a otros cambios, no a las búsquedas)"""
+        with self._lock:
+            self._compact_locked()
+        return self.snapshot
+
+    # Sincronización entre procesos
+
+    def sync(self):
+        """Aplicar los cambios que otros procesos agregaron al journal"""
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return False
+        if os.path.getsize(self.journal_path) == self._offset:
+            return False
+        with self._lock:
+            return self._replay() > 0
+
+    def start_sync(self, interval=SYNC_INTERVAL):
+        """Hilo de fondo que sincroniza el journal y compacta (uno por proceso, también después de un fork)"""
+        if not self.journal_path or self._sync_pid == os.getpid():
+            return
+        self._sync_pid = os.getpid()
+        # Un lock heredado de un fork puede haber quedado tomado
+        self._lock = threading.RLock()
+        self._compacting = False
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sync()
+                    self._maybe_compact()
+                except Exception as e:
+                    self._warn('catalog_sync_error', "Error sincronizando el catálogo", error=str(e))
+
+        threading.Thread(target=loop, name='scanix-catalog-sync', daemon=True).start()
+
+    # Internos
+
+    def _check_embeddings(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim == 1:
+            embeddings = embeddings[None, :]
+        dimension = self.snapshot.index.dimension
+        if embeddings.ndim != 2 or embeddings.shape[1] != dimension:
+            raise CatalogError(f"Los embeddings deben tener dimensión {dimension}")
+        if not np.isfinite(embeddings).all():
+            raise CatalogError("Los embeddings contienen valores no finitos")
+        return normalize_rows(embeddings)
+
+    def _apply(self, index, mapping, entry):
+        """(índice, mapeo) después de aplicar una entrada del journal"""
+        product_id = entry['product_id']
+        if entry['op'] == 'remove':
+            if product_id not in mapping and product_id not in index.slots:
+                raise CatalogError(f"Producto inexistente: {product_id}")
+            mapping = {pid: info for pid, info in mapping.items() if pid != product_id}
+            return index.remove(product_id), mapping
+
+        if entry['op'] != 'upsert':
+            raise CatalogError(f"Operación desconocida: {entry['op']}")
+        if product_id not in mapping and not entry.get('info'):
+            raise CatalogError(f"Producto nuevo sin datos: {product_id}")
+
+        info = {**mapping.get(product_id, {}), **(entry.get('info') or {})}
+        if entry.get('embeddings'):
+            embeddings = decode_vectors(entry['embeddings'], entry['dimension'])
+            previous = 0 if entry.get('replace') else int(info.get('samples', 0) or 0)
+            info['samples'] = previous + len(embeddings)
+            index = index.append(product_id, embeddings, replace=entry.get('replace', False))
+        elif entry.get('replace'):
+            info['samples'] = 0
+            index = index.remove(product_id)
+        mapping = {**mapping, product_id: info}
+        return index, mapping
+
+    @contextmanager
+    def _journal(self, mode, lock):
+        with open(self.journal_path, mode) as f:
+            if fcntl is not None:
+                fcntl.flock(f, lock)
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_entries(self, f):
+        """Entradas completas desde el último offset aplicado"""
+        f.seek(self._offset)
+        entries = []
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # línea a medio escribir (no debería pasar con flock)
+            self._offset += len(line)
+            if line.strip():
+                entries.append(json.loads(line))
+        return entries
+
+    def _replay(self):
+        with self._journal('rb', fcntl.LOCK_SH if fcntl else None) as f:
+            entries = self._read_entries(f)
+        if not entries:
+            return 0
+        index, mapping = self.snapshot.index, self.snapshot.product_mapping
+        for entry in entries:
+            try:
+                index, mapping = self._apply(index, mapping, entry)
+            except CatalogError as e:
+                self._warn('catalog_entry_skipped', "Entrada del journal ignorada", error=str(e))
+            self.seq += 1
+        self._publish(index, mapping)
+        return len(entries)
+
+    def _commit(self, entry):
+        start = time.perf_counter()
+        with self._lock:
+            if not self.journal_path:
+                index, mapping = self._apply(self.snapshot.index, self.snapshot.product_mapping, entry)
+                self.seq += 1
+                self._publish(index, mapping)
+            else:
+                with self._journal('a+b', fcntl.LOCK_EX if fcntl else None) as f:
+                    # Primero lo que escribieron otros procesos, para aplicar en el mismo orden
+                    entries = self._read_entries(f)
+                    index, mapping = self.snapshot.index, self.snapshot.product_mapping
+                    for previous in entries:
+                        try:
+                            index, mapping = self._apply(index, mapping, previous)
+                        except CatalogError:
+                            pass
+                        self.seq += 1
+                    try:
+                        new_index, new_mapping = self._apply(index, mapping, entry)
+                    except CatalogError:
+                        if entries:
+                            self._publish(index, mapping)
+                        raise
+                    entry = {'id': uuid.uuid4().hex, 'ts': round(time.time(), 3), **entry}
+                    f.seek(0, os.SEEK_END)
+                    f.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._offset = f.tell()
+                    self.seq += 1
+                    self._publish(new_index, new_mapping)
+        self._info('catalog_updated', "Catálogo actualizado", op=entry['op'], product_id=entry['product_id'],
+                   version=self.snapshot.version, ms=round((time.perf_counter() - start) * 1000, 2))
+        self._maybe_compact(background=True)
+        return self.snapshot
+
+    def _publish(self, index, mapping):
+        self.snapshot = CatalogSnapshot(index, mapping, str(self.seq))
+        self.last_update = round(time.time(), 3)
+        if self.on_publish is not None:
+            self.on_publish(self.snapshot)
+
+    def _needs_compaction(self):
+        index = self.snapshot.index
+        return index.pending_rows > self.compact_rows or index.pending_tombstones > self.compact_tombstones
+
+    def _maybe_compact(self, background=False):
+        if self._compacting or not self._needs_compaction():
+            return
+        if background:
+            self._compacting = True
+            threading.Thread(target=self.compact, name='scanix-catalog-compact', daemon=True).start()
+        else:
+            self.compact()
+
+    def _compact_locked(self):
+        try:
+            snapshot = self.snapshot
+            if not snapshot.index.pending_rows and not snapshot.index.pending_tombstones:
+                return
+            start = time.perf_counter()
+            self.snapshot = snapshot._replace(index=snapshot.index.compact())
+            self.compactions += 1
+            if self.on_publish is not None:
+                self.on_publish(self.snapshot)
+            self._info('catalog_compacted', "Índice del catálogo compactado", products=len(self.snapshot.index),
+                       ms=round((time.perf_counter() - start) * 1000, 2))
+        finally:
+            self._compacting = False
+
+    def _info(self, event, message, **fields):
+        if self.log is not None:
+            self.log.info(event, message, **fields)
+
+    def _warn(self, event, message, **fields):
+        if self.log is not None:
+            self.log.warning(event, message, **fields)
+
+
+# CLI: cliente de la API de administración
+
+def slugify(text):
+    return re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+
+
+def dataset_product(product):
+    """(product_id, info) de una entrada de DATASET-BEBIDAS-ARGENTINA.json"""
+    return slugify(product['nombre']), {
+        'sku': product.get('sku', ''),
+        'nombre': product.get('nombre', ''),
+        'categoria': product.get('tipo', ''),
+        'marca': product.get('marca', ''),
+        'precio_base': product.get('precioBase', 0),
+        'volumen': product.get('volumen', ''),
+        'keywords': product.get('keywords', [])
+    }
+
+
+def multipart_body(fields, files):
+    """(cuerpo, content-type) multipart/form-data con urllib"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for path in files:
+        with open(path, 'rb') as f:
+            data = f.read()
+        header = (f'--{boundary}\r\nContent-Disposition: form-data; name="images"; '
+                  f'filename="{os.path.basename(path)}"\r\nContent-Type: application/octet-stream\r\n\r\n')
+        parts.append(header.encode('utf-8') + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def admin_request(args, method, path, fields=None, files=()):
+    import urllib.error
+    import urllib.request
+
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    body = None
+    if fields is not None:
+        body, headers['Content-Type'] = multipart_body(fields, files)
+    request = urllib.request.Request(args.url.rstrip('/') + path, data=body, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+
+def image_files(directory):
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
+
+
+def upsert_product(args, product_id, info, images, replace):
+    fields = {'replace': '1' if replace else '0'}
+    if info:
+        fields['info'] = json.dumps(info, ensure_ascii=False)
+    return admin_request(args, 'PUT', f'/admin/products/{product_id}', fields, images)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Actualizar el catálogo del servicio en caliente')
+    parser.add_argument('--url', default=os.environ.get('SCANIX_URL', 'http://localhost:5001'))
+    parser.add_argument('--token', default=os.environ.get('SCANIX_ADMIN_TOKEN', ''))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    upsert_parser = commands.add_parser('upsert', help='Crear o actualizar un producto')
+    upsert_parser.add_argument('product_id')
+    upsert_parser.add_argument('--sku')
+    upsert_parser.add_argument('--nombre')
+    upsert_parser.add_argument('--categoria')
+    upsert_parser.add_argument('--precio', type=float)
+    upsert_parser.add_argument('--images', nargs='*', default=[], help='Fotos de muestra del producto')
+    upsert_parser.add_argument('--replace', action='store_true', help='Reemplazar las muestras existentes')
+
+    remove_parser = commands.add_parser('remove', help='Borrar un producto')
+    remove_parser.add_argument('product_id')
+
+    import_parser = commands.add_parser('import-dataset', help='Cargar un dataset JSON (p. ej. DATASET-BEBIDAS-ARGENTINA.json)')
+    import_parser.add_argument('dataset')
+    import_parser.add_argument('--images-dir', help='Fotos en <dir>/<sku o product_id>/*.jpg')
+
+    commands.add_parser('compact', help='Compactar el índice ahora')
+    commands.add_parser('stats', help='Estado del catálogo')
+    args = parser.parse_args(argv)
+
+    if args.command == 'upsert':
+        info = {key: value for key, value in (('sku', args.sku), ('nombre', args.nombre),
+                                              ('categoria', args.categoria), ('precio_base', args.precio))
+                if value is not None}
+        status, payload = upsert_product(args, args.product_id, info, args.images, args.replace)
+    elif args.command == 'remove':
+        status, payload = admin_request(args, 'DELETE', f'/admin/products/{args.product_id}')
+    elif args.command == 'compact':
+        status, payload = admin_request(args, 'POST', '/admin/catalog/compact')
+    elif args.command == 'stats':
+        status, payload = admin_request(args, 'GET', '/admin/catalog')
+    else:
+        with open(args.dataset, 'r', encoding='utf-8') as f:
+            dataset = json.load(f)
+        failed = 0
+        for product in dataset:
+            product_id, info = dataset_product(product)
+            images = []
+            if args.images_dir:
+                images = (image_files(os.path.join(args.images_dir, product.get('sku', '')))
+                          or image_files(os.path.join(args.images_dir, product_id)))
+            status, payload = upsert_product(args, product_id, info, images, replace=bool(images))
+            ok = status == 200
+            failed += not ok
+            print(f"{'✅' if ok else '❌'} {product_id} ({len(images)} muestras)"
+                  + ('' if ok else f": {payload.get('error')}"))
+        print(f"🎉 {len(dataset) - failed} productos importados ({failed} con error)")
+        return 1 if failed else 0
+
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+    return 0 if status < 400 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
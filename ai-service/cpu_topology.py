@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Topología de CPU de SCANIX AI Service: hilos de torch, pinning de workers y réplicas por nodo NUMA
+
+Con la configuración por defecto de PyTorch cada proceso usa un hilo intra-op
+por núcleo: en un servidor de 32 núcleos, dos requests simultáneos en
+workers distintos ya piden 64 hilos y la latencia se desploma. Acá:
+
+- Hilos intra-op (SCANIX_TORCH_THREADS) e inter-op
+  (SCANIX_TORCH_INTEROP_THREADS) por worker.
+- Pinning (SCANIX_PIN_WORKERS): 'cores' fija cada worker a su propio bloque
+  de núcleos (primero núcleos físicos, después los hermanos de
+  hyper-threading), 'node' a todos los núcleos de su nodo NUMA, 'none' no
+  toca la afinidad. El bloque sale de un slot estable por worker, así un
+  worker que gunicorn reinicia vuelve a los mismos núcleos.
+- Réplicas por nodo NUMA: `python cpu_topology.py serve` levanta un master
+  de gunicorn por nodo (SCANIX_NUMA_NODE), fijado a ese nodo antes de
+  cargar los modelos. Cada réplica queda en la memoria local de su nodo y
+  la comparten (copy-on-write) solo los workers de ese nodo; los masters
+  escuchan en el mismo puerto con SO_REUSEPORT.
+- `python cpu_topology.py calibrate` barre hilos x workers en el host real
+  y recomienda la combinación de mayor throughput.
+
+Uso:
+    python cpu_topology.py show
+    python cpu_topology.py calibrate --threads 1,2,4,8 --seconds 10
+    python cpu_topology.py serve -- -c gunicorn.conf.py wsgi:app
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+PIN_MODES = ('none', 'cores', 'node')
+NODE_DIR = '/sys/devices/system/node'
+
+# Lo que configure_worker aplicó en este proceso (para /health)
+_worker = {}
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def format_cpulist(cpus):
+    """[0, 1, 2, 3, 8] -> '0-3,8'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(a) if a == b else f'{a}-{b}' for a, b in ranges)
+
+
+def allowed_cpus():
+    """Núcleos que el proceso puede usar (afinidad / cgroup)"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # sin sched_getaffinity (macOS)
+        return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes():
+    """{nodo: [núcleos permitidos]}; un solo nodo si el kernel no expone NUMA"""
+    allowed = set(allowed_cpus())
+    nodes = {}
+    for path in sorted(glob.glob(os.path.join(NODE_DIR, 'node[0-9]*', 'cpulist'))):
+        node = int(os.path.basename(os.path.dirname(path))[len('node'):])
+        with open(path, 'r', encoding='utf-8') as f:
+            cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in allowed]
+        if cpus:
+            nodes[node] = cpus
+    return nodes or {0: sorted(allowed)}
+
+
+def physical_first(cpus):
+    """Núcleos ordenados con un hilo por núcleo físico primero y los hermanos de HT al final"""
+    def sibling_rank(cpu):
+        path = f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list'
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                siblings = parse_cpulist(f.read())
+        except OSError:
+            return 0
+        return siblings.index(cpu) if cpu in siblings else 0
+
+    return sorted(cpus, key=lambda cpu: (sibling_rank(cpu), cpu))
+
+
+def topology_cpus(node=None):
+    """Núcleos del nodo NUMA pedido (o todos los permitidos)"""
+    if node is None or node == '':
+        return allowed_cpus()
+    nodes = numa_nodes()
+    if int(node) not in nodes:
+        raise ValueError(f"Nodo NUMA {node} inexistente (nodos: {', '.join(map(str, nodes))})")
+    return nodes[int(node)]
+
+
+def worker_cpus(slot, workers, threads, cpus, mode='cores'):
+    """Núcleos del worker `slot` de `workers`, o None si no se fija la afinidad"""
+    if mode == 'none':
+        return None
+    if mode == 'node':
+        return sorted(cpus)
+    if mode != 'cores':
+        raise ValueError(f"Pinning desconocido: {mode} (opciones: {', '.join(PIN_MODES)})")
+    ordered = physical_first(cpus)
+    # Bloques contiguos de `threads` núcleos; si hay más workers que bloques se reparten circularmente
+    blocks = max(1, len(ordered) // max(1, threads))
+    start = (slot % blocks) * threads
+    return sorted(ordered[start:start + threads] or ordered)
+
+
+def free_slot(used, workers):
+    """Primer slot libre (los de los workers vivos están en `used`)"""
+    used = set(used)
+    return next((slot for slot in range(workers) if slot not in used), len(used))
+
+
+def pin(cpus):
+    """Fijar la afinidad del proceso (y de los hilos que cree después)"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+
+def configure_torch(threads, interop_threads=None):
+    """Hilos intra-op / inter-op de torch en este proceso (si torch está instalado)"""
+    try:
+        import torch
+    except ImportError:
+        return None, None
+    torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Ya fijado o con trabajo inter-op iniciado: queda el valor anterior
+            pass
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+def configure_worker(slot, workers, threads, interop_threads=1, mode='none', node=None):
+    """Pinning + hilos de torch de un worker; devuelve lo aplicado"""
+    cpus = worker_cpus(slot, workers, threads, topology_cpus(node), mode)
+    pin(cpus)
+    configure_torch(threads, interop_threads)
+    _worker.update(slot=slot, workers=workers, threads=threads, pinning=mode, numa_node=node if node not in (None, '') else None)
+    return describe()
+
+
+def intra_op_threads():
+    """Hilos intra-op de un proceso worker (para los pools que no son de torch, p. ej. ONNX Runtime).
+
+    Lo de configure_worker, si no SCANIX_TORCH_THREADS / OMP_NUM_THREADS (gunicorn.conf.py
+    los fija antes de cargar los modelos en el master), si no lo que use torch.
+    """
+    if _worker.get('threads'):
+        return _worker['threads']
+    for var in ('SCANIX_TORCH_THREADS', 'OMP_NUM_THREADS'):
+        if os.environ.get(var):
+            return int(os.environ[var])
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        return torch.get_num_threads()
+    return len(allowed_cpus())
+
+
+def worker_count():
+    """Workers que atienden el mismo puerto (gunicorn vía configure_worker, uvicorn vía WEB_CONCURRENCY)"""
+    return _worker.get('workers') or int(os.environ.get('WEB_CONCURRENCY') or 1)
+
+
+def describe():
+    """Topología activa del proceso (para /health)"""
+    torch = sys.modules.get('torch')
+    nodes = numa_nodes()
+    return {
+        'pid': os.getpid(),
+        'cpus': format_cpulist(allowed_cpus()),
+        'numa_nodes': {str(node): format_cpulist(cpus) for node, cpus in nodes.items()},
+        'numa_node': _worker.get('numa_node', os.environ.get('SCANIX_NUMA_NODE') or None),
+        'slot': _worker.get('slot'),
+        'workers': _worker.get('workers'),
+        'pinning': _worker.get('pinning', 'none'),
+        'torch_threads': torch.get_num_threads() if torch is not None else None,
+        'torch_interop_threads': torch.get_num_interop_threads() if torch is not None else None
+    }
+
+
+# Calibración
+
+def synthetic_workload():
+    """Carga aproximada sin modelos: convoluciones del tamaño de un YOLO chico a 640"""
+    import torch
+
+    torch.manual_seed(0)
+    layers = []
+    channels = 3
+    for width in (16, 32, 64, 128, 256):
+        layers += [torch.nn.Conv2d(channels, width, 3, stride=2, padding=1), torch.nn.SiLU()]
+        channels = width
+    model = torch.nn.Sequential(*layers).eval()
+    batch = torch.rand(1, 3, 640, 640)
+
+    def run():
+        with torch.inference_mode():
+            model(batch)
+    return run
+
+
+def model_workload():
+    """YOLO a la resolución de entrada + CLIP con un batch de 8 cajas (como el warm-up)"""
+    import numpy as np
+
+    import app as service
+
+    if not service.load_models(warmup=False):
+        raise RuntimeError("No se pudieron cargar los modelos")
+    rng = np.random.default_rng(0)
+    size = service.DECODE_TARGET_SIZE
+    image = rng.integers(0, 256, (size * 3 // 4, size, 3), dtype=np.uint8)
+    boxes = np.tile(np.array([[0, 0, size // 2, size * 3 // 8]], dtype=np.float32), (8, 1))
+
+    def run():
+        service.detector.detect([image])
+        encoder = service.image_encoder
+        encoder.encode([encoder.pixel_values(encoder.prepare(image), boxes)])
+    return run
+
+
+def _calibration_worker(run, slot, workers, threads, mode, start_at, seconds, results):
+    configure_worker(slot, workers, threads, 1, mode)
+    run()  # warm-up (pools de hilos, allocator)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    latencies = []
+    end = start_at + seconds
+    while time.time() < end:
+        begin = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - begin)
+    results.put(latencies)
+
+
+def measure_layout(run, workers, threads, mode='cores', seconds=10.0):
+    """Throughput (inferencias/s) y latencias de `workers` procesos con `threads` hilos cada uno"""
+    import multiprocessing
+
+    import numpy as np
+
+    # fork, como gunicorn con preload: los modelos se cargan una vez en el padre
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start_at = time.time() + 2.0 + 0.2 * workers
+    processes = [context.Process(target=_calibration_worker,
+                                 args=(run, slot, workers, threads, mode, start_at, seconds, results))
+                 for slot in range(workers)]
+    for process in processes:
+        process.start()
+    latencies = [latency for _ in processes for latency in results.get()]
+    for process in processes:
+        process.join()
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'workers': workers,
+        'threads': threads,
+        'pinning': mode,
+        'rps': len(latencies) / seconds,
+        'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies) else None,
+        'p95_ms': float(np.percentile(latencies_ms, 95)) if len(latencies) else None
+    }
+
+
+def candidate_layouts(cpus, threads_options):
+    """(workers, threads) a probar: para cada cantidad de hilos, workers en potencias de 2 hasta llenar los núcleos"""
+    layouts = []
+    for threads in threads_options:
+        if threads > cpus:
+            continue
+        most = max(1, cpus // threads)
+        workers = 1
+        options = set()
+        while workers < most:
+            options.add(workers)
+            workers *= 2
+        options.add(most)
+        layouts.extend((count, threads) for count in sorted(options))
+    return layouts
+
+
+def recommend(results, max_p95_ms=None):
+    """Mejor resultado por throughput (respetando el p95 máximo si se pidió)"""
+    eligible = [r for r in results if max_p95_ms is None or (r['p95_ms'] is not None and r['p95_ms'] <= max_p95_ms)]
+    return max(eligible or results, key=lambda r: r['rps'])
+
+
+def calibrate(threads_options, seconds=10.0, mode='cores', synthetic=False, max_p95_ms=None, node=None):
+    """Barrer hilos x workers en este host; devuelve (resultados, recomendado)"""
+    cpus = topology_cpus(node)
+    pin(cpus)
+    run = synthetic_workload() if synthetic else model_workload()
+    results = []
+    for workers, threads in candidate_layouts(len(cpus), threads_options):
+        result = measure_layout(run, workers, threads, mode, seconds)
+        results.append(result)
+        print(f"  {workers:3d} workers x {threads:2d} hilos: {result['rps']:8.2f} inf/s, "
+              f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms")
+    return results, recommend(results, max_p95_ms)
+
+
+# Réplicas por nodo NUMA
+
+def serve(gunicorn_args):
+    """Un master de gunicorn por nodo NUMA (o exec de gunicorn si hay un solo nodo)"""
+    nodes = numa_nodes()
+    command = [sys.executable, '-m', 'gunicorn', *gunicorn_args]
+    if len(nodes) == 1:
+        os.execv(sys.executable, command)
+
+    numactl = shutil.which('numactl')
+    processes = []
+    for node in nodes:
+        env = {**os.environ, 'SCANIX_NUMA_NODE': str(node)}
+        # numactl además liga la memoria al nodo; sin él alcanza con la afinidad (first-touch)
+        prefix = [numactl, f'--cpunodebind={node}', f'--membind={node}'] if numactl else []
+        processes.append(subprocess.Popen(prefix + command, env=env))
+        print(f"🚀 Réplica en nodo NUMA {node}: núcleos {format_cpulist(nodes[node])} (pid {processes[-1].pid})")
+
+    def forward(signum, frame):
+        for process in processes:
+            process.send_signal(signum)
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, forward)
+    return max(process.wait() for process in processes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Topología de CPU de SCANIX AI Service')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    show_parser = subparsers.add_parser('show', help='Núcleos, nodos NUMA y reparto de workers')
+    show_parser.add_argument('--workers', type=int, default=None)
+    show_parser.add_argument('--threads', type=int, default=int(os.environ.get('SCANIX_TORCH_THREADS', 1)))
+    show_parser.add_argument('--pin', choices=PIN_MODES, default='cores')
+
+    calibrate_parser = subparsers.add_parser('calibrate', help='Barrer hilos x workers y recomendar la topología')
+    calibrate_parser.add_argument('--threads', default='1,2,4,8', help='Hilos intra-op a probar (separados por coma)')
+    calibrate_parser.add_argument('--seconds', type=float, default=10.0, help='Duración de cada medición')
+    calibrate_parser.add_argument('--pin', choices=PIN_MODES, default='cores')
+    calibrate_parser.add_argument('--node', default=None, help='Calibrar dentro de un nodo NUMA')
+    calibrate_parser.add_argument('--max-p95-ms', type=float, default=None, help='Descartar combinaciones con p95 mayor')
+    calibrate_parser.add_argument('--synthetic', action='store_true', help='Carga sintética (sin modelos)')
+    calibrate_parser.add_argument('--out', default=None, help='Guardar resultados en JSON')
+
+    serve_parser = subparsers.add_parser('serve', help='Un master de gunicorn (réplica de modelos) por nodo NUMA')
+    serve_parser.add_argument('gunicorn_args', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        nodes = numa_nodes()
+        for node, cpus in nodes.items():
+            workers = args.workers or max(1, len(cpus) // args.threads)
+            print(f"🧠 Nodo {node}: {len(cpus)} núcleos ({format_cpulist(cpus)}), {workers} workers x {args.threads} hilos")
+            for slot in range(workers):
+                assigned = worker_cpus(slot, workers, args.threads, cpus, args.pin)
+                print(f"   worker {slot}: {format_cpulist(assigned) if assigned else 'sin pinning'}")
+        return 0
+
+    if args.command == 'calibrate':
+        threads_options = [int(value) for value in args.threads.split(',') if value]
+        print(f"⏱️ Calibrando en {len(topology_cpus(args.node))} núcleos ({'sintético' if args.synthetic else 'modelos'})")
+        results, best = calibrate(threads_options, args.seconds, args.pin, args.synthetic, args.max_p95_ms, args.node)
+        print(f"✅ Recomendado: {best['workers']} workers x {best['threads']} hilos "
+              f"({best['rps']:.2f} inf/s, p95 {best['p95_ms']:.1f} ms)")
+        nodes = len(numa_nodes()) if args.node is None else 1
+        print(f"   SCANIX_WORKERS={best['workers'] // nodes if nodes > 1 else best['workers']} "
+              f"SCANIX_TORCH_THREADS={best['threads']} SCANIX_PIN_WORKERS={args.pin}")
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump({'cpus': len(topology_cpus(args.node)), 'numa_nodes': nodes, 'results': results,
+                           'recommended': best}, f, indent=2)
+        return 0
+
+    gunicorn_args = args.gunicorn_args[1:] if args.gunicorn_args[:1] == ['--'] else args.gunicorn_args
+    return serve(gunicorn_args or ['-c', 'gunicorn.conf.py', 'wsgi:app'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Cache de embeddings CLIP por hash perceptual del ROI
+
+En el mostrador aparecen una y otra vez los mismos productos con recortes casi
+idénticos. Cada ROI se reduce a un dHash (a partir de los promedios por bloque
+que arma el encoder, ver dhash_from_blocks) y, si hay un embedding guardado a
+distancia de Hamming <= tolerancia, se reutiliza sin pasar por CLIP.
+Desalojo LRU acotado por cantidad de entradas, memoria y TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Cantidad de bits en 1 por byte, para contar la distancia de Hamming
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dhash_from_blocks(blocks):
+    """dHash de varios ROIs a la vez a partir de sus promedios (N, hash_size, hash_size + 1)"""
+    blocks = np.asarray(blocks)
+    bits = np.packbits((blocks[:, :, 1:] > blocks[:, :, :-1]).reshape(len(blocks), -1), axis=1)
+    return [row.tobytes() for row in bits]
+
+
+class EmbeddingCache:
+    """LRU de embeddings indexado por dHash, con tolerancia de Hamming, TTL y tope de memoria"""
+
+    def __init__(self, max_entries=4096, max_bytes=64 * 1024 * 1024, ttl_seconds=3600, tolerance=8):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.tolerance = tolerance
+        self._entries = OrderedDict()  # hash -> (embedding, timestamp)
+        self._lock = threading.Lock()
+        self._nbytes = 0
+        # Matriz de hashes para la búsqueda por Hamming: cada hash tiene su fila (slot) fija
+        # y las filas de entradas desalojadas se reutilizan, así put/_remove son O(1)
+        self._slots = {}  # hash -> fila
+        self._slot_keys = []  # fila -> hash (None si está libre)
+        self._free = []
+        self._hash_matrix = None
+        self._valid = np.zeros(0, dtype=bool)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _nearest(self, key):
+        if key in self._entries:
+            return key
+        if self.tolerance <= 0 or not self._entries:
+            return None
+
+        rows = len(self._slot_keys)
+        query = np.frombuffer(key, dtype=np.uint8)
+        distances = _POPCOUNT[self._hash_matrix[:rows] ^ query].sum(axis=1, dtype=np.int32)
+        distances[~self._valid[:rows]] = np.iinfo(np.int32).max
+        best = int(np.argmin(distances))
+        return self._slot_keys[best] if distances[best] <= self.tolerance else None
+
+    def _add_slot(self, key):
+        """Fila para un hash nuevo: una libre o una al final (la matriz crece al doble)"""
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._slot_keys)
+            self._slot_keys.append(None)
+            if self._hash_matrix is None or slot >= len(self._hash_matrix):
+                capacity = max(64, 2 * slot)
+                matrix = np.zeros((capacity, len(key)), dtype=np.uint8)
+                valid = np.zeros(capacity, dtype=bool)
+                if self._hash_matrix is not None:
+                    matrix[:slot] = self._hash_matrix[:slot]
+                    valid[:slot] = self._valid[:slot]
+                self._hash_matrix, self._valid = matrix, valid
+        self._hash_matrix[slot] = np.frombuffer(key, dtype=np.uint8)
+        self._valid[slot] = True
+        self._slot_keys[slot] = key
+        self._slots[key] = slot
+
+    def _remove(self, key):
+        embedding, _ = self._entries.pop(key)
+        self._nbytes -= embedding.nbytes
+        slot = self._slots.pop(key)
+        self._valid[slot] = False
+        self._slot_keys[slot] = None
+        self._free.append(slot)
+
+    def get(self, key):
+        """Embedding guardado para un hash (o uno a distancia <= tolerancia), o None"""
+        with self._lock:
+            match = self._nearest(key)
+            if match is not None:
+                embedding, timestamp = self._entries[match]
+                if time.monotonic() - timestamp <= self.ttl:
+                    self._entries.move_to_end(match)
+                    self.hits += 1
+                    return embedding
+                self._remove(match)
+            self.misses += 1
+            return None
+
+    def put(self, key, embedding):
+        """Guardar un embedding, desalojando los menos usados si hace falta"""
+        embedding = np.array(embedding, dtype=np.float32)
+        with self._lock:
+            if key in self._entries:
+                # Mismo hash: se reemplaza el embedding, la fila de la matriz no cambia
+                self._nbytes -= self._entries[key][0].nbytes
+                self._entries.move_to_end(key)
+            else:
+                self._add_slot(key)
+            self._entries[key] = (embedding, time.monotonic())
+            self._nbytes += embedding.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Índice vectorizado de embeddings CLIP para SCANIX
+
+Carga una sola vez los embeddings del knowledge base (prototipo medio + cada
+muestra de cada producto), los normaliza L2 en una matriz float32 contigua y
+resuelve las búsquedas por similitud coseno con un único producto matricial.
+
+Para catálogos grandes los embeddings pueden guardarse comprimidos:
+
+- 'fp16': la mitad de memoria; se convierten a float32 por bloques chicos
+  (que quedan en cache) y se acumula en float32.
+- 'pq': el centro (media) de cada producto en float32 más el residuo de cada
+  fila con product quantization, m bytes por fila (D/8 por defecto). La
+  similitud del residuo se estima con tablas de lookup por query, sin
+  descomprimir; con ~30 muestras por producto ocupa ~1/15 de float32.
+
+Aparte de las filas de imagen, el índice puede llevar una fila de texto por
+producto (prototipos de CLIP, ver text_prototypes.py) en una matriz chica
+propia, siempre float32. La similitud imagen-texto es mucho menor que la
+imagen-imagen: para ordenar y comparar con el umbral cuenta multiplicada por
+text_scale (el puntaje), pero la similitud que se informa es el coseno real.
+
+Uso:
+    python embedding_index.py evaluate --precision fp16,pq
+    python embedding_index.py evaluate --synthetic 100000 --precision fp16,pq --pq-m 32,64
+"""
+
+import argparse
+import copy
+import json
+import sys
+import time
+
+import numpy as np
+
+from product_quantization import ProductQuantizer
+
+PRECISIONS = ('fp32', 'fp16', 'pq')
+# Filas por bloque al convertir float16 -> float32 antes del matmul
+FP16_BLOCK_ROWS = 1024
+
+
+def normalize_rows(vectors):
+    """Normalizar L2 cada fila de una matriz (devuelve float32 contiguo)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms)
+
+
+class EmbeddingIndex:
+    """Búsqueda exacta top-k por similitud coseno sobre los productos del knowledge base"""
+
+    def __init__(self, embeddings, labels, product_ids, normalized=False, pq=None, centers=None,
+                 text_vectors=None, text_labels=None, text_scale=1.0):
+        # Matriz (N, D) normalizada, float32 o float16; filas agrupadas por producto.
+        # Con normalized=True se usa tal cual (p. ej. un np.memmap del bundle compilado).
+        # Con pq, embeddings son los códigos (N, m) uint8 del residuo de cada fila
+        # contra el centro (P, D) de su producto
+        self.pq = pq
+        if pq is not None:
+            self.embeddings = None
+            # Transpuestos (m, N): cada subespacio es contiguo para el recorrido ADC
+            self.codes = np.ascontiguousarray(np.asarray(embeddings, dtype=np.uint8).T)
+            self.centers = np.ascontiguousarray(centers, dtype=np.float32)
+        else:
+            self.embeddings = embeddings if normalized else normalize_rows(embeddings)
+            self.codes = self.centers = None
+        # Índice de fila -> posición del producto en product_ids
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.product_ids = np.asarray(product_ids, dtype=object)
+
+        rows = self.codes.shape[1] if pq is not None else len(self.embeddings)
+        if len(self.labels) != rows:
+            raise ValueError("La cantidad de etiquetas no coincide con la de embeddings")
+        if len(self.labels) and np.any(np.diff(self.labels) < 0):
+            raise ValueError("Las filas del índice deben estar agrupadas por producto")
+
+        # Primera fila de cada producto, para reducir similitudes por producto
+        self.offsets = np.flatnonzero(np.r_[True, np.diff(self.labels) != 0])
+
+        # Filas de texto (T, D) normalizadas, a lo sumo una por producto, y su factor de puntaje
+        self.text_vectors = None if text_vectors is None else np.ascontiguousarray(text_vectors, dtype=np.float32)
+        self.text_labels = None if text_labels is None else np.asarray(text_labels, dtype=np.int32)
+        self.text_scale = float(text_scale)
+
+    @classmethod
+    def from_knowledge_base(cls, knowledge_base, include_samples=True):
+        """Construir el índice desde knowledge_base.pkl ({product_id: {'embeddings', 'mean_embedding', ...}})"""
+        rows = []
+        labels = []
+        product_ids = []
+
+        for product_id, entry in knowledge_base.items():
+            vectors = []
+            mean = entry.get('mean_embedding')
+            if mean is not None:
+                vectors.append(np.asarray(mean, dtype=np.float32).reshape(1, -1))
+            samples = entry.get('embeddings')
+            if include_samples and samples is not None and len(samples):
+                vectors.append(np.asarray(samples, dtype=np.float32).reshape(len(samples), -1))
+            if not vectors:
+                continue
+
+            vectors = np.concatenate(vectors)
+            vectors = vectors[np.isfinite(vectors).all(axis=1)]
+            if not len(vectors):
+                continue
+
+            rows.append(vectors)
+            labels.append(np.full(len(vectors), len(product_ids), dtype=np.int32))
+            product_ids.append(product_id)
+
+        if not rows:
+            raise ValueError("El knowledge base no contiene embeddings")
+
+        return cls(np.concatenate(rows), np.concatenate(labels), product_ids)
+
+    @property
+    def dimension(self):
+        return self.pq.dimension if self.pq is not None else self.embeddings.shape[1]
+
+    @property
+    def precision(self):
+        if self.pq is not None:
+            return 'pq'
+        return 'fp16' if self.embeddings.dtype == np.float16 else 'fp32'
+
+    @property
+    def nbytes(self):
+        """Memoria de los vectores (o códigos, centros y codebooks), filas de texto y etiquetas"""
+        if self.pq is not None:
+            vectors = self.codes.nbytes + self.centers.nbytes + self.pq.codebooks.nbytes
+        else:
+            vectors = self.embeddings.nbytes
+        if self.text_vectors is not None:
+            vectors += self.text_vectors.nbytes + self.text_labels.nbytes
+        return int(vectors + self.labels.nbytes)
+
+    @property
+    def _text(self):
+        """Argumentos del constructor para conservar las filas de texto"""
+        return {'text_vectors': self.text_vectors, 'text_labels': self.text_labels, 'text_scale': self.text_scale}
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def vectors(self, rows=None):
+        """Filas de imagen como float32 (aproximadas si el índice está comprimido)"""
+        rows = slice(None) if rows is None else rows
+        if self.pq is not None:
+            return self.pq.decode(self.codes[:, rows].T) + self.centers[self.labels[rows]]
+        return np.asarray(self.embeddings[rows], dtype=np.float32)
+
+    def compress(self, precision, m=None, seed=0):
+        """Índice con las mismas filas en otra representación ('fp32', 'fp16' o 'pq' con m subespacios)"""
+        if precision not in PRECISIONS:
+            raise ValueError(f"Precisión desconocida: {precision} (opciones: {', '.join(PRECISIONS)})")
+        embeddings = self.vectors()
+        if precision == 'pq':
+            centers = product_centers(embeddings, self.labels, len(self.product_ids))
+            residuals = embeddings - centers[self.labels]
+            pq = ProductQuantizer.train(residuals, m or max(1, self.dimension // 8), seed=seed)
+            return EmbeddingIndex(pq.encode(residuals), self.labels, self.product_ids, pq=pq, centers=centers,
+                                  **self._text)
+        dtype = np.float16 if precision == 'fp16' else np.float32
+        return EmbeddingIndex(embeddings.astype(dtype), self.labels, self.product_ids, normalized=True, **self._text)
+
+    def with_rows(self, embeddings, labels, product_ids, text_vectors=None, text_labels=None):
+        """Índice nuevo sobre otras filas normalizadas, en la misma representación (y mismos codebooks PQ)"""
+        text = {'text_vectors': text_vectors, 'text_labels': text_labels, 'text_scale': self.text_scale}
+        if self.pq is not None:
+            centers = product_centers(embeddings, labels, len(product_ids))
+            return EmbeddingIndex(self.pq.encode(embeddings - centers[labels]), labels, product_ids,
+                                  pq=self.pq, centers=centers, **text)
+        dtype = np.float16 if self.precision == 'fp16' else np.float32
+        return EmbeddingIndex(np.ascontiguousarray(embeddings, dtype=dtype), labels, product_ids, normalized=True,
+                              **text)
+
+    def with_text(self, product_ids, text_vectors, text_labels, text_scale):
+        """Mismo índice (las filas de imagen no se copian) con filas de texto; product_ids
+        puede agregar al final productos que solo tienen fila de texto"""
+        index = copy.copy(self)
+        index.product_ids = np.asarray(product_ids, dtype=object)
+        index.text_vectors = normalize_rows(text_vectors)
+        index.text_labels = np.asarray(text_labels, dtype=np.int32)
+        index.text_scale = float(text_scale)
+        return index
+
+    def product_similarities(self, queries):
+        """Puntaje (Q, P) de cada query ya normalizada contra cada producto (ver product_scores)"""
+        return self.product_scores(queries)[0]
+
+    def product_scores(self, queries):
+        """(puntajes (Q, P), de_texto (Q, P) o None) de queries ya normalizadas.
+
+        El puntaje de un producto es la similitud máxima entre sus filas de
+        imagen, o la de su fila de texto por text_scale si es mayor; de_texto
+        marca esos casos (ver similarities).
+        """
+        scores = self._image_similarities(queries)
+        if self.text_vectors is None:
+            return scores, None
+        text = queries @ self.text_vectors.T
+        text *= self.text_scale
+        image = scores[:, self.text_labels]
+        from_text = np.zeros(scores.shape, dtype=bool)
+        from_text[:, self.text_labels] = text > image
+        scores[:, self.text_labels] = np.maximum(image, text)
+        return scores, from_text
+
+    def similarities(self, scores, from_text):
+        """Similitud coseno que se informa para puntajes de product_scores (el de texto, sin escalar)"""
+        if from_text is None:
+            return scores
+        return np.where(from_text, scores / np.float32(self.text_scale), scores)
+
+    def _image_similarities(self, queries):
+        """Similitud (Q, P) contra las filas de imagen de cada producto (-inf si no tiene)"""
+        if not len(self.labels):
+            return np.full((len(queries), len(self.product_ids)), -np.inf, dtype=np.float32)
+        if self.pq is not None:
+            similarities = self.pq.scan(self.pq.lookup(queries), self.codes)
+        elif self.embeddings.dtype == np.float32:
+            # Similitud coseno contra todas las filas en un solo matmul
+            similarities = queries @ self.embeddings.T
+        else:
+            similarities = self._fp16_similarities(queries)
+
+        if len(self.offsets) != len(self.labels):
+            similarities = np.maximum.reduceat(similarities, self.offsets, axis=1)
+        present = self.labels[self.offsets]
+        if self.pq is not None:
+            # El centro es el mismo para todas las filas del producto: se suma después del máximo
+            similarities += queries @ self.centers[present].T
+        if len(present) != len(self.product_ids):
+            # Productos sin filas de imagen (solo texto)
+            scattered = np.full((len(queries), len(self.product_ids)), -np.inf, dtype=np.float32)
+            scattered[:, present] = similarities
+            similarities = scattered
+        return similarities
+
+    def _fp16_similarities(self, queries):
+        """Matmul contra filas float16: convertidas de a bloques a un buffer float32 reutilizado"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        n = len(self.embeddings)
+        out = np.empty((len(queries), n), dtype=np.float32)
+        buffer = np.empty((min(FP16_BLOCK_ROWS, n), self.dimension), dtype=np.float32)
+        for start in range(0, n, FP16_BLOCK_ROWS):
+            block = self.embeddings[start:start + FP16_BLOCK_ROWS]
+            np.copyto(buffer[:len(block)], block)
+            np.matmul(queries, buffer[:len(block)].T, out=out[:, start:start + len(block)])
+        return out
+
+    def search(self, queries, k=1):
+        """Top-k productos más similares para cada query.
+
+        Devuelve (similitudes, product_ids), ambos de forma (Q, k) y ordenados
+        de mayor a menor similitud. La similitud de un producto es la máxima
+        entre su prototipo y sus muestras.
+        """
+        _, similarities, product_ids = self.search_scores(queries, k)
+        return similarities, product_ids
+
+    def search_scores(self, queries, k=1):
+        """Como search, con el puntaje por el que se ordenó: (puntajes, similitudes, product_ids)"""
+        scores, from_text = self.product_scores(normalize_rows(queries))
+        top_scores, top = top_k(scores, k)
+        if from_text is not None:
+            from_text = np.take_along_axis(from_text, top, axis=1)
+        return top_scores, self.similarities(top_scores, from_text), self.product_ids[top]
+
+
+def product_centers(embeddings, labels, num_products):
+    """Media (P, D) de las filas de cada producto (filas agrupadas por producto)"""
+    centers = np.zeros((num_products, embeddings.shape[1]), dtype=np.float32)
+    if len(labels):
+        offsets = np.flatnonzero(np.r_[True, np.diff(labels) != 0])
+        counts = np.diff(np.r_[offsets, len(labels)])
+        centers[labels[offsets]] = np.add.reduceat(embeddings, offsets, axis=0) / counts[:, None]
+    return centers
+
+
+def top_k(similarities, k):
+    """(similitudes, columnas) de los k mayores valores de cada fila, de mayor a menor"""
+    k = min(k, similarities.shape[1])
+    if k < similarities.shape[1]:
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(similarities.shape[1]), similarities.shape)
+    top_similarities = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_similarities, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    return np.take_along_axis(top_similarities, order, axis=1), top
+
+
+def probe_queries(index, count=500, noise=0.5, seed=0):
+    """Queries de prueba: filas del índice con ruido gaussiano de norma ~noise, normalizadas"""
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(index.labels), min(count, len(index.labels)), replace=False))
+    perturbation = rng.normal(size=(len(rows), index.dimension)).astype(np.float32) / np.sqrt(index.dimension)
+    return normalize_rows(index.vectors(rows) + noise * perturbation)
+
+
+def compression_report(exact, compressed, queries, k=5, batch_size=16):
+    """Precisión del índice comprimido contra el exacto: acuerdo top-1, recall@k,
+    deriva de la similitud de los productos correctos, memoria y latencia por lote"""
+    timings = {'exact': 0.0, 'compressed': 0.0}
+    agreement, recall, drift = [], [], []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        results = {}
+        for name, index in (('exact', exact), ('compressed', compressed)):
+            began = time.perf_counter()
+            results[name] = index.product_similarities(batch)
+            timings[name] += time.perf_counter() - began
+        exact_similarities, exact_top = top_k(results['exact'], k)
+        _, top = top_k(results['compressed'], k)
+        agreement.append(top[:, 0] == exact_top[:, 0])
+        recall.extend(len(set(a) & set(e)) / len(e) for a, e in zip(top.tolist(), exact_top.tolist()))
+        drift.append(np.abs(np.take_along_axis(results['compressed'], exact_top, axis=1) - exact_similarities))
+
+    drift = np.concatenate(drift)
+    batches = -(-len(queries) // batch_size)
+    report = {
+        'precision': compressed.precision,
+        'bytes': compressed.nbytes,
+        'exact_bytes': exact.nbytes,
+        'compression': round(exact.nbytes / compressed.nbytes, 2),
+        'top1_agreement': round(float(np.mean(np.concatenate(agreement))), 4),
+        f'recall@{k}': round(float(np.mean(recall)), 4),
+        'mean_similarity_drift': round(float(drift.mean()), 5),
+        'max_similarity_drift': round(float(drift.max()), 5),
+        'batch_ms': round(timings['compressed'] / batches * 1000, 3),
+        'exact_batch_ms': round(timings['exact'] / batches * 1000, 3)
+    }
+    if compressed.pq is not None:
+        report['m'] = compressed.pq.m
+    return report
+
+
+def select_precision(index, precision, m=None, min_agreement=0.98, max_drift=0.02, queries=None):
+    """(índice, reporte): el comprimido si pasa el gate de precisión, si no el original"""
+    report = {'requested': precision, 'active': index.precision}
+    if precision == index.precision:
+        return index, report
+
+    try:
+        compressed = index.compress(precision, m)
+        if queries is None:
+            queries = probe_queries(index)
+        report.update(compression_report(index, compressed, queries))
+    except Exception as e:
+        report['reason'] = f"error comprimiendo: {e}"
+        return index, report
+
+    report['ok'] = report['top1_agreement'] >= min_agreement and report['mean_similarity_drift'] <= max_drift
+    if not report['ok']:
+        report['reason'] = (f"acuerdo top-1 {report['top1_agreement']:.3f} (mínimo {min_agreement}), "
+                            f"deriva media {report['mean_similarity_drift']:.4f} (máximo {max_drift})")
+        return index, report
+
+    report['active'] = compressed.precision
+    return compressed, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Representaciones comprimidas del knowledge base')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='Memoria, precisión y latencia contra float32')
+    evaluate_parser.add_argument('--kb', default='models/knowledge_base.pkl')
+    evaluate_parser.add_argument('--mapping', default='models/product_mapping.json')
+    evaluate_parser.add_argument('--bundle', default='models/knowledge_base.scxkb')
+    evaluate_parser.add_argument('--synthetic', type=int, default=0, help='Catálogo sintético con N vectores')
+    evaluate_parser.add_argument('--products', type=int, default=0, help='Productos del catálogo sintético (N/10)')
+    evaluate_parser.add_argument('--precision', default='fp16,pq')
+    evaluate_parser.add_argument('--pq-m', default='', help='Subespacios de PQ a probar (por defecto D/8)')
+    evaluate_parser.add_argument('--queries', type=int, default=500)
+    evaluate_parser.add_argument('--noise', type=float, default=0.5, help='Ruido sobre las filas usadas como queries')
+    evaluate_parser.add_argument('--k', type=int, default=5)
+    evaluate_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from ann_index import load_exact_index, synthetic_catalog
+
+    if args.synthetic:
+        exact, _ = synthetic_catalog(args.synthetic, args.products or max(1, args.synthetic // 10), seed=args.seed)
+    else:
+        exact, _ = load_exact_index(args.kb, args.mapping, args.bundle)
+    exact = exact.compress('fp32')
+    queries = probe_queries(exact, args.queries, args.noise, args.seed + 1)
+
+    reports = []
+    for precision in args.precision.split(','):
+        for m in ([int(v) for v in args.pq_m.split(',') if v] or [None]) if precision == 'pq' else [None]:
+            start = time.perf_counter()
+            compressed = exact.compress(precision, m, seed=args.seed)
+            report = compression_report(exact, compressed, queries, args.k)
+            report['build_seconds'] = round(time.perf_counter() - start, 2)
+            reports.append(report)
+
+    print(json.dumps({'vectors': len(exact.labels), 'products': len(exact), 'dimension': exact.dimension,
+                      'results': reports}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+Configuración de gunicorn para SCANIX AI Service
+
+Variables de entorno:
+    SCANIX_BIND           dirección de escucha (default 0.0.0.0:5001)
+    SCANIX_WORKERS        cantidad de procesos worker (default núcleos / hilos de torch)
+    SCANIX_TORCH_THREADS  hilos intra-op de torch por worker (default 1)
+    SCANIX_TORCH_INTEROP_THREADS  hilos inter-op de torch por worker (default 1)
+    SCANIX_PIN_WORKERS    afinidad de cada worker: 'none' (default), 'cores'
+                          (un bloque de SCANIX_TORCH_THREADS núcleos propio)
+                          o 'node' (todos los núcleos de su nodo NUMA)
+    SCANIX_NUMA_NODE      nodo NUMA de este master (lo fija
+                          `python cpu_topology.py serve`, una réplica por nodo)
+    SCANIX_THREADS        hilos de request por worker (default 4, worker
+                          gthread). Los hilos de más esperan en la cola de
+                          admisión, que los ordena por prioridad y deadline;
+                          con 1 (worker sync) no se forma cola y la admisión
+                          no ordena nada. Con SCANIX_BATCH_WAIT_MS > 0 los
+                          requests concurrentes se agrupan en micro-batches
+    SCANIX_TIMEOUT        timeout de un request en segundos (default 60)
+"""
+
+import os
+import sys
+
+# cpu_topology.py está junto a este archivo (no importa numpy ni torch: los
+# límites de hilos de abajo se fijan antes de que se carguen)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import cpu_topology
+
+torch_threads = int(os.environ.get('SCANIX_TORCH_THREADS', 1))
+interop_threads = int(os.environ.get('SCANIX_TORCH_INTEROP_THREADS', 1))
+pin_workers = os.environ.get('SCANIX_PIN_WORKERS', 'none')
+numa_node = os.environ.get('SCANIX_NUMA_NODE', '')
+cpus = cpu_topology.topology_cpus(numa_node)
+if numa_node:
+    # Réplica de este nodo: el master (y los modelos que carga) quedan en su memoria local
+    cpu_topology.pin(cpus)
+
+# Limitar los pools de OpenMP/MKL antes de que el master importe torch
+for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+    os.environ.setdefault(var, str(torch_threads))
+
+bind = os.environ.get('SCANIX_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('SCANIX_WORKERS', max(1, len(cpus) // torch_threads)))
+threads = int(os.environ.get('SCANIX_THREADS', 4))
+# Con varios hilos los requests concurrentes de un worker forman la cola de admisión
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('SCANIX_TIMEOUT', 60))
+
+# Cargar los modelos una vez en el master y compartirlos copy-on-write
+preload_app = True
+# Un master por nodo NUMA escuchando en el mismo puerto
+reuse_port = bool(numa_node)
+
+
+def pre_fork(server, worker):
+    """Slot estable del worker (un worker reiniciado vuelve a los mismos núcleos)"""
+    worker.scanix_slot = cpu_topology.free_slot(
+        (getattr(w, 'scanix_slot', None) for w in server.WORKERS.values()), workers)
+
+
+def post_fork(server, worker):
+    """Hilos de torch, pinning, warm-up y sincronización del catálogo en cada worker"""
+    import app as service
+
+    topology = cpu_topology.configure_worker(worker.scanix_slot, workers, torch_threads, interop_threads,
+                                             pin_workers, numa_node)
+    server.log.info("Worker %s (slot %s): torch con %s/%s hilo(s), núcleos %s", worker.pid, worker.scanix_slot,
+                    topology['torch_threads'], topology['torch_interop_threads'], topology['cpus'])
+
+    if service.WARMUP_ENABLED:
+        service.warmup_models()
+    service.start_catalog_sync()
@@ -0,0 +1,93 @@
+"""
+Decodificación rápida de imágenes para SCANIX AI Service
+
+Las fotos de celular (12 MP) se decodifican directamente cerca de la
+resolución que usan los modelos: JPEG con escalado DCT (cv2.IMREAD_REDUCED_*
+o draft de PIL), sin aplicar la orientación EXIF y sin copias PIL -> NumPy
+de más. Las entradas demasiado grandes o las "decompression bombs" se
+rechazan leyendo solo el header, antes de decodificar.
+"""
+
+import io
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+# Imagen decodificada y factor para llevar coordenadas a la imagen original
+DecodedImage = namedtuple('DecodedImage', ['array', 'scale'])
+
+_cv2 = None
+
+
+def _opencv():
+    """OpenCV importado recién en el primer decode (None si no está instalado)"""
+    global _cv2
+    if _cv2 is None:
+        try:
+            import cv2
+        except ImportError:  # pragma: no cover - opencv es opcional para este módulo
+            cv2 = False
+        _cv2 = cv2
+    return _cv2 or None
+
+
+def _reduced_flag(cv2, factor):
+    return {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }[factor]
+
+
+class ImageTooLargeError(ValueError):
+    """La imagen supera los límites de tamaño configurados"""
+
+
+def reduction_factor(width, height, target_size):
+    """Mayor factor 1/2/4/8 que deja el lado más largo >= target_size"""
+    factor = 1
+    while factor < 8 and max(width, height) / (factor * 2) >= target_size:
+        factor *= 2
+    return factor
+
+
+def decode_image(data, target_size=1280, max_pixels=40_000_000, max_bytes=20 * 1024 * 1024):
+    """Decodificar bytes a un array RGB uint8 reducido hacia target_size"""
+    if len(data) > max_bytes:
+        raise ImageTooLargeError(f"Imagen de {len(data)} bytes (máximo {max_bytes})")
+
+    # Abrir solo lee el header: dimensiones y formato sin decodificar píxeles.
+    # PIL corta por su cuenta las imágenes de más de 2 * Image.MAX_IMAGE_PIXELS
+    # (DecompressionBombError): también es una imagen demasiado grande, no un formato inválido
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            width, height = probe.size
+            image_format = probe.format
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Imagen demasiado grande: {e}") from e
+    if width * height > max_pixels:
+        raise ImageTooLargeError(f"Imagen de {width}x{height} píxeles (máximo {max_pixels})")
+
+    factor = reduction_factor(width, height, target_size) if target_size else 1
+
+    cv2 = _opencv()
+    if cv2 is not None:
+        flags = _reduced_flag(cv2, factor) | cv2.IMREAD_IGNORE_ORIENTATION
+        array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if array is not None:
+            # BGR -> RGB sobre el mismo buffer
+            cv2.cvtColor(array, cv2.COLOR_BGR2RGB, dst=array)
+            return DecodedImage(array, width / array.shape[1])
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image_format == 'JPEG' and factor > 1:
+                image.draft('RGB', (width // factor, height // factor))
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            array = np.asarray(image)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(f"Imagen demasiado grande: {e}") from e
+    return DecodedImage(array, width / array.shape[1])
@@ -0,0 +1,110 @@
+"""
+Backends de inferencia de SCANIX AI Service
+
+Interfaz común que usa app.py, independiente del runtime:
+
+    Detector
+        detect(images, conf=None) -> [(boxes (N, 4) float32 xyxy, scores (N,) float32), ...]
+        imgsz                         lado de entrada nativo del modelo (tamaño de los tiles)
+
+    ImageEncoder
+        prepare(image)                          imagen HWC uint8 -> formato nativo del backend
+        pixel_values(prepared, boxes)           batch normalizado de CLIP para las cajas
+        block_means(prepared, boxes, rows, cols) promedios de gris (N, rows, cols) para el dHash
+        encode(batches)                         lista de batches -> embeddings (M, D) float32
+        encode_text(texts)                      textos -> embeddings de texto (M, D) float32
+                                                (opcional: el backend onnx solo exporta imágenes)
+
+'torch' usa ultralytics + sentence_transformers en PyTorch; 'onnx' usa los
+grafos exportados con `python onnx_backend.py export` sobre ONNX Runtime.
+"""
+
+import numpy as np
+
+BACKENDS = ('torch', 'onnx')
+
+
+class TorchDetector:
+    """YOLO de ultralytics en PyTorch"""
+
+    name = 'torch'
+
+    def __init__(self, model_path, conf=0.5):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+        self.conf = conf
+        imgsz = self.model.overrides.get('imgsz') or 640
+        self.imgsz = int(max(imgsz) if isinstance(imgsz, (list, tuple)) else imgsz)
+
+    def detect(self, images, conf=None):
+        results = self.model(list(images), conf=self.conf if conf is None else conf, verbose=False)
+        outputs = []
+        for result in results:
+            if result.boxes is None:
+                outputs.append((np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32)))
+            else:
+                outputs.append((result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()))
+        return outputs
+
+
+class TorchClipEncoder:
+    """Encoder de imágenes de CLIP (sentence_transformers) en PyTorch, con ROIs vía roi_align"""
+
+    name = 'torch'
+
+    def __init__(self, model_name='clip-ViT-B-32', batch_size=32, model=None):
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_name)
+
+        self.model = model
+        self.batch_size = batch_size
+
+    def prepare(self, image):
+        from roi_batch import image_tensor
+        return image_tensor(image)
+
+    def pixel_values(self, prepared, boxes):
+        from roi_batch import clip_pixel_values
+        return clip_pixel_values(prepared, boxes)
+
+    def block_means(self, prepared, boxes, rows, cols):
+        from roi_batch import gray_block_means
+        return gray_block_means(prepared, boxes, rows, cols)
+
+    def encode(self, batches):
+        import torch
+
+        pixel_values = torch.cat(list(batches))
+        clip_module = self.model[0]  # sentence_transformers.models.CLIPModel
+        outputs = []
+        with torch.inference_mode():
+            for start in range(0, len(pixel_values), self.batch_size):
+                chunk = pixel_values[start:start + self.batch_size].to(self.model.device)
+                outputs.append(clip_module.model.get_image_features(pixel_values=chunk))
+        return torch.cat(outputs).cpu().numpy()
+
+    def encode_text(self, texts):
+        return self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                 show_progress_bar=False).astype(np.float32, copy=False)
+
+
+def create_detector(backend, model_path, conf=0.5, onnx_dir=None, threads=None):
+    """Detector del backend pedido"""
+    if backend == 'torch':
+        return TorchDetector(model_path, conf=conf)
+    if backend == 'onnx':
+        from onnx_backend import OnnxDetector
+        return OnnxDetector(onnx_dir, conf=conf, threads=threads)
+    raise ValueError(f"Backend de inferencia desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+
+
+def create_image_encoder(backend, batch_size=32, onnx_dir=None, threads=None):
+    """Encoder de imágenes del backend pedido"""
+    if backend == 'torch':
+        return TorchClipEncoder(batch_size=batch_size)
+    if backend == 'onnx':
+        from onnx_backend import OnnxClipEncoder
+        return OnnxClipEncoder(onnx_dir, batch_size=batch_size, threads=threads)
+    raise ValueError(f"Backend de inferencia desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Bundle compilado del knowledge base de SCANIX
+
+Convierte knowledge_base.pkl + product_mapping.json en un único archivo
+binario versionado que el servicio abre con np.memmap en solo lectura: todos
+los workers comparten la misma copia en page cache y el arranque no depende
+del tamaño del catálogo ni de unpickle.
+
+Formato (little endian):
+    MAGIC (8 bytes) | versión uint32 | largo del header uint32 | crc32 del header uint32
+    header JSON (utf-8), con padding hasta ALIGNMENT
+    embeddings float32 o float16 (N, D) normalizados L2, agrupados por producto
+    labels int32 (N,) -> posición del producto en header['product_ids']
+
+Uso:
+    python kb_bundle.py compile --kb models/knowledge_base.pkl --mapping models/product_mapping.json
+    python kb_bundle.py compile --precision fp16   # la mitad de tamaño (y de page cache)
+    python kb_bundle.py verify models/knowledge_base.scxkb
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from embedding_index import EmbeddingIndex
+
+MAGIC = b'SCANIXKB'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sIII')
+# Representación de los embeddings en el bundle
+DTYPES = {'fp32': '<f4', 'fp16': '<f2'}
+
+
+class BundleError(Exception):
+    """Bundle inválido, corrupto o de otra versión"""
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _payload_checksum(*blocks):
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(memoryview(np.ascontiguousarray(block)).cast('B'))
+    return digest.hexdigest()
+
+
+def compile_bundle(knowledge_base, product_mapping, output_path, precision='fp32'):
+    """Escribir el bundle a partir del knowledge base y el mapeo ya cargados ('fp32' o 'fp16')"""
+    if precision not in DTYPES:
+        raise BundleError(f"Precisión no soportada en el bundle: {precision}")
+    index = EmbeddingIndex.from_knowledge_base(knowledge_base)
+    embeddings = index.embeddings.astype(DTYPES[precision], copy=False)
+    labels = index.labels.astype('<i4', copy=False)
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'dtype': DTYPES[precision],
+        'shape': list(embeddings.shape),
+        'product_ids': [str(pid) for pid in index.product_ids],
+        'product_mapping': product_mapping,
+        'checksum': _payload_checksum(embeddings, labels),
+    }
+
+    # Los offsets dependen del largo del header, que a su vez los contiene
+    embeddings_offset = labels_offset = 0
+    while True:
+        header['embeddings_offset'] = embeddings_offset
+        header['labels_offset'] = labels_offset
+        header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        start = _align(PREAMBLE.size + len(header_bytes))
+        new_labels_offset = _align(start + embeddings.nbytes)
+        if (start, new_labels_offset) == (embeddings_offset, labels_offset):
+            break
+        embeddings_offset, labels_offset = start, new_labels_offset
+
+    tmp_path = f'{output_path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes), zlib.crc32(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * (embeddings_offset - f.tell()))
+        f.write(embeddings.tobytes())
+        f.write(b'\0' * (labels_offset - f.tell()))
+        f.write(labels.tobytes())
+    os.replace(tmp_path, output_path)
+    return header
+
+
+class KnowledgeBaseBundle:
+    """Bundle abierto con np.memmap (solo lectura, compartido entre procesos)"""
+
+    def __init__(self, path, verify=True):
+        self.path = path
+        with open(path, 'rb') as f:
+            preamble = f.read(PREAMBLE.size)
+            if len(preamble) != PREAMBLE.size:
+                raise BundleError(f"Bundle truncado: {path}")
+            magic, version, header_length, header_crc = PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise BundleError(f"No es un bundle de SCANIX: {path}")
+            if version != FORMAT_VERSION:
+                raise BundleError(f"Versión de bundle {version} no soportada (se esperaba {FORMAT_VERSION})")
+            header_bytes = f.read(header_length)
+
+        if len(header_bytes) != header_length or zlib.crc32(header_bytes) != header_crc:
+            raise BundleError(f"Header del bundle corrupto: {path}")
+        self.header = json.loads(header_bytes)
+
+        rows, dim = self.header['shape']
+        try:
+            self.embeddings = np.memmap(path, dtype=self.header['dtype'], mode='r',
+                                        offset=self.header['embeddings_offset'], shape=(rows, dim))
+            self.labels = np.memmap(path, dtype='<i4', mode='r',
+                                    offset=self.header['labels_offset'], shape=(rows,))
+        except ValueError as e:
+            raise BundleError(f"Bundle truncado: {e}") from e
+
+        if verify and _payload_checksum(self.embeddings, self.labels) != self.header['checksum']:
+            raise BundleError(f"Checksum del bundle inválido: {path}")
+
+        self.product_ids = self.header['product_ids']
+        self.product_mapping = self.header['product_mapping']
+
+    @property
+    def checksum(self):
+        return self.header['checksum']
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def build_index(self):
+        """Índice de búsqueda sobre la memoria mapeada, sin copiar los embeddings"""
+        return EmbeddingIndex(self.embeddings, self.labels, self.product_ids, normalized=True)
+
+
+def load_bundle(path, verify=True):
+    """Abrir un bundle compilado"""
+    return KnowledgeBaseBundle(path, verify=verify)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compilador del knowledge base de SCANIX')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compile_parser = subparsers.add_parser('compile', help='Compilar knowledge_base.pkl + product_mapping.json')
+    compile_parser.add_argument('--kb', default='models/knowledge_base.pkl')
+    compile_parser.add_argument('--mapping', default='models/product_mapping.json')
+    compile_parser.add_argument('--out', default='models/knowledge_base.scxkb')
+    compile_parser.add_argument('--precision', default='fp32', choices=sorted(DTYPES))
+
+    verify_parser = subparsers.add_parser('verify', help='Verificar versión y checksum de un bundle')
+    verify_parser.add_argument('bundle', nargs='?', default='models/knowledge_base.scxkb')
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'compile':
+            with open(args.kb, 'rb') as f:
+                knowledge_base = pickle.load(f)
+            with open(args.mapping, 'r', encoding='utf-8') as f:
+                product_mapping = json.load(f)
+            header = compile_bundle(knowledge_base, product_mapping, args.out, args.precision)
+            print(f"✅ Bundle escrito en {args.out}: {len(header['product_ids'])} productos, "
+                  f"{header['shape'][0]} vectores de dimensión {header['shape'][1]} ({args.precision})")
+        else:
+            bundle = load_bundle(args.bundle)
+            print(f"✅ Bundle válido (v{FORMAT_VERSION}): {len(bundle)} productos, checksum {bundle.checksum[:12]}")
+    except (OSError, BundleError) as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
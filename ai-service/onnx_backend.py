@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Backend ONNX Runtime (CPU) de SCANIX AI Service
+
+Exporta YOLO (models/best.pt), la torre visual de CLIP y las operaciones de
+ROI (roi_align + normalización, y la grilla de gris del dHash) a grafos ONNX,
+y los ejecuta con ONNX Runtime detrás de la misma interfaz Detector /
+ImageEncoder de inference_backends.py. En serving no hace falta importar
+torch (salvo para el chequeo de paridad contra PyTorch).
+
+Uso:
+    python onnx_backend.py export --yolo models/best.pt --out models/onnx
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+import cpu_topology
+
+YOLO_FILE = 'yolo.onnx'
+CLIP_FILE = 'clip_visual.onnx'
+ROI_CLIP_FILE = 'roi_clip.onnx'
+ROI_GRAY_FILE = 'roi_gray.onnx'
+MANIFEST_FILE = 'manifest.json'
+OPSET = 17
+# Grilla del dHash (embedding_cache usa hash_size=16 -> 16 x 17)
+HASH_BLOCKS = (16, 17)
+
+
+def create_session(path, threads=None):
+    """Sesión de ONNX Runtime en CPU con todas las optimizaciones de grafo.
+
+    Sin `threads` usa los hilos intra-op por worker (cpu_topology), no todos los núcleos:
+    con varios workers de gunicorn cada uno tendría un pool del tamaño de la máquina.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = threads or cpu_topology.intra_op_threads()
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+def letterbox(image, size):
+    """Redimensionar manteniendo aspecto y rellenar a size x size (como ultralytics) -> (img, ratio, (pad_x, pad_y))"""
+    import cv2
+
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (width, height) else image
+    top, left = int(round(pad_y - 0.1)), int(round(pad_x - 0.1))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas, ratio, (left, top)
+
+
+def nms(boxes, scores, iou_threshold):
+    """Non-maximum suppression greedy; devuelve los índices conservados"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+class OnnxDetector:
+    """YOLOv8 exportado a ONNX: letterbox, un solo run batcheado y NMS en NumPy"""
+
+    name = 'onnx'
+
+    def __init__(self, model_dir, conf=0.5, iou=0.7, max_det=300, threads=None):
+        with open(os.path.join(model_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        self.session = create_session(os.path.join(model_dir, YOLO_FILE), threads)
+        self.input_name = self.session.get_inputs()[0].name
+        self.imgsz = manifest['yolo_imgsz']
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+    def detect(self, images, conf=None):
+        conf = self.conf if conf is None else conf
+        letterboxed = [letterbox(image, self.imgsz) for image in images]
+        batch = np.stack([canvas for canvas, _, _ in letterboxed]).transpose(0, 3, 1, 2)
+        batch = np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+        predictions = self.session.run(None, {self.input_name: batch})[0]  # (B, 4 + clases, anclas)
+
+        outputs = []
+        for prediction, image, (_, ratio, (pad_x, pad_y)) in zip(predictions, images, letterboxed):
+            prediction = prediction.T
+            class_scores = prediction[:, 4:]
+            classes = class_scores.argmax(axis=1)
+            scores = class_scores[np.arange(len(classes)), classes]
+            mask = scores > conf
+            xywh, scores, classes = prediction[mask, :4], scores[mask], classes[mask]
+
+            boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+            # NMS por clase: desplazar las cajas de cada clase para que no se solapen entre sí
+            keep = nms(boxes + classes[:, None] * 7680.0, scores, self.iou)[:self.max_det]
+            boxes, scores = boxes[keep], scores[keep]
+
+            # Deshacer el letterbox
+            boxes = (boxes - np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)) / ratio
+            height, width = image.shape[:2]
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+            outputs.append((boxes.astype(np.float32), scores.astype(np.float32)))
+        return outputs
+
+
+class OnnxClipEncoder:
+    """Torre visual de CLIP + operaciones de ROI en ONNX Runtime"""
+
+    name = 'onnx'
+
+    def __init__(self, model_dir, batch_size=32, threads=None, clip_file=CLIP_FILE):
+        self.session = create_session(os.path.join(model_dir, clip_file), threads)
+        self.roi_clip = create_session(os.path.join(model_dir, ROI_CLIP_FILE), threads)
+        self.roi_gray = create_session(os.path.join(model_dir, ROI_GRAY_FILE), threads)
+        self.batch_size = batch_size
+
+    def prepare(self, image):
+        return np.ascontiguousarray(image.transpose(2, 0, 1)[None], dtype=np.float32)
+
+    def pixel_values(self, prepared, boxes):
+        boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        return self.roi_clip.run(None, {'image': prepared, 'boxes': boxes})[0]
+
+    def block_means(self, prepared, boxes, rows, cols):
+        if (rows, cols) != HASH_BLOCKS:
+            raise ValueError(f"El grafo roi_gray se exportó para una grilla {HASH_BLOCKS}")
+        boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        if not len(boxes):
+            return np.empty((0, rows, cols), dtype=np.float32)
+        return self.roi_gray.run(None, {'image': prepared, 'boxes': boxes})[0]
+
+    def encode(self, batches):
+        pixel_values = np.concatenate(list(batches)).astype(np.float32, copy=False)
+        outputs = []
+        # IO binding: ORT lee el batch directamente desde el buffer de NumPy
+        binding = self.session.io_binding()
+        for start in range(0, len(pixel_values), self.batch_size):
+            binding.bind_cpu_input('pixel_values', np.ascontiguousarray(pixel_values[start:start + self.batch_size]))
+            binding.bind_output('image_embeds')
+            self.session.run_with_iobinding(binding)
+            outputs.append(binding.copy_outputs_to_cpu()[0])
+        return np.concatenate(outputs)
+
+
+def box_iou(a, b):
+    """IoU entre todas las cajas de a (N, 4) y b (M, 4)"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def check_parity(reference, candidate, image, min_cosine=0.99, min_iou=0.9):
+    """Comparar un par (detector, encoder) ONNX contra el de PyTorch sobre una imagen.
+
+    Devuelve un reporte con 'ok' y las métricas de detección y embeddings.
+    """
+    ref_detector, ref_encoder = reference
+    detector, encoder = candidate
+
+    ref_boxes, _ = ref_detector.detect([image])[0]
+    boxes, _ = detector.detect([image])[0]
+    matched_iou = float(box_iou(ref_boxes, boxes).max(axis=1).min()) if len(ref_boxes) and len(boxes) else None
+    detections_ok = len(ref_boxes) == len(boxes) and (matched_iou is None or matched_iou >= min_iou)
+
+    # Embeddings de las cajas de referencia (o de la imagen completa y sus cuadrantes)
+    height, width = image.shape[:2]
+    probe_boxes = ref_boxes if len(ref_boxes) else np.array([
+        [0, 0, width, height], [0, 0, width / 2, height / 2], [width / 2, height / 2, width, height]
+    ], dtype=np.float32)
+    ref_embeddings = ref_encoder.encode([ref_encoder.pixel_values(ref_encoder.prepare(image), probe_boxes)])
+    embeddings = encoder.encode([encoder.pixel_values(encoder.prepare(image), probe_boxes)])
+    ref_embeddings = ref_embeddings / np.linalg.norm(ref_embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    min_cos = float((ref_embeddings * embeddings).sum(axis=1).min())
+
+    return {
+        'ok': bool(detections_ok and min_cos >= min_cosine),
+        'detections': [len(ref_boxes), len(boxes)],
+        'min_box_iou': matched_iou,
+        'min_embedding_cosine': min_cos
+    }
+
+
+def export_models(yolo_path, out_dir, imgsz=640, clip_model_name='clip-ViT-B-32'):
+    """Exportar YOLO, la torre visual de CLIP y las operaciones de ROI a out_dir"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from ultralytics import YOLO
+
+    import roi_batch
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # YOLO: exportador de ultralytics con batch y tamaño dinámicos
+    exported = YOLO(yolo_path).export(format='onnx', imgsz=imgsz, dynamic=True, opset=OPSET)
+    shutil.move(exported, os.path.join(out_dir, YOLO_FILE))
+    print(f"✅ YOLO exportado ({YOLO_FILE})")
+
+    class VisualTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, pixel_values):
+            return self.clip.get_image_features(pixel_values=pixel_values)
+
+    class RoiClip(torch.nn.Module):
+        def forward(self, image, boxes):
+            return roi_batch.clip_pixel_values(image, boxes)
+
+    class RoiGray(torch.nn.Module):
+        def forward(self, image, boxes):
+            return roi_batch.gray_blocks(image, boxes, *HASH_BLOCKS)
+
+    clip = SentenceTransformer(clip_model_name)[0].model.eval()
+    size = roi_batch.CLIP_INPUT_SIZE
+    with torch.inference_mode():
+        torch.onnx.export(VisualTower(clip), (torch.zeros(2, 3, size, size),), os.path.join(out_dir, CLIP_FILE),
+                          input_names=['pixel_values'], output_names=['image_embeds'],
+                          dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+                          opset_version=OPSET)
+        print(f"✅ CLIP exportado ({CLIP_FILE})")
+
+        example = (torch.zeros(1, 3, 480, 640), torch.tensor([[0.0, 0.0, 320.0, 240.0], [10.0, 10.0, 200.0, 400.0]]))
+        roi_axes = {'image': {2: 'height', 3: 'width'}, 'boxes': {0: 'boxes'}}
+        torch.onnx.export(RoiClip(), example, os.path.join(out_dir, ROI_CLIP_FILE),
+                          input_names=['image', 'boxes'], output_names=['pixel_values'],
+                          dynamic_axes={**roi_axes, 'pixel_values': {0: 'boxes'}}, opset_version=OPSET)
+        torch.onnx.export(RoiGray(), example, os.path.join(out_dir, ROI_GRAY_FILE),
+                          input_names=['image', 'boxes'], output_names=['blocks'],
+                          dynamic_axes={**roi_axes, 'blocks': {0: 'boxes'}}, opset_version=OPSET)
+        print(f"✅ Operaciones de ROI exportadas ({ROI_CLIP_FILE}, {ROI_GRAY_FILE})")
+
+    manifest = {
+        'opset': OPSET,
+        'yolo_source': os.path.abspath(yolo_path),
+        'yolo_imgsz': imgsz,
+        'clip_model': clip_model_name,
+        'hash_blocks': list(HASH_BLOCKS)
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Exportar los modelos de SCANIX a ONNX')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Exportar YOLO + CLIP + operaciones de ROI')
+    export_parser.add_argument('--yolo', default='models/best.pt')
+    export_parser.add_argument('--out', default='models/onnx')
+    export_parser.add_argument('--imgsz', type=int, default=640)
+
+    args = parser.parse_args(argv)
+    try:
+        export_models(args.yolo, args.out, imgsz=args.imgsz)
+    except Exception as e:
+        print(f"❌ Error exportando modelos: {e}")
+        return 1
+    print(f"🎉 Modelos exportados en {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
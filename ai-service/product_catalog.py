@@ -0,0 +1,136 @@
+"""
+Catálogo de productos compilado para SCANIX AI Service
+
+Cada snapshot del catálogo (ver catalog_updates.LiveCatalog) se compila una
+vez en una vista inmutable:
+
+- Índices por product_id, SKU y categoría: cada lookup es un acceso a dict.
+- El fragmento JSON de cada producto en /products se serializa una sola vez
+  (y se reutiliza en la próxima compilación si su info no cambió).
+- El cuerpo de /products se arma uniendo fragmentos ya codificados y se
+  cachea por (categoría, offset, limit): pedir la lista cuesta lo mismo con
+  10 productos que con 100.000, y con If-None-Match el ETag responde 304
+  sin cuerpo.
+
+La serialización usa orjson si está instalado y si no la librería estándar.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: json de la librería estándar
+    orjson = None
+    import json
+
+# Cuerpos de /products distintos (filtros / páginas) cacheados por catálogo
+PAGE_CACHE_ENTRIES = 256
+
+
+def dumps(value):
+    """JSON compacto en bytes utf-8"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def product_entry(product_id, info):
+    """Datos de un producto en la respuesta de /products"""
+    return {
+        'product_id': product_id,
+        'sku': info.get('sku', ''),
+        'nombre': info.get('nombre', ''),
+        'categoria': info.get('categoria', ''),
+        'descripcion': info.get('descripcion', ''),
+        'precio': info.get('precio', info.get('precio_base', 0))
+    }
+
+
+def category_key(category):
+    return str(category or '').strip().casefold()
+
+
+class ProductCatalog:
+    """Vista inmutable de un mapeo de productos con lookups O(1) y /products pre-serializado"""
+
+    def __init__(self, product_mapping, version='', previous=None):
+        self.version = str(version)
+        self.by_id = dict(product_mapping)
+        self.product_ids = tuple(self.by_id)
+
+        by_sku = {}
+        by_category = {}
+        fragments = []
+        reusable = previous.by_id if previous is not None else {}
+        for position, (product_id, info) in enumerate(self.by_id.items()):
+            sku = info.get('sku')
+            if sku:
+                by_sku.setdefault(str(sku), product_id)
+            by_category.setdefault(category_key(info.get('categoria')), []).append(position)
+            # Misma info (el LiveCatalog reutiliza los dicts sin cambios): mismo fragmento
+            if reusable.get(product_id) is info:
+                fragments.append(previous._fragments[previous._positions[product_id]])
+            else:
+                fragments.append(dumps(product_entry(product_id, info)))
+        self.by_sku = by_sku
+        self.by_category = {key: tuple(positions) for key, positions in by_category.items()}
+        self._positions = {product_id: i for i, product_id in enumerate(self.product_ids)}
+        self._fragments = fragments
+
+        digest = hashlib.sha1(self.version.encode('utf-8'))
+        for fragment in fragments:
+            digest.update(fragment)
+        # Un ETag por catálogo: el cuerpo de cada URL depende solo del catálogo
+        self.etag = f'"{digest.hexdigest()[:20]}"'
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.products_body()
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __contains__(self, product_id):
+        return product_id in self.by_id
+
+    def get(self, product_id, default=None):
+        return self.by_id.get(product_id, default)
+
+    def find_sku(self, sku):
+        """product_id con ese SKU, o None"""
+        return self.by_sku.get(str(sku))
+
+    def categories(self):
+        return sorted(key for key in self.by_category if key)
+
+    def products_body(self, category=None, offset=0, limit=None, sku=None):
+        """Cuerpo JSON (bytes) de /products con filtro por categoría o SKU y paginación"""
+        key = (category_key(category) if category else None, offset, limit, sku)
+        with self._lock:
+            body = self._pages.get(key)
+            if body is not None:
+                self._pages.move_to_end(key)
+                return body
+
+        if sku is not None:
+            product_id = self.find_sku(sku)
+            positions = (self._positions[product_id],) if product_id is not None else ()
+        elif category:
+            positions = self.by_category.get(key[0], ())
+        else:
+            positions = range(len(self._fragments))
+        total = len(positions)
+        page = positions[offset:offset + limit if limit is not None else None]
+
+        header = {'success': True, 'total': total, 'offset': offset, 'count': len(page)}
+        if limit is not None:
+            header['limit'] = limit
+        body = (dumps(header)[:-1] + b',"products":['
+                + b','.join(self._fragments[i] for i in page) + b']}')
+
+        with self._lock:
+            self._pages[key] = body
+            if len(self._pages) > PAGE_CACHE_ENTRIES:
+                self._pages.popitem(last=False)
+        return body
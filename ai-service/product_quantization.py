@@ -0,0 +1,141 @@
+"""
+Product quantization para los embeddings de SCANIX
+
+Parte cada vector de D dimensiones en m subespacios y guarda, por
+subespacio, el índice (1 byte) del centroide más cercano de un codebook de
+256 entradas entrenado con k-means: m bytes por vector en vez de 4*D. El
+producto interno con una query se estima sin descomprimir, sumando entradas
+de tablas de lookup calculadas una vez por query (asymmetric distance
+computation, ADC).
+
+Lo usan el índice IVF-PQ (ann_index.py) y el índice exacto comprimido
+(EmbeddingIndex con precision='pq').
+"""
+
+import numpy as np
+
+# Filas por bloque en el recorrido ADC completo (el acumulador queda en cache)
+SCAN_ROWS = 8192
+
+
+def nearest_centroids(x, centroids, chunk=16384):
+    """Centroide más cercano (L2) de cada fila, en bloques para acotar memoria"""
+    half_norms = 0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    assign = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk] @ centroids.T
+        block -= half_norms
+        assign[start:start + chunk] = np.argmax(block, axis=1)
+    return assign
+
+
+def kmeans(x, k, iterations=15, seed=0, max_points=None):
+    """k-means (Lloyd) sobre las filas de x; devuelve los centroides (k, D) float32"""
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    if max_points and len(x) > max_points:
+        x = x[rng.choice(len(x), max_points, replace=False)]
+    k = max(1, min(k, len(x)))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = nearest_centroids(x, centroids)
+        order = np.argsort(assign, kind='stable')
+        sorted_assign = assign[order]
+        starts = np.flatnonzero(np.r_[True, sorted_assign[1:] != sorted_assign[:-1]])
+        counts = np.diff(np.r_[starts, len(x)])
+        clusters = sorted_assign[starts]
+        centroids[clusters] = np.add.reduceat(x[order], starts, axis=0) / counts[:, None]
+        # Clusters vacíos: reiniciar con puntos al azar
+        empty = np.setdiff1d(np.arange(k), clusters)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+class ProductQuantizer:
+    """Product quantization: D dimensiones en m subespacios, un código de 8 bits por subespacio"""
+
+    def __init__(self, codebooks):
+        # (m, ksub, dsub)
+        self.codebooks = np.ascontiguousarray(codebooks, dtype=np.float32)
+
+    @property
+    def m(self):
+        return self.codebooks.shape[0]
+
+    @property
+    def ksub(self):
+        return self.codebooks.shape[1]
+
+    @property
+    def dimension(self):
+        return self.codebooks.shape[0] * self.codebooks.shape[2]
+
+    @classmethod
+    def train(cls, x, m, nbits=8, iterations=10, seed=0, max_points=16384):
+        x = np.asarray(x, dtype=np.float32)
+        if x.shape[1] % m:
+            raise ValueError(f"La dimensión {x.shape[1]} no es divisible por m={m}")
+        ksub = min(2 ** nbits, 256, len(x))
+        dsub = x.shape[1] // m
+        codebooks = np.zeros((m, ksub, dsub), dtype=np.float32)
+        for j in range(m):
+            trained = kmeans(x[:, j * dsub:(j + 1) * dsub], ksub, iterations, seed + j, max_points)
+            codebooks[j, :len(trained)] = trained
+        return cls(codebooks)
+
+    def encode(self, x):
+        """Códigos (N, m) uint8"""
+        x = np.asarray(x, dtype=np.float32)
+        dsub = self.codebooks.shape[2]
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = nearest_centroids(x[:, j * dsub:(j + 1) * dsub], self.codebooks[j])
+        return codes
+
+    def decode(self, codes):
+        """Vectores aproximados (N, D) a partir de los códigos"""
+        return self.codebooks[np.arange(self.m), codes].reshape(len(codes), -1)
+
+    def lookup(self, queries):
+        """Tablas (Q, m, ksub): producto interno de cada subvector de la query con cada centroide"""
+        queries = queries.reshape(len(queries), self.m, -1).transpose(1, 0, 2)
+        return np.ascontiguousarray((queries @ self.codebooks.transpose(0, 2, 1)).transpose(1, 0, 2))
+
+    @property
+    def flat_dtype(self):
+        """uint16 mientras los índices de la tabla aplanada (m * ksub) entren; si no uint32"""
+        return np.uint16 if self.m * self.ksub <= 1 << 16 else np.uint32
+
+    def flat_codes(self, codes):
+        """Códigos como índices en la tabla aplanada (m * ksub): un solo np.take por query"""
+        dtype = self.flat_dtype
+        return codes.astype(dtype) + (np.arange(self.m, dtype=dtype) * self.ksub)
+
+    def unflat_codes(self, flat_codes):
+        """Inversa de flat_codes: códigos (N, m) uint8"""
+        return (flat_codes - np.arange(self.m, dtype=flat_codes.dtype) * self.ksub).astype(np.uint8)
+
+    def scores(self, table, flat_codes):
+        """Producto interno aproximado de una query (su tabla (m, ksub)) con las filas codificadas"""
+        return np.take(table.ravel(), flat_codes).sum(axis=1)
+
+    def scan(self, tables, codes_by_subspace):
+        """Producto interno aproximado (Q, N) de cada query contra todas las filas.
+
+        codes_by_subspace: códigos transpuestos (m, N), para que cada subespacio
+        sea un np.take contiguo sobre todas las filas de un bloque.
+        """
+        n = codes_by_subspace.shape[1]
+        out = np.empty((len(tables), n), dtype=np.float32)
+        step = np.empty((len(tables), min(SCAN_ROWS, n)), dtype=np.float32)
+        for start in range(0, n, SCAN_ROWS):
+            block = codes_by_subspace[:, start:start + SCAN_ROWS]
+            acc = out[:, start:start + block.shape[1]]
+            tmp = step[:, :block.shape[1]]
+            np.take(tables[:, 0], block[0], axis=1, out=acc)
+            for j in range(1, self.m):
+                np.take(tables[:, j], block[j], axis=1, out=tmp)
+                acc += tmp
+        return out
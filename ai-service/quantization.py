@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Encoder de CLIP cuantizado a INT8 para SCANIX AI Service
+
+Las capas lineales de la torre visual de CLIP se cuantizan a INT8:
+
+    dynamic  pesos INT8, activaciones cuantizadas en cada llamada
+             (torch.ao.quantization.quantize_dynamic u onnxruntime.quantization)
+    static   pesos y activaciones INT8 con rangos calibrados sobre las fotos
+             de muestra de los productos (solo backend onnx)
+
+Antes de usar el modelo cuantizado se re-embeben muestras conocidas que no
+participaron de la calibración y se comparan contra el modelo FP32: acuerdo
+del top-1 contra el índice y deriva de la similitud. Si no pasa los umbrales
+(o no hay muestras para medirlo) se sigue con FP32.
+
+Las muestras se leen de un directorio con una carpeta por producto:
+
+    models/samples/<product_id>/*.jpg
+
+Uso:
+    python quantization.py evaluate --samples models/samples --backend onnx --mode static
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+
+from image_decode import decode_image
+
+MODES = ('dynamic', 'static')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+# Resolución de decode de las muestras (CLIP trabaja a 224)
+SAMPLE_DECODE_SIZE = 448
+
+
+def int8_clip_file(mode):
+    """Nombre del grafo ONNX cuantizado para el modo dado"""
+    return f"clip_visual.int8-{mode}.onnx"
+
+
+def load_samples(samples_dir, holdout_every=5):
+    """Muestras etiquetadas divididas en (calibración, held-out).
+
+    Cada elemento es (product_id, imagen RGB uint8). De cada producto se
+    reserva una de cada `holdout_every` imágenes (en orden de nombre) para la
+    evaluación, así el resultado es reproducible entre arranques.
+    """
+    calibration, heldout = [], []
+    if not samples_dir or not os.path.isdir(samples_dir):
+        return calibration, heldout
+
+    for product_id in sorted(os.listdir(samples_dir)):
+        product_dir = os.path.join(samples_dir, product_id)
+        if not os.path.isdir(product_dir):
+            continue
+        names = sorted(name for name in os.listdir(product_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for i, name in enumerate(names):
+            with open(os.path.join(product_dir, name), 'rb') as f:
+                image = decode_image(f.read(), target_size=SAMPLE_DECODE_SIZE).array
+            (heldout if i % holdout_every == holdout_every - 1 else calibration).append((product_id, image))
+    return calibration, heldout
+
+
+def sample_pixel_values(encoder, images):
+    """Batches de CLIP de cada muestra completa (una caja por imagen)"""
+    batches = []
+    for image in images:
+        height, width = image.shape[:2]
+        boxes = np.array([[0, 0, width, height]], dtype=np.float32)
+        batches.append(encoder.pixel_values(encoder.prepare(image), boxes))
+    return batches
+
+
+def quantize_torch_encoder(encoder):
+    """Copia del encoder PyTorch con las Linear de la torre visual en INT8 dinámico"""
+    import torch
+    from inference_backends import TorchClipEncoder
+
+    model = copy.deepcopy(encoder.model)
+    clip = model[0].model
+    for name in ('vision_model', 'visual_projection'):
+        module = torch.ao.quantization.quantize_dynamic(getattr(clip, name), {torch.nn.Linear}, dtype=torch.qint8)
+        setattr(clip, name, module)
+    return TorchClipEncoder(batch_size=encoder.batch_size, model=model)
+
+
+class _CalibrationReader:
+    """CalibrationDataReader de ONNX Runtime sobre los batches de las muestras"""
+
+    def __init__(self, batches):
+        self._batches = iter(batches)
+
+    def get_next(self):
+        batch = next(self._batches, None)
+        return None if batch is None else {'pixel_values': np.ascontiguousarray(batch, dtype=np.float32)}
+
+
+def quantize_onnx_model(model_dir, mode, calibration_batches=None):
+    """Escribir el grafo de CLIP cuantizado (si no existe) y devolver su nombre de archivo"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    from onnx_backend import CLIP_FILE
+
+    source = os.path.join(model_dir, CLIP_FILE)
+    filename = int8_clip_file(mode)
+    target = os.path.join(model_dir, filename)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+        return filename
+
+    if mode == 'dynamic':
+        quantize_dynamic(source, target, op_types_to_quantize=['MatMul', 'Gemm'], weight_type=QuantType.QInt8)
+    else:
+        if not calibration_batches:
+            raise ValueError("La cuantización estática necesita muestras de calibración")
+        quantize_static(source, target, _CalibrationReader(calibration_batches),
+                        quant_format=QuantFormat.QDQ, op_types_to_quantize=['MatMul', 'Gemm'],
+                        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return filename
+
+
+def quantize_encoder(encoder, mode, calibration_images=(), onnx_dir=None, threads=None):
+    """Encoder INT8 equivalente a `encoder` (PyTorch u ONNX Runtime)"""
+    if mode not in MODES:
+        raise ValueError(f"Modo de cuantización desconocido: {mode} (opciones: {', '.join(MODES)})")
+
+    if encoder.name == 'torch':
+        if mode != 'dynamic':
+            raise ValueError("El backend torch solo soporta cuantización dinámica")
+        return quantize_torch_encoder(encoder)
+
+    from onnx_backend import OnnxClipEncoder
+
+    calibration = sample_pixel_values(encoder, calibration_images) if mode == 'static' else None
+    filename = quantize_onnx_model(onnx_dir, mode, calibration)
+    return OnnxClipEncoder(onnx_dir, batch_size=encoder.batch_size, threads=threads, clip_file=filename)
+
+
+def _timed_encode(encoder, batches):
+    encoder.encode(batches[:1])  # primera llamada fuera de la medición
+    start = time.perf_counter()
+    embeddings = encoder.encode(batches)
+    return embeddings, time.perf_counter() - start
+
+
+def accuracy_gate(reference, candidate, samples, index, min_agreement=0.98, max_drift=0.02):
+    """Comparar el encoder INT8 contra el FP32 sobre muestras held-out.
+
+    Devuelve un reporte con 'ok', el acuerdo del top-1 contra el índice, la
+    deriva de la similitud del top-1 y la aceleración medida.
+    """
+    labels = np.array([product_id for product_id, _ in samples])
+    images = [image for _, image in samples]
+
+    ref_embeddings, ref_seconds = _timed_encode(reference, sample_pixel_values(reference, images))
+    embeddings, seconds = _timed_encode(candidate, sample_pixel_values(candidate, images))
+
+    ref_sims, ref_ids = index.search(ref_embeddings, k=1)
+    sims, ids = index.search(embeddings, k=1)
+    agreement = float(np.mean(ref_ids[:, 0] == ids[:, 0]))
+    drift = np.abs(ref_sims[:, 0] - sims[:, 0])
+
+    ref_embeddings = ref_embeddings / np.linalg.norm(ref_embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    return {
+        'ok': bool(agreement >= min_agreement and drift.max() <= max_drift),
+        'samples': len(samples),
+        'top1_agreement': agreement,
+        'max_similarity_drift': float(drift.max()),
+        'mean_similarity_drift': float(drift.mean()),
+        'min_embedding_cosine': float((ref_embeddings * embeddings).sum(axis=1).min()),
+        'accuracy_fp32': float(np.mean(ref_ids[:, 0] == labels)),
+        'accuracy_int8': float(np.mean(ids[:, 0] == labels)),
+        'speedup': ref_seconds / seconds if seconds else None
+    }
+
+
+def select_encoder(encoder, mode, samples_dir, index, min_agreement=0.98, max_drift=0.02,
+                   onnx_dir=None, threads=None):
+    """(encoder, reporte): el INT8 si pasa el gate de precisión, si no el FP32 original"""
+    report = {'mode': mode, 'active': 'fp32'}
+
+    calibration, heldout = load_samples(samples_dir)
+    if not heldout:
+        report['reason'] = f"sin muestras held-out en {samples_dir}"
+        return encoder, report
+
+    try:
+        quantized = quantize_encoder(encoder, mode, [image for _, image in calibration],
+                                     onnx_dir=onnx_dir, threads=threads)
+        report.update(accuracy_gate(encoder, quantized, heldout, index, min_agreement, max_drift))
+    except Exception as e:
+        report['reason'] = f"error cuantizando: {e}"
+        return encoder, report
+
+    if not report['ok']:
+        report['reason'] = (f"acuerdo top-1 {report['top1_agreement']:.3f} (mínimo {min_agreement}), "
+                            f"deriva {report['max_similarity_drift']:.4f} (máximo {max_drift})")
+        return encoder, report
+
+    report['active'] = 'int8'
+    return quantized, report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cuantizar el encoder de CLIP a INT8 y medir su precisión')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='Cuantizar y comparar contra FP32 con muestras held-out')
+    evaluate_parser.add_argument('--samples', default='models/samples')
+    evaluate_parser.add_argument('--backend', default='torch')
+    evaluate_parser.add_argument('--mode', default='dynamic', choices=MODES)
+    evaluate_parser.add_argument('--onnx-dir', default='models/onnx')
+    evaluate_parser.add_argument('--kb', default='models/knowledge_base.pkl')
+    evaluate_parser.add_argument('--min-agreement', type=float, default=0.98)
+    evaluate_parser.add_argument('--max-drift', type=float, default=0.02)
+
+    args = parser.parse_args(argv)
+
+    import pickle
+
+    from embedding_index import EmbeddingIndex
+    from inference_backends import create_image_encoder
+
+    with open(args.kb, 'rb') as f:
+        index = EmbeddingIndex.from_knowledge_base(pickle.load(f))
+    encoder = create_image_encoder(args.backend, onnx_dir=args.onnx_dir)
+    _, report = select_encoder(encoder, args.mode, args.samples, index, args.min_agreement, args.max_drift,
+                               onnx_dir=args.onnx_dir)
+
+    for key, value in report.items():
+        print(f"  {key}: {value}")
+    if report['active'] != 'int8':
+        print("❌ El encoder INT8 no pasa el gate de precisión")
+        return 1
+    print("✅ El encoder INT8 pasa el gate de precisión")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Cache de respuestas de /recognize por hash del contenido de la imagen
+
+El proxy de Node y el frontend reintentan, así que los mismos bytes llegan
+varias veces. La clave es BLAKE2b(bytes de la imagen) + versión de modelos y
+knowledge base; los requests concurrentes con la misma clave se coalescen
+(single-flight) y solo uno corre la inferencia. Si el resultado del que
+calculó depende de ese request (rechazo por cola llena o su deadline
+vencido), no se comparte: los coalescidos reintentan y uno pasa a calcular.
+Cada coalescido espera como mucho su propio timeout (su deadline), no el del
+que calcula.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Valor que reciben los coalescidos cuando el resultado del líder no se comparte
+RETRY = object()
+
+
+def content_key(data, version=''):
+    """Clave de cache para los bytes de una imagen y una versión de modelos"""
+    digest = hashlib.blake2b(data, digest_size=16)
+    digest.update(version.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU de respuestas acotado por entradas, memoria y TTL, con coalescing de requests"""
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl_seconds=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()  # clave -> (valor, tamaño, timestamp)
+        self._inflight = {}  # clave -> Future del request que está calculando
+        self._lock = threading.Lock()
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._nbytes -= size
+
+    def lookup(self, key):
+        """Valor cacheado y vigente para la clave, o None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, _, timestamp = entry
+                if time.monotonic() - timestamp <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            return None
+
+    def begin(self, key):
+        """Registrar un cálculo para la clave.
+
+        Devuelve (future, leader): si leader es True el llamador debe calcular
+        el valor y llamar a finish()/fail(); si no, basta esperar el future.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            self.misses += 1
+            return future, True
+
+    def finish(self, key, value, cacheable=True):
+        """Publicar el resultado del cálculo (y guardarlo si es cacheable)"""
+        with self._lock:
+            future = self._inflight.pop(key, None)
+            if cacheable:
+                size = len(json.dumps(value, default=str))
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (value, size, time.monotonic())
+                self._nbytes += size
+                while self._entries and (len(self._entries) > self.max_entries or self._nbytes > self.max_bytes):
+                    self._remove(next(iter(self._entries)))
+        if future is not None:
+            future.set_result(value)
+
+    def abandon(self, key):
+        """El líder no obtuvo un resultado compartible: los coalescidos reciben RETRY y reintentan"""
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_result(RETRY)
+
+    def fail(self, key, error):
+        """Propagar un error del cálculo a los requests coalescidos"""
+        with self._lock:
+            future = self._inflight.pop(key, None)
+        if future is not None:
+            future.set_exception(error)
+
+    def get_or_compute(self, key, compute, cacheable=lambda value: True, shareable=lambda value: True,
+                       timeout=None):
+        """Devolver (valor, hit): del cache, de un cálculo en curso o calculándolo.
+
+        Un valor que no es shareable vuelve solo al que lo calculó (no se cachea
+        ni se entrega a los coalescidos, que reintentan). timeout: segundos que
+        se espera el cálculo de otro request (None = sin límite); si se agotan
+        sale TimeoutError y el cálculo sigue para los demás.
+        """
+        expires = None if timeout is None else time.monotonic() + timeout
+        while True:
+            value = self.lookup(key)
+            if value is not None:
+                return value, True
+
+            future, leader = self.begin(key)
+            if not leader:
+                value = future.result(None if expires is None else max(0.0, expires - time.monotonic()))
+                if value is RETRY:
+                    continue
+                return value, True
+
+            try:
+                value = compute()
+            except Exception as e:
+                self.fail(key, e)
+                raise
+            if not shareable(value):
+                self.abandon(key)
+            else:
+                self.finish(key, value, cacheable(value))
+            return value, False
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'entries': len(self._entries),
+            'bytes': self._nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
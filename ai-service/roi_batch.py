@@ -0,0 +1,58 @@
+"""
+Extracción vectorizada de ROIs para SCANIX AI Service
+
+Recorta y redimensiona todas las cajas de una imagen en una sola llamada a
+torchvision.ops.roi_align y deja directamente el batch normalizado que espera
+el encoder de imágenes de CLIP, sin materializar recortes intermedios ni
+preprocesar caja por caja.
+"""
+
+import numpy as np
+import torch
+from torchvision.ops import roi_align
+
+# Normalización de CLIP (openai/clip-vit-base-patch32)
+CLIP_INPUT_SIZE = 224
+CLIP_MEAN = torch.tensor([0.48145466, 0.4578275, 0.40821073]).view(1, 3, 1, 1) * 255
+CLIP_STD = torch.tensor([0.26862954, 0.26130258, 0.27577711]).view(1, 3, 1, 1) * 255
+
+_GRAY_WEIGHTS = torch.tensor([0.299, 0.587, 0.114]).view(1, 3, 1, 1)
+
+
+def image_tensor(image):
+    """Imagen HWC uint8 (NumPy) -> tensor (1, 3, H, W) float32"""
+    return torch.from_numpy(np.ascontiguousarray(image)).permute(2, 0, 1).unsqueeze(0).float()
+
+
+def center_square_boxes(boxes):
+    """Recorte cuadrado centrado de cada caja (equivale a resize del lado corto + center crop de CLIP)"""
+    boxes = torch.as_tensor(boxes, dtype=torch.float32).reshape(-1, 4)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    half = torch.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]).unsqueeze(1) / 2
+    return torch.cat([centers - half, centers + half], dim=1)
+
+
+def crop_resize_batch(tensor, boxes, size):
+    """Todas las cajas recortadas y llevadas a size=(h, w) en una sola operación -> (N, C, h, w)"""
+    boxes = torch.as_tensor(boxes, dtype=torch.float32).reshape(-1, 4)
+    if boxes.shape[0] == 0:
+        return tensor.new_zeros((0, tensor.shape[1]) + tuple(size))
+    # sampling_ratio=-1: muestreo adaptativo por bin, promedia el área de cada celda
+    return roi_align(tensor, [boxes], output_size=size, spatial_scale=1.0, sampling_ratio=-1, aligned=True)
+
+
+def clip_pixel_values(tensor, boxes, size=CLIP_INPUT_SIZE):
+    """Batch (N, 3, size, size) normalizado para el encoder de imágenes de CLIP"""
+    pixels = crop_resize_batch(tensor, center_square_boxes(boxes), (size, size))
+    return (pixels - CLIP_MEAN) / CLIP_STD
+
+
+def gray_blocks(tensor, boxes, rows, cols):
+    """Promedio de gris en una grilla rows x cols por caja -> tensor (N, rows, cols)"""
+    gray = (tensor * _GRAY_WEIGHTS).sum(dim=1, keepdim=True)
+    return crop_resize_batch(gray, boxes, (rows, cols))[:, 0]
+
+
+def gray_block_means(tensor, boxes, rows, cols):
+    """Como gray_blocks, pero devuelve un array NumPy (entrada del dHash)"""
+    return gray_blocks(tensor, boxes, rows, cols).numpy()
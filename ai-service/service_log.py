@@ -0,0 +1,133 @@
+"""
+Logging estructurado y con rate limit para SCANIX AI Service
+
+Cada línea es un evento con nombre y campos (JSON por defecto, o texto con
+SCANIX_LOG_FORMAT=text). Los eventos repetidos, como un error por request
+durante un pico, se limitan con un token bucket por evento; la siguiente
+línea que pasa informa cuántas se descartaron.
+
+    log = get_logger('scanix.app')
+    log.error('yolo_error', "Error en detección YOLO", error=str(e))
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get('SCANIX_LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('SCANIX_LOG_FORMAT', 'json')
+# Líneas por segundo y ráfaga máxima por evento
+LOG_RATE = float(os.environ.get('SCANIX_LOG_RATE', 5))
+LOG_BURST = int(os.environ.get('SCANIX_LOG_BURST', 20))
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket por evento; anota en el record cuántos se suprimieron antes"""
+
+    def __init__(self, rate=LOG_RATE, burst=LOG_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # evento -> [tokens, último refill, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0:
+            return True
+        key = getattr(record, 'event', None) or record.msg
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por evento"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+            'msg': record.getMessage(),
+            **getattr(record, 'fields', {})
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Mensaje legible seguido de los campos como key=value"""
+
+    def format(self, record):
+        fields = dict(getattr(record, 'fields', {}))
+        if getattr(record, 'suppressed', 0):
+            fields['suppressed'] = record.suppressed
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class EventLogger:
+    """Logger con eventos nombrados y campos estructurados"""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def log(self, level, event, message, exc_info=False, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, exc_info=exc_info, extra={'event': event, 'fields': fields})
+
+    def debug(self, event, message, **fields):
+        self.log(logging.DEBUG, event, message, **fields)
+
+    def info(self, event, message, **fields):
+        self.log(logging.INFO, event, message, **fields)
+
+    def warning(self, event, message, **fields):
+        self.log(logging.WARNING, event, message, **fields)
+
+    def error(self, event, message, **fields):
+        self.log(logging.ERROR, event, message, **fields)
+
+
+_configured = False
+
+
+def configure(level=LOG_LEVEL, fmt=LOG_FORMAT, rate=LOG_RATE, burst=LOG_BURST):
+    """Handler a stderr para los loggers 'scanix.*' (idempotente)"""
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(TextFormatter() if fmt == 'text' else JsonFormatter())
+    handler.addFilter(RateLimitFilter(rate, burst))
+    root = logging.getLogger('scanix')
+    root.addHandler(handler)
+    root.setLevel(level)
+    root.propagate = False
+    _configured = True
+
+
+def get_logger(name):
+    configure()
+    return EventLogger(name)
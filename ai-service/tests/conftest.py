@@ -0,0 +1,74 @@
+"""
+Fixtures comunes de los tests de SCANIX AI Service
+
+Los módulos del servicio se importan desde ai-service/ y usan rutas relativas
+(models/...), así que los tests corren con ese directorio como cwd. El fixture
+`service` carga app.py con el knowledge base real de models/ pero con un YOLO
+y un CLIP de prueba: no hace falta models/best.pt ni bajar los pesos de CLIP.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+os.chdir(SERVICE_DIR)
+
+from inference_backends import TorchClipEncoder  # noqa: E402
+
+
+class FakeDetector:
+    """Detector que devuelve siempre las mismas cajas"""
+
+    name = 'fake'
+    imgsz = 640
+
+    def __init__(self, boxes=()):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+    def detect(self, images, conf=None):
+        scores = np.full(len(self.boxes), 0.9, dtype=np.float32)
+        return [(self.boxes.copy(), scores) for _ in images]
+
+
+class FakeEncoder(TorchClipEncoder):
+    """CLIP de prueba: recortes reales (roi_batch), embedding fijo para cada ROI"""
+
+    name = 'fake'
+
+    def __init__(self, vector):
+        super().__init__(batch_size=32, model=object())
+        self.vector = np.asarray(vector, dtype=np.float32)
+
+    def encode(self, batches):
+        count = sum(len(batch) for batch in batches)
+        return np.tile(self.vector, (count, 1))
+
+    def encode_text(self, texts):
+        rng = np.random.default_rng(len(texts))
+        vectors = rng.standard_normal((len(texts), len(self.vector))).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """app.py cargado con detector y encoder de prueba (una caja por imagen)"""
+    import app
+
+    monkeypatch.setattr(app, 'CATALOG_JOURNAL_PATH', str(tmp_path / 'journal.ndjson'))
+    monkeypatch.setattr(app, 'TEXT_PROTOTYPES_MODE', 'off')
+    monkeypatch.setattr(app, 'CLIP_INT8_MODE', '')
+    monkeypatch.setattr(app, 'result_cache', None)
+    monkeypatch.setattr(app, 'embedding_cache', None)
+    monkeypatch.setattr(app, 'load_detector', lambda: FakeDetector([[10, 10, 90, 90]]))
+    monkeypatch.setattr(app, 'load_image_encoder', lambda: FakeEncoder(np.ones(512, dtype=np.float32)))
+    assert app.load_models(warmup=False)
+    return app
@@ -0,0 +1,133 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from admission import AdmissionController, Deadline, DeadlineExceeded, Overloaded
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), (120, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class Waiting:
+    """acquire() en un hilo; guarda el resultado (o la excepción) y libera al terminar"""
+
+    def __init__(self, controller, priority, deadline=None, shed=True, order=None):
+        self.result = None
+        self.done = threading.Event()
+
+        def run():
+            try:
+                started = controller.acquire(priority, deadline, shed=shed)
+                if order is not None:
+                    order.append(priority)
+                controller.release(started, observe=False)
+                self.result = 'granted'
+            except (Overloaded, DeadlineExceeded) as e:
+                self.result = e
+            self.done.set()
+
+        waiting = controller.waiting
+        threading.Thread(target=run, daemon=True).start()
+        wait_for(lambda: controller.waiting > waiting or self.done.is_set())
+
+
+def wait_for(condition, timeout=5.0):
+    limit = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < limit, 'timeout esperando la cola'
+        time.sleep(0.005)
+
+
+def test_interactive_requests_go_before_queued_batch_work():
+    controller = AdmissionController(concurrency=1, max_queue=8)
+    started = controller.acquire('batch')
+    order = []
+    waiters = [Waiting(controller, 'batch', order=order), Waiting(controller, 'batch', order=order),
+               Waiting(controller, 'interactive', order=order)]
+    assert controller.stats()['waiting'] == {'interactive': 1, 'batch': 2}
+
+    controller.release(started)
+    for waiter in waiters:
+        assert waiter.done.wait(5)
+    assert order == ['interactive', 'batch', 'batch']
+    assert controller.running == 0 and controller.admitted == {'interactive': 1, 'batch': 3}
+
+
+def test_full_queue_rejects_with_retry_after():
+    controller = AdmissionController(concurrency=1, max_queue=2, service_time=2.0)
+    started = controller.acquire()
+    assert controller.queue_limit('interactive') == 2 and controller.queue_limit('batch') == 1
+
+    Waiting(controller, 'batch', shed=False)
+    with pytest.raises(Overloaded):
+        controller.check('batch')
+    Waiting(controller, 'interactive')
+    with pytest.raises(Overloaded) as error:
+        controller.acquire('interactive')
+    assert error.value.retry_after == 6  # (2 en cola + 1) * 2 s
+    controller.release(started)
+
+
+def test_interactive_sheds_the_newest_sheddable_batch():
+    controller = AdmissionController(concurrency=1, max_queue=2)
+    started = controller.acquire()
+    kept = Waiting(controller, 'batch', shed=False)
+    shed = Waiting(controller, 'batch')
+
+    interactive = Waiting(controller, 'interactive')
+    assert shed.done.wait(5) and isinstance(shed.result, Overloaded)
+    assert controller.stats()['waiting'] == {'interactive': 1, 'batch': 1}
+
+    # Solo queda un batch no descartable: el siguiente interactivo se rechaza
+    with pytest.raises(Overloaded):
+        controller.acquire('interactive')
+
+    controller.release(started)
+    assert interactive.done.wait(5) and kept.done.wait(5)
+    assert interactive.result == kept.result == 'granted'
+
+
+def test_expired_work_leaves_the_queue_without_running():
+    controller = AdmissionController(concurrency=1)
+    started = controller.acquire()
+    with pytest.raises(DeadlineExceeded):
+        controller.acquire(deadline=Deadline(time.monotonic() - 1))
+
+    late = Waiting(controller, 'interactive', deadline=Deadline.after(50))
+    assert late.done.wait(5) and isinstance(late.result, DeadlineExceeded)
+    assert controller.waiting == 0 and controller.expired == 2
+    controller.release(started)
+    assert controller.running == 0
+
+
+def test_deadline_header():
+    assert Deadline.from_header(None).remaining() is None
+    assert 0 < Deadline.from_header('250').remaining() <= 0.25
+    assert 0 < Deadline.from_header('no', default_ms=1000).remaining() <= 1.0
+    with pytest.raises(DeadlineExceeded) as error:
+        Deadline(time.monotonic() - 1).check('clip')
+    assert error.value.stage == 'clip'
+
+
+def test_recognize_maps_overload_to_503_and_deadlines_to_504(service, monkeypatch):
+    controller = AdmissionController(concurrency=1, max_queue=1)
+    monkeypatch.setattr(service, 'admission', controller)
+    client = service.app.test_client()
+
+    started = controller.acquire()
+    Waiting(controller, 'interactive')
+    response = client.post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'a.png')})
+    assert response.status_code == 503 and int(response.headers['Retry-After']) >= 1
+    controller.release(started)
+    wait_for(lambda: controller.running == 0)
+
+    response = client.post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'b.png')},
+                           headers={'X-Scanix-Deadline-Ms': '0.001'})
+    assert response.status_code == 504 and response.get_json()['stage'] in ('admission', 'decode')
+    assert client.post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'c.png')}).status_code == 200
@@ -0,0 +1,50 @@
+import numpy as np
+
+from ann_index import AnnIndex, build_from_index, source_fingerprint, synthetic_catalog
+
+
+def small_catalog():
+    return synthetic_catalog(2000, 200, dimension=64, seed=1)
+
+
+def test_nbytes_counts_every_resident_array():
+    exact, _ = small_catalog()
+    ann = build_from_index(exact, m=8)
+    assert 'codes' not in vars(ann)
+    resident = sum(a.nbytes for a in vars(ann).values() if isinstance(a, np.ndarray) and a.dtype != object)
+    assert ann.nbytes == resident + ann.pq.codebooks.nbytes
+    # 2 bytes por subespacio y fila (uint16), no 3
+    assert ann.flat_codes.nbytes == 2 * 8 * len(exact.labels)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    exact, _ = small_catalog()
+    ann = build_from_index(exact, m=8)
+    path = str(tmp_path / 'index.ann.npz')
+    ann.save(path)
+    loaded = AnnIndex.load(path)
+
+    np.testing.assert_array_equal(loaded.codes, ann.codes)
+    assert loaded.source_fingerprint == ann.source_fingerprint == source_fingerprint(exact)
+    queries = exact.vectors(slice(0, 50))
+    np.testing.assert_array_equal(loaded.search(queries, k=3)[1], ann.search(queries, k=3)[1])
+
+
+def test_fingerprint_changes_when_a_row_is_replaced():
+    exact, _ = small_catalog()
+    rows = exact.vectors()
+    rows[10] = rows[11]
+    changed = type(exact)(rows, exact.labels, exact.product_ids)
+    assert source_fingerprint(changed) != source_fingerprint(exact)
+
+
+def test_compact_keeps_codes_of_surviving_rows():
+    exact, _ = small_catalog()
+    ann = build_from_index(exact, m=8)
+    keep = np.ones(len(exact.product_ids), dtype=bool)
+    keep[:20] = False
+    compacted = ann.compact(keep, np.empty((0, 64), np.float32), np.empty(0, np.int32),
+                            list(np.asarray(exact.product_ids)[keep]))
+    assert len(compacted.labels) == int(keep[ann.labels].sum())
+    _, ids = compacted.search(exact.vectors(slice(-5, None)), k=1)
+    assert set(ids[:, 0]) <= set(compacted.product_ids)
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+from PIL import Image
+
+# TestClient necesita httpx (no es dependencia del servicio)
+pytest.importorskip('httpx')
+from starlette.testclient import TestClient  # noqa: E402
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), (60, 140, 200)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def clients(service):
+    import asgi
+
+    # Sin `with`: no corre el lifespan, que cargaría los modelos reales
+    return TestClient(asgi.app), service.app.test_client()
+
+
+def test_recognize_matches_the_flask_app(service, clients):
+    asgi_client, flask_client = clients
+    service.image_encoder.vector = service.knowledge_base['sal_celusal_500g']['mean_embedding']
+
+    asgi_body = asgi_client.post('/recognize', files={'image': ('a.png', png_bytes(), 'image/png')}).json()
+    flask_body = flask_client.post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'a.png')}).get_json()
+    for body in (asgi_body, flask_body):
+        body.pop('processing_time', None)
+    assert asgi_body['items'] and asgi_body == flask_body
+
+
+def test_missing_image_and_bad_image(clients):
+    asgi_client, _ = clients
+    assert asgi_client.post('/recognize').status_code == 400
+    response = asgi_client.post('/recognize', files={'image': ('a.png', b'no es una imagen', 'image/png')})
+    assert response.status_code == 400
+
+
+def test_products_and_probes(service, clients):
+    asgi_client, flask_client = clients
+    assert asgi_client.get('/health/live').json() == {'status': 'ok'}
+    response = asgi_client.get('/products')
+    assert response.status_code == 200
+    assert response.content == flask_client.get('/products').data
+    etag = response.headers['etag']
+    assert asgi_client.get('/products', headers={'If-None-Match': etag}).status_code == 304
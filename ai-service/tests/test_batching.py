@@ -0,0 +1,81 @@
+import io
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher, QueueFullError
+
+
+def test_concurrent_items_share_one_batch():
+    release = threading.Event()
+    batches = []
+
+    def process(items):
+        release.wait(5)
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=200)
+    first = batcher.submit(0)
+    futures = [batcher.submit(i) for i in range(1, 4)]
+    release.set()
+
+    assert first.result(5) == 0
+    assert [future.result(5) for future in futures] == [10, 20, 30]
+    # El primero sale solo o junto a los demás, pero los siguientes van en un único batch
+    assert sorted(map(len, batches)) in ([4], [1, 3])
+    assert batcher.items == 4
+
+
+def test_per_item_exceptions_and_batch_failures():
+    def process(items):
+        if 'todo' in items:
+            raise RuntimeError('batch roto')
+        return [ValueError(item) if item == 'malo' else item for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=50)
+    good, bad = batcher.submit('bueno'), batcher.submit('malo')
+    assert good.result(5) == 'bueno'
+    with pytest.raises(ValueError):
+        bad.result(5)
+    with pytest.raises(RuntimeError):
+        batcher.run('todo', timeout=5)
+
+
+def test_full_queue_is_rejected():
+    release = threading.Event()
+    batcher = MicroBatcher(lambda items: release.wait(5) and items, max_batch_size=1, max_wait_ms=0,
+                           max_queue_size=1)
+    running = batcher.submit(1)
+    while batcher.queue_depth:
+        time.sleep(0.001)
+    batcher.submit(2)
+    with pytest.raises(QueueFullError):
+        batcher.submit(3)
+    release.set()
+    assert running.result(5) == 1
+
+
+def test_concurrent_recognize_requests_go_through_the_batcher(service, monkeypatch):
+    from PIL import Image
+
+    monkeypatch.setattr(service, 'BATCH_MAX_WAIT_MS', 50)
+    monkeypatch.setattr(service, 'batcher', None)
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), (90, 90, 90)).save(buffer, format='PNG')
+
+    responses = []
+
+    def post():
+        client = service.app.test_client()
+        responses.append(client.post('/recognize', data={'image': (io.BytesIO(buffer.getvalue()), 'a.png')}))
+
+    threads = [threading.Thread(target=post) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert service.batcher.items == 3
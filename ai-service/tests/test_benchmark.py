@@ -0,0 +1,59 @@
+import csv
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from benchmark import compare, flatten_metrics, parse_size, percentiles, synthetic_image, write_csv
+
+
+def results(decode_p95=10.0, rps=20.0, rss=500.0):
+    return {
+        'stages': {'synthetic_10': {'decode': {'count': 5, 'p50': 8.0, 'p95': decode_p95, 'p99': 12.0},
+                                    'objects': 10}},
+        'throughput': {'c4': {'rps': rps, 'latency_ms': {'p50': 150.0, 'p95': 190.0, 'p99': 200.0}}},
+        'rss_mb': {'after_load': rss, 'peak': None}
+    }
+
+
+def test_percentiles():
+    stats = percentiles(range(1, 101))
+    assert stats['count'] == 100 and stats['mean'] == pytest.approx(50.5)
+    assert stats['p50'] == pytest.approx(50.5) and stats['p99'] == pytest.approx(99.01)
+    assert percentiles([]) == {'count': 0}
+
+
+def test_synthetic_image_is_reproducible():
+    data, boxes = synthetic_image(7, size=(400, 300))
+    assert synthetic_image(7, size=(400, 300))[0] == data
+    assert boxes.shape == (7, 4)
+    assert (boxes[:, 2] <= 400).all() and (boxes[:, 3] <= 300).all()
+    assert Image.open(io.BytesIO(data)).size == (400, 300)
+
+
+def test_flatten_metrics():
+    metrics = flatten_metrics(results())
+    assert metrics['stage.synthetic_10.decode.p95'] == 10.0
+    assert metrics['throughput.c4.rps'] == 20.0 and metrics['throughput.c4.p99'] == 200.0
+    assert metrics['rss_mb.after_load'] == 500.0 and 'rss_mb.peak' not in metrics
+    assert not any('objects' in name for name in metrics)
+
+
+def test_compare_flags_regressions_beyond_the_tolerance():
+    baseline = flatten_metrics(results())
+    assert compare(flatten_metrics(results(decode_p95=11.0)), baseline, 0.15, 1.0) == []
+
+    regressions = compare(flatten_metrics(results(decode_p95=12.0, rps=15.0, rss=700.0)), baseline, 0.15, 1.0)
+    assert {r['metric'] for r in regressions} == {'stage.synthetic_10.decode.p95', 'throughput.c4.rps',
+                                                  'rss_mb.after_load'}
+    # Una latencia más lenta pero bajo el piso de ruido no cuenta; más rps nunca es regresión
+    assert compare(flatten_metrics(results(decode_p95=12.0, rps=40.0)), baseline, 0.15, 50.0) == []
+
+
+def test_write_csv(tmp_path):
+    path = tmp_path / 'bench.csv'
+    write_csv(str(path), {'b': 2.0, 'a': 1.0 / 3})
+    with open(path, newline='', encoding='utf-8') as f:
+        assert list(csv.reader(f)) == [['metric', 'value'], ['a', '0.333333'], ['b', '2']]
+    assert parse_size('4000x3000') == (4000, 3000)
@@ -0,0 +1,115 @@
+import io
+import json
+import tarfile
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from bulk import BulkItemError, iter_archive, recognize_bulk
+
+
+def png_bytes(color=(120, 80, 40)):
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def tar_bytes(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def ndjson(body):
+    return [json.loads(line) for line in body.splitlines() if line]
+
+
+def test_recognize_bulk_keeps_order_and_isolates_errors():
+    def decode(data):
+        if data == b'roto':
+            raise BulkItemError(413, 'demasiado grande', max_pixels=10)
+        return data.decode()
+
+    batches = []
+
+    def recognize_batch(images):
+        batches.append(images)
+        if 'falla' in images:
+            raise BulkItemError(503, 'saturado', retry_after=1)
+        return [{'success': True, 'image': image} for image in images]
+
+    items = [('a', b'a'), ('b', b'roto'), ('c', b'c'), ('d', b'falla'), ('e', b'e')]
+    lines = list(recognize_bulk(iter(items), decode, recognize_batch, batch_size=2, decode_workers=2))
+
+    assert [(line['index'], line['name'], line['status']) for line in lines] == [
+        (0, 'a', 200), (1, 'b', 413), (2, 'c', 503), (3, 'd', 503), (4, 'e', 200)]
+    assert lines[1]['max_pixels'] == 10 and lines[2]['retry_after'] == 1
+    assert batches == [['a'], ['c', 'falla'], ['e']]
+
+
+def test_archives_yield_only_images(tmp_path):
+    files = {'fotos/a.jpg': b'1', 'fotos/.oculta.jpg': b'2', '__MACOSX/fotos/a.jpg': b'3', 'notas.txt': b'4',
+             'fotos/b.PNG': b'5'}
+    assert list(iter_archive(io.BytesIO(tar_bytes(files)))) == [('fotos/a.jpg', b'1'), ('fotos/b.PNG', b'5')]
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    assert [name for name, _ in iter_archive(buffer)] == ['fotos/a.jpg', 'fotos/b.PNG']
+
+    with pytest.raises(BulkItemError):
+        list(iter_archive(io.BytesIO(b'esto no es un tar')))
+
+
+def test_batch_endpoint_streams_one_line_per_image(service):
+    client = service.app.test_client()
+    response = client.post('/recognize/batch', data={'images': [
+        (io.BytesIO(png_bytes()), 'a.png'), (io.BytesIO(b'no es una imagen'), 'b.png'),
+        (io.BytesIO(png_bytes((10, 200, 10))), 'c.png')]})
+
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    lines = ndjson(response.get_data())
+    assert [(line['name'], line['status']) for line in lines] == [('a.png', 200), ('b.png', 400), ('c.png', 200)]
+    assert lines[0]['success'] and lines[0]['detections'] == 1
+
+    raw = client.post('/recognize/batch', data=tar_bytes({'x.png': png_bytes(), 'y.png': png_bytes()}),
+                      content_type='application/x-tar')
+    assert [line['name'] for line in ndjson(raw.get_data())] == ['x.png', 'y.png']
+    assert client.post('/recognize/batch').status_code == 400
+
+
+def test_batch_upload_limits(service, monkeypatch):
+    monkeypatch.setattr(service, 'BULK_MAX_UPLOAD_BYTES', 1024)
+    client = service.app.test_client()
+    response = client.post('/recognize/batch', data={'images': [(io.BytesIO(png_bytes()), 'a.png')] * 8})
+    assert response.status_code == 413
+
+
+def test_asgi_batch_upload_limits(service, monkeypatch):
+    pytest.importorskip('httpx')
+    from starlette.testclient import TestClient
+
+    import asgi
+
+    client = TestClient(asgi.app)
+    files = [('images', (f'{i}.png', png_bytes(), 'image/png')) for i in range(3)]
+    lines = ndjson(client.post('/recognize/batch', files=files).content)
+    assert [line['status'] for line in lines] == [200, 200, 200]
+
+    monkeypatch.setattr(service, 'BULK_MAX_FILES', 2)
+    assert client.post('/recognize/batch', files=files).status_code == 400
+
+    monkeypatch.setattr(service, 'BULK_MAX_UPLOAD_BYTES', 1024)
+    assert client.post('/recognize/batch', files=files).status_code == 413
+    noise = np.random.default_rng(0).integers(0, 256, 4096, dtype=np.uint8).tobytes()
+    response = client.post('/recognize/batch', content=tar_bytes({'x.png': noise}),
+                           headers={'content-type': 'application/x-tar'})
+    assert response.status_code == 413
@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from catalog_updates import LiveCatalog, LiveIndex
+from embedding_index import EmbeddingIndex, normalize_rows
+
+DIMENSION = 8
+
+
+def base_index():
+    rows = normalize_rows(np.eye(4, DIMENSION, dtype=np.float32))
+    return EmbeddingIndex(rows, [0, 0, 1, 2], ['a', 'b', 'c'], normalized=True)
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), (10, 120, 30)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_empty_live_index_returns_no_candidates():
+    live = LiveIndex.from_base(base_index())
+    for product_id in ('a', 'b', 'c'):
+        live = live.remove(product_id)
+    similarities, product_ids = live.search(np.ones((3, DIMENSION), np.float32), k=1)
+    assert similarities.shape == product_ids.shape == (3, 0)
+    assert live.compact().search(np.ones((1, DIMENSION), np.float32))[1].shape == (1, 0)
+
+
+def test_recognize_with_an_empty_catalog_is_not_an_error(service):
+    for product_id in list(service.catalog.snapshot.index.product_ids):
+        service.catalog.remove(product_id)
+    assert len(service.catalog.snapshot.index) == 0
+
+    assert service.match_embeddings(np.ones((2, 512), np.float32)) == [None, None]
+    assert service.identify_boxes(np.zeros((100, 100, 3), np.uint8), np.array([[10, 10, 90, 90]], np.float32)) \
+        == [(None, 0.0, 0.0)]
+    response = service.app.test_client().post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'a.png')})
+    assert response.status_code == 200
+    assert response.get_json()['items'] == []
+
+
+def test_upsert_remove_and_replay_from_the_journal(tmp_path):
+    journal = str(tmp_path / 'journal.ndjson')
+    catalog = LiveCatalog(base_index(), {'a': {}, 'b': {}, 'c': {}}, journal_path=journal)
+    catalog.upsert('d', {'nombre': 'D'}, np.eye(1, DIMENSION, 5, dtype=np.float32))
+    catalog.remove('b')
+
+    replayed = LiveCatalog(base_index(), {'a': {}, 'b': {}, 'c': {}}, journal_path=journal)
+    for snapshot in (catalog.snapshot, replayed.snapshot):
+        assert sorted(snapshot.index.product_ids) == ['a', 'c', 'd']
+        assert snapshot.product_mapping['d']['nombre'] == 'D'
+        _, product_ids = snapshot.index.search(np.eye(1, DIMENSION, 5, dtype=np.float32))
+        assert product_ids[0, 0] == 'd'
+
+
+def test_compaction_keeps_search_results():
+    live = LiveIndex.from_base(base_index()).append('d', np.eye(1, DIMENSION, 6, dtype=np.float32)).remove('a')
+    queries = normalize_rows(np.random.default_rng(0).standard_normal((20, DIMENSION)).astype(np.float32))
+    before = live.search(queries, k=2)
+    after = live.compact().search(queries, k=2)
+    np.testing.assert_array_equal(before[1], after[1])
+    np.testing.assert_allclose(before[0], after[0], rtol=1e-6)
@@ -0,0 +1,62 @@
+import pytest
+
+import cpu_topology
+from cpu_topology import (candidate_layouts, format_cpulist, free_slot, parse_cpulist, recommend, worker_count,
+                          worker_cpus)
+
+
+def test_cpulists_round_trip():
+    assert parse_cpulist('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+    assert format_cpulist([11, 0, 1, 2, 3, 8, 10]) == '0-3,8,10-11'
+    assert parse_cpulist('') == []
+
+
+def test_workers_get_disjoint_physical_cores_first(monkeypatch):
+    # 4 núcleos físicos con hyper-threading: hermanos 0/4, 1/5, 2/6, 3/7
+    monkeypatch.setattr(cpu_topology, 'physical_first', lambda cpus: [0, 1, 2, 3, 4, 5, 6, 7])
+    cpus = list(range(8))
+
+    assert [worker_cpus(slot, 4, 2, cpus) for slot in range(4)] == [[0, 1], [2, 3], [4, 5], [6, 7]]
+    # Más workers que bloques: se reparten circularmente
+    assert worker_cpus(5, 8, 4, cpus) == [4, 5, 6, 7]
+    assert worker_cpus(0, 2, 2, cpus, mode='none') is None
+    assert worker_cpus(1, 2, 2, cpus, mode='node') == cpus
+    with pytest.raises(ValueError):
+        worker_cpus(0, 2, 2, cpus, mode='numa')
+
+
+def test_restarted_workers_reuse_the_free_slot():
+    assert free_slot([], 4) == 0
+    assert free_slot([0, 1, 3], 4) == 2
+    assert free_slot([0, 1, 2, 3], 4) == 4
+
+
+def test_worker_count_and_threads(monkeypatch):
+    monkeypatch.setattr(cpu_topology, '_worker', {})
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    assert worker_count() == 1
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    assert worker_count() == 3
+
+    monkeypatch.setattr(cpu_topology, 'configure_torch', lambda threads, interop_threads=None: (threads, 1))
+    topology = cpu_topology.configure_worker(1, 4, 2, mode='none')
+    assert worker_count() == 4 and cpu_topology.intra_op_threads() == 2
+    assert topology['slot'] == 1 and topology['workers'] == 4 and topology['pinning'] == 'none'
+
+
+def test_unknown_numa_node(monkeypatch):
+    monkeypatch.setattr(cpu_topology, 'numa_nodes', lambda: {0: [0, 1], 1: [2, 3]})
+    assert cpu_topology.topology_cpus(1) == [2, 3]
+    with pytest.raises(ValueError):
+        cpu_topology.topology_cpus(2)
+
+
+def test_calibration_layouts_and_recommendation():
+    assert candidate_layouts(8, [1, 4, 16]) == [(1, 1), (2, 1), (4, 1), (8, 1), (1, 4), (2, 4)]
+    assert candidate_layouts(6, [4]) == [(1, 4)]
+
+    results = [{'workers': 8, 'threads': 1, 'rps': 40.0, 'p95_ms': 900.0},
+               {'workers': 2, 'threads': 4, 'rps': 30.0, 'p95_ms': 200.0}]
+    assert recommend(results)['workers'] == 8
+    assert recommend(results, max_p95_ms=500)['workers'] == 2
+    assert recommend(results, max_p95_ms=50)['workers'] == 8
@@ -0,0 +1,78 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache, dhash_from_blocks
+
+
+def random_key(rng, size=32):
+    return rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+
+
+def flip_bits(key, count):
+    bits = np.unpackbits(np.frombuffer(key, dtype=np.uint8))
+    bits[:count] ^= 1
+    return np.packbits(bits).tobytes()
+
+
+def hamming(a, b):
+    return int(np.unpackbits(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+
+def assert_matrix_matches_entries(cache):
+    valid = np.flatnonzero(cache._valid[:len(cache._slot_keys)])
+    assert len(valid) == len(cache) == len(cache._slots)
+    for key, slot in cache._slots.items():
+        assert key in cache._entries
+        assert cache._slot_keys[slot] == key
+        assert cache._hash_matrix[slot].tobytes() == key
+    assert set(cache._free) == set(range(len(cache._slot_keys))) - set(valid.tolist())
+
+
+def test_hamming_matrix_tracks_puts_and_evictions():
+    rng = np.random.default_rng(0)
+    cache = EmbeddingCache(max_entries=50, tolerance=0)
+    keys = [random_key(rng) for _ in range(300)]
+    for i, key in enumerate(keys):
+        cache.put(key, np.full(4, i, np.float32))
+        if i % 7 == 0:
+            cache.put(keys[i // 2], np.zeros(4, np.float32))
+        assert_matrix_matches_entries(cache)
+
+    assert len(cache) == 50
+    # Las filas de los desalojados se reutilizan: la matriz no crece con cada put
+    assert len(cache._slot_keys) <= 64
+    assert cache.get(keys[-1])[0] == 299
+    assert cache.get(keys[0]) is None
+
+
+def test_nearest_matches_a_brute_force_scan_after_evictions():
+    rng = np.random.default_rng(1)
+    cache = EmbeddingCache(max_entries=40, tolerance=8)
+    keys = [random_key(rng) for _ in range(120)]
+    for i, key in enumerate(keys):
+        cache.put(key, np.full(4, i, np.float32))
+
+    for key in keys:
+        query = flip_bits(key, 5)
+        live = [k for k in cache._entries if hamming(k, query) <= 8]
+        found = cache.get(query)
+        if live:
+            assert found is not None and found[0] == keys.index(live[0])
+        else:
+            assert found is None
+
+
+def test_ttl_and_memory_limits():
+    cache = EmbeddingCache(max_entries=100, max_bytes=3 * 16, ttl_seconds=0, tolerance=0)
+    for i in range(5):
+        cache.put(bytes([i]) * 32, np.zeros(4, np.float32))
+    assert len(cache) == 3
+    assert cache.get(bytes([4]) * 32) is None
+    assert_matrix_matches_entries(cache)
+
+
+def test_dhash_from_blocks_compares_horizontal_neighbours():
+    blocks = np.tile(np.arange(17, dtype=np.float32), (2, 16, 1))
+    blocks[1] = blocks[1][:, ::-1]
+    increasing, decreasing = dhash_from_blocks(blocks)
+    assert increasing == b'\xff' * 32
+    assert decreasing == b'\x00' * 32
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex, normalize_rows, top_k
+
+
+def knowledge_base(seed=0, dimension=32):
+    rng = np.random.default_rng(seed)
+    kb = {}
+    for i in range(12):
+        samples = rng.standard_normal((int(rng.integers(0, 5)), dimension)).astype(np.float32)
+        kb[f'p{i}'] = {'embeddings': samples, 'mean_embedding': rng.standard_normal(dimension).astype(np.float32)}
+    kb['sin_embeddings'] = {'embeddings': None, 'mean_embedding': None}
+    return kb
+
+
+def brute_force(kb, queries):
+    """Similitud máxima por producto, producto por producto"""
+    product_ids, best = [], []
+    for product_id, entry in kb.items():
+        rows = [entry[k] for k in ('mean_embedding', 'embeddings') if entry[k] is not None and len(entry[k])]
+        if not rows:
+            continue
+        rows = normalize_rows(np.concatenate([np.reshape(r, (-1, queries.shape[1])) for r in rows]))
+        product_ids.append(product_id)
+        best.append((normalize_rows(queries) @ rows.T).max(axis=1))
+    return np.array(product_ids, dtype=object), np.stack(best, axis=1)
+
+
+def test_search_matches_a_per_product_scan():
+    kb = knowledge_base()
+    index = EmbeddingIndex.from_knowledge_base(kb)
+    queries = np.random.default_rng(1).standard_normal((20, 32)).astype(np.float32)
+
+    similarities, product_ids = index.search(queries, k=3)
+    ids, expected = brute_force(kb, queries)
+    order = np.argsort(-expected, axis=1)[:, :3]
+    np.testing.assert_array_equal(product_ids, ids[order])
+    np.testing.assert_allclose(similarities, np.take_along_axis(expected, order, axis=1), rtol=1e-5)
+    assert 'sin_embeddings' not in set(index.product_ids)
+
+
+def test_top_k_is_sorted_and_clamped():
+    similarities = np.array([[0.1, 0.9, 0.5], [0.7, 0.2, 0.3]], dtype=np.float32)
+    values, columns = top_k(similarities, 5)
+    np.testing.assert_array_equal(columns, [[1, 2, 0], [0, 2, 1]])
+    np.testing.assert_allclose(values, [[0.9, 0.5, 0.1], [0.7, 0.3, 0.2]])
+
+
+def test_rows_must_be_grouped_by_product():
+    with pytest.raises(ValueError):
+        EmbeddingIndex(np.eye(3, dtype=np.float32), [0, 1, 0], ['a', 'b'])
+    with pytest.raises(ValueError):
+        EmbeddingIndex(np.eye(3, dtype=np.float32), [0, 1], ['a', 'b'])
+
+
+def test_empty_knowledge_base_is_rejected():
+    with pytest.raises(ValueError):
+        EmbeddingIndex.from_knowledge_base({'a': {'embeddings': None, 'mean_embedding': None}})
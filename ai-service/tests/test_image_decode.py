@@ -0,0 +1,54 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_decode import ImageTooLargeError, decode_image, reduction_factor
+
+
+def encoded(size, image_format='JPEG', color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def test_reduction_factor_keeps_the_long_side_above_the_target():
+    assert reduction_factor(4000, 3000, 1280) == 2
+    assert reduction_factor(12000, 9000, 1280) == 8
+    assert reduction_factor(1000, 800, 1280) == 1
+
+
+def test_large_jpegs_are_decoded_reduced_with_a_scale_back_to_the_original():
+    decoded = decode_image(encoded((4000, 3000)), target_size=1280)
+    assert decoded.array.dtype == np.uint8 and decoded.array.shape[2] == 3
+    assert max(decoded.array.shape[:2]) >= 1280
+    assert decoded.scale == pytest.approx(4000 / decoded.array.shape[1])
+    # RGB, no BGR
+    assert decoded.array[10, 10, 0] > decoded.array[10, 10, 2]
+
+
+def test_small_pngs_are_decoded_as_is():
+    decoded = decode_image(encoded((300, 200), 'PNG', (0, 0, 255)), target_size=1280)
+    assert decoded.array.shape == (200, 300, 3) and decoded.scale == 1.0
+    assert tuple(decoded.array[0, 0]) == (0, 0, 255)
+
+
+def test_limits_are_checked_before_decoding():
+    with pytest.raises(ImageTooLargeError):
+        decode_image(encoded((100, 100)), max_bytes=10)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(encoded((3000, 3000)), max_pixels=1_000_000)
+
+
+def test_decompression_bombs_are_too_large_not_invalid(monkeypatch):
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    with pytest.raises(ImageTooLargeError):
+        decode_image(encoded((100, 100), 'PNG'), max_pixels=10_000_000)
+
+
+def test_recognize_answers_413_for_bombs(service, monkeypatch):
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    response = service.app.test_client().post(
+        '/recognize', data={'image': (io.BytesIO(encoded((100, 100), 'PNG')), 'bomba.png')})
+    assert response.status_code == 413
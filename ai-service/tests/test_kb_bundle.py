@@ -0,0 +1,59 @@
+import json
+import pickle
+
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex
+from kb_bundle import BundleError, compile_bundle, load_bundle
+
+
+@pytest.fixture
+def knowledge_base():
+    with open('models/knowledge_base.pkl', 'rb') as f:
+        kb = pickle.load(f)
+    with open('models/product_mapping.json') as f:
+        mapping = json.load(f)
+    return kb, mapping
+
+
+@pytest.mark.parametrize('precision', ['fp32', 'fp16'])
+def test_bundle_searches_like_the_pickle(tmp_path, knowledge_base, precision):
+    kb, mapping = knowledge_base
+    path = str(tmp_path / 'kb.scxkb')
+    compile_bundle(kb, mapping, path, precision=precision)
+
+    bundle = load_bundle(path)
+    index = bundle.build_index()
+    assert isinstance(index.embeddings, np.memmap)
+    assert bundle.product_mapping == mapping
+
+    exact = EmbeddingIndex.from_knowledge_base(kb)
+    queries = exact.vectors(slice(0, 40))
+    similarities, product_ids = index.search(queries, k=2)
+    expected_similarities, expected_ids = exact.search(queries, k=2)
+    np.testing.assert_array_equal(product_ids[:, 0], expected_ids[:, 0])
+    np.testing.assert_allclose(similarities, expected_similarities, atol=1e-3 if precision == 'fp16' else 1e-6)
+
+
+def test_corrupted_payload_is_rejected(tmp_path, knowledge_base):
+    path = str(tmp_path / 'kb.scxkb')
+    compile_bundle(*knowledge_base, path)
+    with open(path, 'r+b') as f:
+        f.seek(-8, 2)
+        f.write(b'\xff' * 8)
+
+    with pytest.raises(BundleError):
+        load_bundle(path)
+    # Sin verificar abre igual (arranque rápido confiando en el archivo)
+    assert len(load_bundle(path, verify=False)) == len(knowledge_base[0])
+
+
+def test_truncated_or_foreign_files_are_rejected(tmp_path):
+    path = tmp_path / 'otro.bin'
+    path.write_bytes(b'no es un bundle de scanix')
+    with pytest.raises(BundleError):
+        load_bundle(str(path))
+    path.write_bytes(b'SCAN')
+    with pytest.raises(BundleError):
+        load_bundle(str(path))
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from embedding_index import EmbeddingIndex, normalize_rows, probe_queries, select_precision
+
+
+def clustered_index(products=40, samples=8, dimension=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((products, dimension))
+    rows = centers.repeat(samples, axis=0) + 0.3 * rng.standard_normal((products * samples, dimension))
+    labels = np.arange(products).repeat(samples)
+    return EmbeddingIndex(normalize_rows(rows), labels, [f'p{i}' for i in range(products)])
+
+
+def test_fp16_halves_memory_and_keeps_the_ranking():
+    exact = clustered_index()
+    fp16 = exact.compress('fp16')
+    queries = probe_queries(exact, count=100)
+
+    assert fp16.precision == 'fp16' and fp16.embeddings.dtype == np.float16
+    assert fp16.embeddings.nbytes * 2 == exact.embeddings.nbytes
+    np.testing.assert_allclose(fp16.product_similarities(queries), exact.product_similarities(queries), atol=2e-3)
+    assert fp16.compress('fp32').precision == 'fp32'
+
+
+def test_pq_stores_codes_and_passes_the_gate():
+    exact = clustered_index(products=200, samples=10)
+    index, report = select_precision(exact, 'pq', m=16)
+
+    assert index.precision == 'pq' and report['active'] == 'pq' and report['ok']
+    assert report['m'] == 16 and report['compression'] > 2
+    assert index.nbytes == report['bytes'] < exact.nbytes
+    assert index.vectors().shape == exact.vectors().shape
+    queries = probe_queries(exact, count=50)
+    assert (index.search(queries, k=1)[1] == exact.search(queries, k=1)[1]).mean() >= 0.98
+
+
+def test_rejected_or_failed_compression_keeps_the_original():
+    exact = clustered_index()
+    assert select_precision(exact, 'fp32') == (exact, {'requested': 'fp32', 'active': 'fp32'})
+
+    index, report = select_precision(exact, 'pq', m=16, min_agreement=1.01)
+    assert index is exact and report['active'] == 'fp32' and not report['ok'] and 'acuerdo' in report['reason']
+
+    index, report = select_precision(exact, 'int4')
+    assert index is exact and 'error comprimiendo' in report['reason']
+    with pytest.raises(ValueError):
+        exact.compress('int4')
+
+
+def test_compression_keeps_text_rows():
+    exact = clustered_index(products=4)
+    text = normalize_rows(np.random.default_rng(1).standard_normal((1, 64)))
+    with_text = exact.with_text([*exact.product_ids, 'solo_texto'], text, np.array([4]), 1.0)
+
+    for precision in ('fp16', 'pq'):
+        compressed = with_text.compress(precision, m=8)
+        assert compressed.product_ids[-1] == 'solo_texto'
+        assert compressed.search(text, k=1)[1][0, 0] == 'solo_texto'
+        assert compressed.nbytes >= text.nbytes
+
+
+def test_service_compresses_the_knowledge_base(service, monkeypatch):
+    monkeypatch.setattr(service, 'KB_PRECISION', 'fp16')
+    assert service.load_models(warmup=False)
+    assert service.index_status['precision'] == 'fp16'
+    assert service.index_status['compression']['active'] == 'fp16'
+    assert service.index_status['bytes'] == service.embedding_index.base.nbytes
+
+    monkeypatch.setattr(service, 'KB_MIN_AGREEMENT', 1.01)
+    assert service.load_models(warmup=False)
+    assert service.index_status['precision'] == 'fp32'
+    assert service.index_status['compression']['active'] == 'fp32'
@@ -0,0 +1,75 @@
+import io
+import re
+
+import pytest
+from PIL import Image
+
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def png_bytes(size=(100, 100)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def sample(text, name):
+    """Valor de una serie en el texto de Prometheus"""
+    match = re.search(rf'^{re.escape(name)} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_text_format():
+    registry = Registry()
+    requests = Counter('demo_requests', 'Requests', ['route'], registry=registry)
+    in_flight = Gauge('demo_in_flight', 'En curso', registry=registry)
+    Gauge('demo_depth', 'Cola', ['queue'], registry=registry, callback=lambda: {('a', ): 3, ('b', ): None})
+    latency = Histogram('demo_seconds', 'Latencia', registry=registry, buckets=(0.1, 1.0))
+
+    requests.labels('/recognize').inc()
+    requests.labels('/recognize').inc(2)
+    with in_flight.track_inprogress():
+        assert sample(registry.render(), 'demo_in_flight') == 1
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert '# TYPE demo_requests counter' in text
+    assert sample(text, 'demo_requests_total{route="/recognize"}') == 3
+    assert sample(text, 'demo_in_flight') == 0
+    assert sample(text, 'demo_depth{queue="a"}') == 3 and 'queue="b"' not in text
+    assert sample(text, 'demo_seconds_bucket{le="0.1"}') == 1
+    assert sample(text, 'demo_seconds_bucket{le="1"}') == 2
+    assert sample(text, 'demo_seconds_bucket{le="+Inf"}') == 3
+    assert sample(text, 'demo_seconds_count') == 3 and sample(text, 'demo_seconds_sum') == pytest.approx(5.55)
+
+
+def test_labels_are_checked_and_names_unique():
+    registry = Registry()
+    counter = Counter('demo_errors', 'Errores', ['type'], registry=registry)
+    with pytest.raises(ValueError):
+        counter.labels('a', 'b')
+    with pytest.raises(ValueError):
+        Gauge('demo_errors', 'Otra', registry=registry)
+    counter.labels('say "hi"\n').inc()
+    assert 'demo_errors_total{type="say \\"hi\\"\\n"} 1' in registry.render()
+
+
+def test_recognize_updates_the_service_metrics(service, monkeypatch):
+    monkeypatch.setattr(service, 'warmed_up', True)
+    client = service.app.test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+
+    assert client.post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'a.png')}).status_code == 200
+
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    after = response.get_data(as_text=True)
+    for stage in ('decode', 'yolo', 'clip', 'search', 'serialize'):
+        series = f'scanix_stage_seconds_count{{stage="{stage}"}}'
+        assert sample(after, series) == (sample(before, series) or 0) + 1
+    assert sample(after, 'scanix_detections_total') == (sample(before, 'scanix_detections_total') or 0) + 1
+    assert sample(after, 'scanix_ready') == 1
+    assert sample(after, 'scanix_requests_in_flight') == 0
+    assert sample(after, 'scanix_process_rss_bytes') > 0
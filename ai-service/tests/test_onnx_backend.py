@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+import cpu_topology
+import onnx_backend
+from conftest import FakeDetector, FakeEncoder, unit
+from onnx_backend import OnnxDetector, check_parity, letterbox, nms
+
+
+class FakeSession:
+    """Sesión de ONNX Runtime que devuelve una predicción fija"""
+
+    def __init__(self, prediction):
+        self.prediction = prediction
+        self.inputs = []
+
+    def run(self, outputs, feeds):
+        self.inputs.append(feeds)
+        return [self.prediction]
+
+
+def fake_detector(prediction, imgsz=64):
+    detector = OnnxDetector.__new__(OnnxDetector)
+    detector.session = FakeSession(prediction)
+    detector.input_name = 'images'
+    detector.imgsz = imgsz
+    detector.conf, detector.iou, detector.max_det = 0.5, 0.7, 300
+    return detector
+
+
+def test_nms_keeps_the_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.6, 0.9, 0.8], dtype=np.float32)
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+
+
+def test_letterbox_pads_to_a_square_keeping_the_aspect():
+    image = np.zeros((32, 64, 3), dtype=np.uint8)
+    canvas, ratio, (pad_x, pad_y) = letterbox(image, 64)
+    assert canvas.shape == (64, 64, 3)
+    assert ratio == 1.0 and (pad_x, pad_y) == (0, 16)
+    assert (canvas[:16] == 114).all() and (canvas[16:48] == 0).all()
+
+
+def test_detect_undoes_the_letterbox():
+    # Una caja (xywh en el canvas de 64) de la clase 1, más un ancla bajo el umbral
+    prediction = np.array([[[32, 32], [32, 32], [32, 8], [16, 8], [0.1, 0.1], [0.9, 0.2]]], dtype=np.float32)
+    detector = fake_detector(prediction)
+    image = np.zeros((32, 64, 3), dtype=np.uint8)
+
+    [(boxes, scores)] = detector.detect([image])
+
+    np.testing.assert_allclose(boxes, [[16, 8, 48, 24]])
+    np.testing.assert_allclose(scores, [0.9])
+    batch = detector.session.inputs[0]['images']
+    assert batch.shape == (1, 3, 64, 64) and batch.dtype == np.float32 and batch.max() <= 1.0
+
+
+def test_session_threads_follow_the_worker_budget(monkeypatch, tmp_path):
+    onnx = pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    from onnx import TensorProto, helper
+
+    graph = helper.make_graph([helper.make_node('Identity', ['x'], ['y'])], 'identity',
+                              [helper.make_tensor_value_info('x', TensorProto.FLOAT, [1])],
+                              [helper.make_tensor_value_info('y', TensorProto.FLOAT, [1])])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', onnx_backend.OPSET)])
+    model.ir_version = 8
+    path = tmp_path / 'identity.onnx'
+    onnx.save(model, str(path))
+
+    monkeypatch.setattr(cpu_topology, '_worker', {})
+    monkeypatch.setenv('SCANIX_TORCH_THREADS', '2')
+    assert cpu_topology.intra_op_threads() == 2
+    assert onnx_backend.create_session(str(path)).get_session_options().intra_op_num_threads == 2
+    assert onnx_backend.create_session(str(path), threads=3).get_session_options().intra_op_num_threads == 3
+
+    monkeypatch.setattr(cpu_topology, '_worker', {'threads': 5})
+    assert cpu_topology.intra_op_threads() == 5
+
+
+def test_parity_report():
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    reference = (FakeDetector([[10, 10, 90, 90]]), FakeEncoder(unit(np.ones(8))))
+
+    report = check_parity(reference, (FakeDetector([[11, 11, 90, 90]]), FakeEncoder(unit(np.ones(8)))), image)
+    assert report['ok'] and report['detections'] == [1, 1]
+    assert report['min_embedding_cosine'] == pytest.approx(1.0)
+
+    drifted = FakeEncoder(unit(np.arange(8)))
+    assert not check_parity(reference, (FakeDetector([[10, 10, 90, 90]]), drifted), image)['ok']
+    assert not check_parity(reference, (FakeDetector([]), reference[1]), image)['ok']
+
+
+def test_parity_failure_falls_back_to_torch(service, monkeypatch):
+    torch_models = (FakeDetector([[0, 0, 5, 5]]), FakeEncoder(np.ones(512)))
+    monkeypatch.setattr(service, 'load_torch_models', lambda: torch_models)
+    monkeypatch.setattr(service, 'backend_status', {'requested': 'onnx', 'active': 'onnx', 'parity': None})
+    onnx_models = (FakeDetector([[10, 10, 90, 90]]), FakeEncoder(unit(np.arange(512))))
+
+    assert service.verify_onnx_parity(*onnx_models) == torch_models
+    assert service.backend_status['active'] == 'torch'
+    assert service.backend_status['parity']['ok'] is False
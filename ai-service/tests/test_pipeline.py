@@ -0,0 +1,52 @@
+import numpy as np
+
+from conftest import FakeDetector
+
+
+class CountingEncoder:
+    """Envuelve el encoder de prueba y registra cada llamada a encode"""
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+        self.calls = []
+
+    def __getattr__(self, name):
+        return getattr(self.encoder, name)
+
+    def encode(self, batches):
+        batches = list(batches)
+        self.calls.append(sum(len(batch) for batch in batches))
+        return self.encoder.encode(batches)
+
+
+def test_all_rois_of_all_images_go_through_clip_in_one_call(service, monkeypatch):
+    encoder = CountingEncoder(service.image_encoder)
+    monkeypatch.setattr(service, 'image_encoder', encoder)
+    monkeypatch.setattr(service, 'detector', FakeDetector([[0, 0, 40, 40], [50, 50, 90, 90], [10, 60, 30, 95]]))
+    monkeypatch.setattr(service, 'tiled_detector', None)
+
+    images = [np.full((100, 100, 3), value, dtype=np.uint8) for value in (30, 200)]
+    results = service.recognize_images(images)
+
+    assert encoder.calls == [6]
+    assert [len(detections) for detections in results] == [3, 3]
+    assert all(detection['recognition'] is not None for detections in results for detection in detections)
+
+
+def test_degenerate_boxes_are_skipped(service, monkeypatch):
+    encoder = CountingEncoder(service.image_encoder)
+    monkeypatch.setattr(service, 'image_encoder', encoder)
+    monkeypatch.setattr(service, 'detector', FakeDetector([[10, 10, 10, 50], [0, 0, 40, 40]]))
+    monkeypatch.setattr(service, 'tiled_detector', None)
+
+    detections = service.recognize_images([np.zeros((100, 100, 3), dtype=np.uint8)])[0]
+    assert encoder.calls == [1]
+    assert [detection['recognition'] is None for detection in detections] == [True, False]
+
+
+def test_recognize_payload_scales_boxes_back_to_the_original_image(service):
+    detections = [{'bbox': [10, 20, 30, 40], 'confidence': 0.9,
+                   'recognition': {'product_id': 'sal_celusal_500g', 'similarity': 0.95, 'score': 0.95,
+                                   'product_info': service.product_mapping['sal_celusal_500g']}}]
+    payload = service.recognition_payload(detections, scale=2.0)
+    assert payload['items'][0]['bbox'] == [20, 40, 60, 80]
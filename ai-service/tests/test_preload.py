@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+
+def test_startup_checks_run_in_a_child_process_with_preload(service, monkeypatch):
+    monkeypatch.setattr(service, 'isolate_checks', True)
+    assert service.startup_check(os.getpid) != os.getpid()
+    assert service.startup_check(lambda: {'ok': [1, 2]}) == {'ok': [1, 2]}
+
+
+def test_startup_check_errors_reach_the_master(service, monkeypatch):
+    monkeypatch.setattr(service, 'isolate_checks', True)
+
+    def failing():
+        raise ValueError('gate falló')
+
+    with pytest.raises(RuntimeError, match='ValueError: gate falló'):
+        service.startup_check(failing)
+
+
+def test_without_preload_checks_run_inline(service):
+    assert service.isolate_checks is False
+    assert service.startup_check(os.getpid) == os.getpid()
+
+
+def test_preload_skips_warmup_and_encodes_text_prototypes_in_a_child(service, monkeypatch, tmp_path):
+    pids = tmp_path / 'pids'
+
+    def encode_text(texts):
+        with open(pids, 'a') as f:
+            f.write(f'{os.getpid()}\n')
+        return original(texts)
+
+    original = service.image_encoder.encode_text
+    monkeypatch.setattr(service.image_encoder, 'encode_text', encode_text)
+    monkeypatch.setattr(service, 'load_image_encoder', lambda: service.image_encoder)
+    monkeypatch.setattr(service, 'TEXT_PROTOTYPES_MODE', 'missing')
+    monkeypatch.setattr(service, 'TEXT_PROTOTYPES_PATH', str(tmp_path / 'text.npz'))
+    monkeypatch.setattr(service, 'WARMUP_ENABLED', True)
+    monkeypatch.setattr(service, 'warmed_up', False)
+    monkeypatch.setattr(service, 'isolate_checks', False)
+
+    assert service.load_models(preload=True)
+    assert service.warmed_up is False
+    assert service.isolate_checks is True
+    assert service.embedding_index.base.text_vectors is not None
+    child_pids = {int(pid) for pid in pids.read_text().split()}
+    assert child_pids and os.getpid() not in child_pids
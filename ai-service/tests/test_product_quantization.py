@@ -0,0 +1,34 @@
+import numpy as np
+
+from product_quantization import ProductQuantizer
+
+
+def random_quantizer(m, ksub=256, dsub=1, seed=0):
+    rng = np.random.default_rng(seed)
+    return ProductQuantizer(rng.standard_normal((m, ksub, dsub)).astype(np.float32)), rng
+
+
+def test_flat_codes_stay_uint16_while_the_table_fits():
+    pq, rng = random_quantizer(m=256)
+    codes = rng.integers(0, 256, size=(10, pq.m), dtype=np.uint8)
+    flat = pq.flat_codes(codes)
+    assert flat.dtype == np.uint16
+    assert int(flat.max()) < pq.m * pq.ksub
+
+
+def test_flat_codes_do_not_wrap_past_65535():
+    pq, rng = random_quantizer(m=512)
+    codes = np.full((3, pq.m), 255, dtype=np.uint8)
+    flat = pq.flat_codes(codes)
+    assert flat.dtype == np.uint32
+    assert int(flat[0, -1]) == pq.m * pq.ksub - 1
+    np.testing.assert_array_equal(pq.unflat_codes(flat), codes)
+
+
+def test_scores_match_decoded_inner_product_with_wide_tables():
+    pq, rng = random_quantizer(m=512)
+    codes = rng.integers(0, 256, size=(20, pq.m), dtype=np.uint8)
+    query = rng.standard_normal((1, pq.dimension)).astype(np.float32)
+    table = pq.lookup(query)[0]
+    expected = pq.decode(codes) @ query[0]
+    np.testing.assert_allclose(pq.scores(table, pq.flat_codes(codes)), expected, rtol=1e-4, atol=1e-3)
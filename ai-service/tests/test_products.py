@@ -0,0 +1,31 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+
+def png_bytes(size=(100, 100)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (120, 80, 40)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_recognize_and_products_report_the_same_price(service):
+    service.image_encoder.vector = service.knowledge_base['sal_celusal_500g']['mean_embedding']
+    assert 'precio' not in service.product_mapping['sal_celusal_500g']
+
+    client = service.app.test_client()
+    products = client.get('/products?sku=SAL-001').get_json()['products']
+    response = client.post('/recognize', data={'image': (io.BytesIO(png_bytes()), 'shelf.png')})
+    items = response.get_json()['items']
+
+    assert response.status_code == 200
+    assert [item['product_id'] for item in items] == ['sal_celusal_500g']
+    assert items[0]['precio'] == products[0]['precio'] == 250
+    assert items[0]['sku'] == products[0]['sku']
+
+
+def test_products_filter_by_sku(service):
+    body = service.app.test_client().get('/products?sku=LEC-001').get_json()
+    assert [product['product_id'] for product in body['products']] == ['leche_serenisima_protein_1l']
+    assert np.isclose(body['products'][0]['precio'], 850)
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+import pytest
+
+import quantization
+from conftest import FakeEncoder
+from embedding_index import EmbeddingIndex
+from quantization import accuracy_gate, load_samples, quantize_encoder, select_encoder
+
+COLORS = {'rojo': (255, 0, 0), 'verde': (0, 255, 0), 'azul': (0, 0, 255)}
+
+
+class ColorEncoder(FakeEncoder):
+    """Embedding = media por canal del recorte (más un desvío opcional, para simular un INT8 malo)"""
+
+    def __init__(self, shift=(0, 0, 0)):
+        super().__init__(np.zeros(3))
+        self.shift = np.asarray(shift, dtype=np.float32)
+
+    def encode(self, batches):
+        pixel_values = np.concatenate([np.asarray(batch) for batch in batches])
+        return pixel_values.mean(axis=(2, 3)) + 3.0 + self.shift
+
+
+def write_samples(root, per_product=5):
+    for product_id, rgb in COLORS.items():
+        (root / product_id).mkdir()
+        for i in range(per_product):
+            image = np.full((40, 40, 3), rgb, dtype=np.uint8)
+            cv2.imwrite(str(root / product_id / f'{i:02d}.png'), image[:, :, ::-1])
+
+
+def color_index(encoder):
+    kb = {}
+    for product_id, rgb in COLORS.items():
+        [embedding] = quantization.sample_pixel_values(encoder, [np.full((40, 40, 3), rgb, dtype=np.uint8)])
+        kb[product_id] = {'embeddings': None, 'mean_embedding': encoder.encode([embedding])[0]}
+    return EmbeddingIndex.from_knowledge_base(kb)
+
+
+def test_samples_hold_out_one_in_five(tmp_path):
+    write_samples(tmp_path, per_product=6)
+    calibration, heldout = load_samples(str(tmp_path))
+    assert len(calibration) == 15 and len(heldout) == 3
+    assert sorted(product_id for product_id, _ in heldout) == sorted(COLORS)
+    assert load_samples(str(tmp_path / 'no_existe')) == ([], [])
+
+
+def test_gate_accepts_a_faithful_candidate():
+    encoder = ColorEncoder()
+    samples = [(product_id, np.full((40, 40, 3), rgb, dtype=np.uint8)) for product_id, rgb in COLORS.items()]
+
+    report = accuracy_gate(encoder, ColorEncoder(), samples, color_index(encoder))
+    assert report['ok'] and report['top1_agreement'] == 1.0 and report['accuracy_int8'] == 1.0
+    assert report['max_similarity_drift'] == pytest.approx(0.0, abs=1e-6)
+
+
+def test_select_encoder_keeps_fp32_when_the_gate_fails(tmp_path, monkeypatch):
+    write_samples(tmp_path)
+    encoder = ColorEncoder()
+    index = color_index(encoder)
+
+    monkeypatch.setattr(quantization, 'quantize_encoder', lambda *args, **kwargs: ColorEncoder())
+    selected, report = select_encoder(encoder, 'dynamic', str(tmp_path), index)
+    assert report['active'] == 'int8' and selected is not encoder
+
+    monkeypatch.setattr(quantization, 'quantize_encoder', lambda *args, **kwargs: ColorEncoder(shift=(4, 0, 0)))
+    selected, report = select_encoder(encoder, 'dynamic', str(tmp_path), index)
+    assert report['active'] == 'fp32' and selected is encoder
+    assert not report['ok'] and 'deriva' in report['reason']
+
+
+def test_select_encoder_keeps_fp32_without_samples_or_on_errors(tmp_path, monkeypatch):
+    encoder = ColorEncoder()
+    selected, report = select_encoder(encoder, 'dynamic', str(tmp_path), color_index(encoder))
+    assert selected is encoder and 'held-out' in report['reason']
+
+    write_samples(tmp_path)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('sin soporte')
+
+    monkeypatch.setattr(quantization, 'quantize_encoder', broken)
+    selected, report = select_encoder(encoder, 'dynamic', str(tmp_path), color_index(encoder))
+    assert selected is encoder and report['active'] == 'fp32' and 'sin soporte' in report['reason']
+
+
+def test_quantize_encoder_validates_the_mode():
+    encoder = ColorEncoder()
+    encoder.name = 'torch'
+    with pytest.raises(ValueError):
+        quantize_encoder(encoder, 'fp4')
+    with pytest.raises(ValueError):
+        quantize_encoder(encoder, 'static')
+
+
+def test_service_reports_the_gate(service, monkeypatch):
+    int8 = FakeEncoder(np.ones(512))
+    monkeypatch.setattr(service, 'quantization_status', {'requested': 'dynamic', 'active': None, 'gate': None})
+    monkeypatch.setattr(service, 'CLIP_INT8_MODE', 'dynamic')
+    monkeypatch.setattr(quantization, 'select_encoder',
+                        lambda encoder, *args, **kwargs: (int8, {'active': 'int8', 'ok': True, 'samples': 3}))
+
+    assert service.select_int8_encoder(service.image_encoder, service.embedding_index) is int8
+    assert service.quantization_status['active'] == 'int8'
+    assert service.quantization_status['gate'] == {'ok': True, 'samples': 3}
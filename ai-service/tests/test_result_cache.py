@@ -0,0 +1,181 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from result_cache import ResultCache, content_key
+
+
+def start_leader(cache, key, value, release, **kwargs):
+    """Hilo que calcula `value` para la clave cuando se libera `release`"""
+    started = threading.Event()
+    results = []
+
+    def compute():
+        started.set()
+        release.wait(5)
+        return value
+
+    thread = threading.Thread(target=lambda: results.append(cache.get_or_compute(key, compute, **kwargs)))
+    thread.start()
+    started.wait(5)
+    return thread, results
+
+
+def test_follower_gives_up_at_its_own_timeout_and_the_leader_still_caches():
+    cache = ResultCache()
+    release = threading.Event()
+    thread, results = start_leader(cache, 'k', 'valor', release)
+
+    began = time.monotonic()
+    with pytest.raises(TimeoutError):
+        cache.get_or_compute('k', lambda: pytest.fail('el coalescido no debe calcular'), timeout=0.05)
+    assert time.monotonic() - began < 1
+
+    release.set()
+    thread.join(5)
+    assert results == [('valor', False)]
+    assert cache.get_or_compute('k', lambda: 'otro') == ('valor', True)
+
+
+def test_followers_retry_when_the_leader_result_is_not_shareable():
+    cache = ResultCache()
+    release = threading.Event()
+    shareable = lambda value: value != 'rechazado'
+    thread, results = start_leader(cache, 'k', 'rechazado', release, shareable=shareable)
+    follower = []
+    waiter = threading.Thread(target=lambda: follower.append(
+        cache.get_or_compute('k', lambda: 'propio', shareable=shareable)))
+    waiter.start()
+    while cache.coalesced == 0:
+        time.sleep(0.001)
+
+    release.set()
+    thread.join(5)
+    waiter.join(5)
+    assert results == [('rechazado', False)]
+    assert follower == [('propio', False)]
+
+
+def test_errors_reach_coalesced_requests():
+    cache = ResultCache()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def compute():
+        started.set()
+        release.wait(5)
+        raise ValueError('falló')
+
+    def request():
+        try:
+            cache.get_or_compute('k', compute)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=request)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=request))
+    threads[1].start()
+    while cache.coalesced == 0:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == ['falló', 'falló']
+
+
+def test_lru_limits_and_content_key():
+    cache = ResultCache(max_entries=2)
+    for key in 'abc':
+        cache.get_or_compute(key, lambda: {'k': 1})
+    assert cache.lookup('a') is None and cache.lookup('c') == {'k': 1}
+    assert content_key(b'img', 'v1') != content_key(b'img', 'v2')
+
+
+def test_coalesced_recognize_returns_504_at_its_own_deadline(service, monkeypatch):
+    monkeypatch.setattr(service, 'result_cache', ResultCache())
+    started, release = threading.Event(), threading.Event()
+    original = service.recognize_image_data
+
+    def slow_recognize(image_data, deadline=None, priority='interactive'):
+        started.set()
+        release.wait(5)
+        return original(image_data, deadline, priority)
+
+    monkeypatch.setattr(service, 'recognize_image_data', slow_recognize)
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100)).save(buffer, format='PNG')
+
+    def post(headers=None):
+        return service.app.test_client().post('/recognize', data={'image': (io.BytesIO(buffer.getvalue()), 'a.png')},
+                                              headers=headers or {})
+
+    leader = []
+    thread = threading.Thread(target=lambda: leader.append(post()))
+    thread.start()
+    started.wait(5)
+
+    # Mismo contenido: se coalesce con el líder, pero no espera más que su deadline
+    began = time.monotonic()
+    response = post({service.DEADLINE_HEADER: '50'})
+    assert response.status_code == 504
+    assert response.get_json()['stage'] == 'cache'
+    assert time.monotonic() - began < 2
+
+    release.set()
+    thread.join(5)
+    assert leader[0].status_code == 200
+
+
+def test_asgi_follower_stops_waiting_at_its_own_deadline(service, monkeypatch):
+    import asyncio
+
+    import asgi
+    from admission import Deadline
+
+    monkeypatch.setattr(service, 'result_cache', ResultCache())
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def slow_recognize(image_data, deadline, priority='interactive'):
+            await release.wait()
+            return {'success': True, 'items': []}, 200
+
+        monkeypatch.setattr(asgi, 'recognize_image_data', slow_recognize)
+        leader = asyncio.create_task(asgi.cached_recognition(b'img', Deadline(), 'interactive'))
+        while service.result_cache.misses == 0:
+            await asyncio.sleep(0.001)
+
+        (payload, status), hit = await asgi.cached_recognition(b'img', Deadline.after(50), 'interactive')
+        assert (status, payload['stage'], hit) == (504, 'cache', False)
+        assert not leader.done()
+
+        release.set()
+        assert await leader == (({'success': True, 'items': []}, 200), False)
+        return await asgi.cached_recognition(b'img', Deadline(), 'interactive')
+
+    assert asyncio.run(scenario()) == (({'success': True, 'items': []}, 200), True)
+
+
+def test_repeated_recognize_is_served_from_the_cache(service, monkeypatch):
+    monkeypatch.setattr(service, 'result_cache', ResultCache())
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), (5, 5, 5)).save(buffer, format='PNG')
+    client = service.app.test_client()
+
+    bodies = [client.post('/recognize', data={'image': (io.BytesIO(buffer.getvalue()), 'a.png')}).get_json()
+              for _ in range(2)]
+    assert [body['cache_hit'] for body in bodies] == [False, True]
+    assert bodies[0]['items'] == bodies[1]['items']
+
+
+def test_admission_rejections_are_not_shared_with_coalesced_requests(service):
+    assert service.shareable_result(({'success': True}, 200))
+    assert service.shareable_result(({'success': False}, 400))
+    assert not service.shareable_result(({'success': False}, 503))
+    assert not service.shareable_result(({'success': False}, 504))
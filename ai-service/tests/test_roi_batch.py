@@ -0,0 +1,43 @@
+import numpy as np
+import torch
+
+from roi_batch import (CLIP_MEAN, CLIP_STD, center_square_boxes, clip_pixel_values, crop_resize_batch,
+                       gray_block_means, image_tensor)
+
+
+def gradient_image(height=120, width=160):
+    ys, xs = np.mgrid[0:height, 0:width]
+    return np.stack([xs * 255 // width, ys * 255 // height, np.full_like(xs, 128)], axis=2).astype(np.uint8)
+
+
+def test_center_square_boxes_crop_the_short_side():
+    boxes = center_square_boxes([[0, 0, 100, 40], [10, 10, 30, 70]])
+    np.testing.assert_allclose(boxes.numpy(), [[30, 0, 70, 40], [10, 30, 30, 50]])
+
+
+def test_clip_batch_matches_per_box_crop_and_normalization():
+    image = gradient_image()
+    boxes = np.array([[0, 0, 80, 80], [40, 20, 160, 120]], dtype=np.float32)
+    batch = clip_pixel_values(image_tensor(image), boxes)
+    assert batch.shape == (2, 3, 224, 224)
+
+    for i, (x1, y1, x2, y2) in enumerate(center_square_boxes(boxes).numpy().astype(int)):
+        crop = torch.from_numpy(image[y1:y2, x1:x2]).permute(2, 0, 1).unsqueeze(0).float()
+        reference = torch.nn.functional.interpolate(crop, size=(224, 224), mode='bilinear', align_corners=False)
+        reference = (reference - CLIP_MEAN) / CLIP_STD
+        # Gradiente lineal: roi_align y el resize bilineal coinciden salvo en los bordes
+        inner = (slice(None), slice(8, -8), slice(8, -8))
+        np.testing.assert_allclose(batch[i][inner].numpy(), reference[0][inner].numpy(), atol=0.05)
+
+
+def test_empty_boxes_give_an_empty_batch():
+    tensor = image_tensor(gradient_image())
+    assert crop_resize_batch(tensor, np.empty((0, 4), np.float32), (224, 224)).shape == (0, 3, 224, 224)
+
+
+def test_gray_block_means_average_each_cell():
+    image = np.zeros((32, 34, 3), dtype=np.uint8)
+    image[:, 17:] = 255
+    means = gray_block_means(image_tensor(image), np.array([[0, 0, 34, 32]], np.float32), 16, 17)
+    assert means.shape == (1, 16, 17)
+    assert means[0, :, :8].max() < 1 and means[0, :, 9:].min() > 254
@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ('torch', 'ultralytics', 'sentence_transformers', 'onnxruntime', 'cv2')
+
+
+def test_importing_the_service_does_not_import_the_model_runtimes():
+    code = f"import sys, app; print([m for m in {HEAVY_MODULES!r} if m in sys.modules])"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]'
+
+
+def test_probes_before_and_after_warmup(service, monkeypatch):
+    client = service.app.test_client()
+    monkeypatch.setattr(service, 'WARMUP_ENABLED', True)
+    monkeypatch.setattr(service, 'warmed_up', False)
+
+    assert client.get('/health/live').status_code == 200
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'starting'
+
+    service.warmup_models()
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert 'warmup' in response.get_json()['startup']
+
+
+def test_loading_records_each_phase(service):
+    assert {'yolo', 'clip', 'knowledge_base', 'load', 'total'} <= set(service.startup_phases)
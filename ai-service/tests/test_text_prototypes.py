@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from catalog_updates import LiveIndex
+from embedding_index import EmbeddingIndex, normalize_rows
+from text_prototypes import TextPrototypes, build_text_prototypes, merge_text_rows, product_prompts
+
+DIMENSION = 16
+
+
+def image_index(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = normalize_rows(rng.standard_normal((6, DIMENSION)).astype(np.float32))
+    return EmbeddingIndex(rows, [0, 0, 0, 1, 1, 1], ['agua', 'gaseosa'], normalized=True)
+
+
+def text_rows(product_ids, seed=1):
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(rng.standard_normal((len(product_ids), DIMENSION)).astype(np.float32))
+    return TextPrototypes(product_ids, [f'key-{pid}' for pid in product_ids], vectors)
+
+
+def test_text_matches_report_the_unscaled_cosine():
+    index = image_index()
+    prototypes = text_rows(['leche'])
+    merged = merge_text_rows(index, prototypes, scale=2.5)
+
+    scores, similarities, product_ids = merged.search_scores(prototypes.vectors, k=1)
+    assert product_ids[0, 0] == 'leche'
+    assert similarities[0, 0] <= 1.0 + 1e-6
+    np.testing.assert_allclose(similarities[0, 0], 1.0, atol=1e-5)
+    np.testing.assert_allclose(scores[0, 0], 2.5, atol=1e-5)
+
+    # Las coincidencias de imagen no cambian: puntaje == similitud
+    scores, similarities, product_ids = merged.search_scores(index.vectors(slice(0, 1)), k=1)
+    assert product_ids[0, 0] == 'agua'
+    np.testing.assert_allclose(scores, similarities)
+
+
+def test_every_reported_similarity_is_at_most_one():
+    merged = merge_text_rows(image_index(), text_rows(['agua', 'leche', 'yerba']), scale=2.5)
+    queries = normalize_rows(np.random.default_rng(3).standard_normal((200, DIMENSION)).astype(np.float32))
+    similarities, _ = merged.search(queries, k=4)
+    assert np.all(similarities <= 1.0 + 1e-6)
+
+
+def test_text_rows_do_not_copy_the_image_rows():
+    index = image_index()
+    merged = merge_text_rows(index, text_rows(['leche']), scale=2.5)
+    assert merged.embeddings is index.embeddings
+    assert list(merged.product_ids) == ['agua', 'gaseosa', 'leche']
+    assert merged.nbytes == index.nbytes + merged.text_vectors.nbytes + merged.text_labels.nbytes
+
+
+def test_live_index_keeps_text_rows_through_updates_and_compaction():
+    prototypes = text_rows(['leche'])
+    live = LiveIndex.from_base(merge_text_rows(image_index(), prototypes, scale=2.5))
+    live = live.append('yerba', normalize_rows(np.ones((1, DIMENSION), np.float32)))
+    live = live.remove('gaseosa')
+
+    for index in (live, live.compact()):
+        similarities, product_ids = index.search(prototypes.vectors, k=1)
+        assert product_ids[0, 0] == 'leche'
+        np.testing.assert_allclose(similarities[0, 0], 1.0, atol=1e-5)
+        assert 'gaseosa' not in set(index.search(image_index().vectors(), k=3)[1].ravel())
+
+
+@pytest.mark.parametrize('precision', ['fp16', 'pq'])
+def test_compressed_index_keeps_text_rows(precision):
+    prototypes = text_rows(['leche'])
+    merged = merge_text_rows(image_index(), prototypes, scale=2.5).compress(precision, m=4)
+    similarities, product_ids = merged.search(prototypes.vectors, k=1)
+    assert product_ids[0, 0] == 'leche'
+    assert similarities[0, 0] <= 1.0 + 1e-6
+
+
+def test_prototypes_are_cached_by_catalog_hash(tmp_path):
+    products = {'leche': {'nombre': 'Leche Protein 1L', 'marca': 'La Serenísima'}}
+    calls = []
+
+    def encode_text(texts):
+        calls.append(list(texts))
+        return np.ones((len(texts), DIMENSION), dtype=np.float32)
+
+    path = str(tmp_path / 'text.npz')
+    _, first = build_text_prototypes(products, encode_text, path)
+    _, second = build_text_prototypes(products, encode_text, path)
+    assert first['encoded'] == 1 and second['cached'] == 1 and second['encoded'] == 0
+    assert len(calls) == 1 and calls[0] == product_prompts(products['leche'])
+
+
+def test_recognize_reports_text_matches_with_cosine_similarity(service, monkeypatch, tmp_path):
+    import io
+
+    from PIL import Image
+
+    monkeypatch.setattr(service, 'TEXT_PROTOTYPES_MODE', 'missing')
+    monkeypatch.setattr(service, 'TEXT_PROTOTYPES_PATH', str(tmp_path / 'text.npz'))
+    assert service.load_models(warmup=False)
+    index = service.embedding_index.base
+    assert index.text_vectors is not None
+    position = list(index.product_ids).index('leche_serenisima_protein_1l')
+    service.image_encoder.vector = index.text_vectors[list(index.text_labels).index(position)]
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (100, 100), (200, 200, 200)).save(buffer, format='PNG')
+    response = service.app.test_client().post('/recognize', data={'image': (io.BytesIO(buffer.getvalue()), 'a.png')})
+    items = response.get_json()['items']
+    assert [item['product_id'] for item in items] == ['leche_serenisima_protein_1l']
+    assert 0.99 <= items[0]['similarity'] <= 1.0 + 1e-6
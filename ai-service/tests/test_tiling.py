@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from tiling import TiledDetector, merge_boxes, tile_grid
+
+
+class PaintedDetector:
+    """YOLO de prueba: cada objeto es un rectángulo pintado con su propio valor de gris.
+
+    Con la imagen completa reducida a imgsz los objetos salen con score bajo
+    (como los productos chicos en una foto de góndola); en un tile, con score alto.
+    """
+
+    name = 'painted'
+    imgsz = 640
+    conf = 0.5
+
+    def __init__(self):
+        self.calls = []
+
+    def detect(self, images, conf=None):
+        self.calls.append(len(images))
+        outputs = []
+        for image in images:
+            score = 0.9 if max(image.shape[:2]) <= 1.5 * self.imgsz else 0.2
+            boxes = []
+            for value in np.unique(image[:, :, 0]):
+                if value:
+                    ys, xs = np.nonzero(image[:, :, 0] == value)
+                    boxes.append([xs.min(), ys.min(), xs.max() + 1, ys.max() + 1])
+            boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+            scores = np.full(len(boxes), score, dtype=np.float32)
+            keep = scores > conf
+            outputs.append((boxes[keep], scores[keep]))
+        return outputs
+
+
+def shelf(width=2400, height=1600, objects=24, seed=0):
+    """Góndola sintética -> (imagen, cajas); los objetos son más chicos que el solape de los tiles"""
+    rng = np.random.default_rng(seed)
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cols = 6
+    truth = []
+    for i in range(objects):
+        row, col = divmod(i, cols)
+        x0 = col * width // cols + int(rng.integers(0, 150))
+        y0 = row * height // (objects // cols) + int(rng.integers(0, 100))
+        box = [x0, y0, x0 + 110, y0 + 110]
+        image[box[1]:box[3], box[0]:box[2]] = i + 1
+        truth.append(box)
+    return image, np.array(truth, dtype=np.float32)
+
+
+def test_grid_covers_the_image_with_equal_tiles():
+    windows = tile_grid(2400, 1600, 640, overlap=0.2, max_tiles=16)
+    assert len(windows) == 15
+    assert {(x1 - x0, y1 - y0) for x0, y0, x1, y1 in windows} == {(640, 640)}
+    covered = np.zeros((1600, 2400), dtype=bool)
+    for x0, y0, x1, y1 in windows:
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+
+    # Con pocos tiles permitidos se agrandan en lugar de dejar partes afuera
+    assert len(tile_grid(2400, 1600, 640, max_tiles=4)) <= 4
+    assert tile_grid(500, 400, 640) == [(0, 0, 500, 400)]
+
+
+def test_merge_suppresses_duplicates_and_joins_cut_objects():
+    boxes = np.array([[0, 0, 100, 100], [2, 2, 100, 100], [0, 0, 40, 100], [300, 300, 350, 350]], dtype=np.float32)
+    scores = np.array([0.8, 0.7, 0.95, 0.6], dtype=np.float32)
+    merged, merged_scores = merge_boxes(boxes, scores)
+    np.testing.assert_array_equal(merged, [[0, 0, 100, 100], [300, 300, 350, 350]])
+    np.testing.assert_allclose(merged_scores, [0.95, 0.6])
+
+    # La parcial gana por score y se solapa mucho con la completa: queda la caja completa
+    boxes = np.array([[0, 0, 70, 100], [0, 0, 100, 100]], dtype=np.float32)
+    merged, _ = merge_boxes(boxes, np.array([0.9, 0.8], dtype=np.float32))
+    np.testing.assert_array_equal(merged, [[0, 0, 100, 100]])
+
+
+def test_auto_mode_tiles_only_dense_large_images():
+    detector = PaintedDetector()
+    tiled = TiledDetector(detector, mode='auto', max_tiles=16, min_objects=12, small_object_px=20)
+
+    image, truth = shelf()
+    [(boxes, scores)] = tiled.detect([image])
+    assert detector.calls == [1, len(tile_grid(2400, 1600, 640, 0.2, 16))]
+    assert len(boxes) == len(truth) and (scores > 0.5).all()
+    order = np.lexsort((boxes[:, 0], boxes[:, 1]))
+    np.testing.assert_array_equal(boxes[order], truth[np.lexsort((truth[:, 0], truth[:, 1]))])
+
+    # Pocos objetos grandes o una imagen chica: una sola pasada
+    sparse, _ = shelf(objects=6)
+    small, _ = shelf(width=900, height=700, objects=6)
+    detector.calls.clear()
+    tiled.detect([sparse])
+    tiled.detect([small])
+    assert detector.calls == [1, 1]
+    assert tiled.stats()['tiled'] == 1 and tiled.stats()['images'] == 3
+
+
+def test_tiles_can_be_split_across_threads():
+    image, truth = shelf()
+    single = TiledDetector(PaintedDetector(), mode='always', max_tiles=16).detect([image])[0][0]
+    detector = PaintedDetector()
+    pooled = TiledDetector(detector, mode='always', max_tiles=16, workers=3).detect([image])[0][0]
+
+    assert len(detector.calls) == 4 and sum(detector.calls[1:]) == len(tile_grid(2400, 1600, 640, 0.2, 16))
+    assert sorted(map(tuple, pooled.tolist())) == sorted(map(tuple, single.tolist()))
+    with pytest.raises(ValueError):
+        TiledDetector(detector, mode='siempre')
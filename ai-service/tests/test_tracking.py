@@ -0,0 +1,125 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+import cpu_topology
+from tracking import ByteTracker, SessionStore, StreamSession
+
+BOX = [10, 10, 50, 50]
+
+
+def png_bytes(size=(100, 100)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (120, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class Identify:
+    """identify() de prueba que cuenta las cajas enviadas a CLIP"""
+
+    def __init__(self, product_id='p1', similarity=0.9):
+        self.product_id = product_id
+        self.similarity = similarity
+        self.boxes = 0
+
+    def __call__(self, image, boxes):
+        self.boxes += len(boxes)
+        return [(self.product_id, self.similarity, self.similarity)] * len(boxes)
+
+
+def test_low_score_detections_keep_a_track_alive():
+    tracker = ByteTracker(min_hits=2)
+    tracker.update([BOX], [0.9])
+    tracker.update([BOX], [0.9])
+    [track] = tracker.tracks
+    assert track.confirmed
+
+    # Oclusión parcial: la detección baja de score pero sigue asociada al mismo track
+    tracker.update([[12, 12, 52, 52]], [0.3])
+    assert [t.id for t in tracker.tracks] == [track.id] and track.lost == 0
+
+    # Un score bajo no abre tracks nuevos, y un tentativo perdido se descarta enseguida
+    tracker.update([BOX, [200, 200, 240, 240]], [0.9, 0.3])
+    assert len(tracker.tracks) == 1
+    tracker.update([BOX, [300, 300, 340, 340]], [0.9, 0.9])
+    removed = tracker.update([BOX], [0.9])
+    assert [t.id for t in tracker.tracks] == [track.id] and len(removed) == 1
+
+
+def test_confirmed_tracks_survive_max_lost_frames():
+    tracker = ByteTracker(min_hits=1, max_lost=2)
+    tracker.update([BOX], [0.9])
+    assert tracker.update([], []) == [] and tracker.update([], []) == []
+    assert len(tracker.update([], [])) == 1 and tracker.tracks == []
+
+
+def test_session_identifies_each_track_once_and_emits_basket_events():
+    identify = Identify()
+    session = StreamSession(identify, similarity_threshold=0.7, tracker=ByteTracker(min_hits=2))
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert session.process([BOX], [0.9], image)[1] == []
+    _, events, identified = session.process([BOX], [0.9], image)
+    assert identified == 1
+    assert events == [{'type': 'add', 'product_id': 'p1', 'delta': 1, 'quantity': 1}]
+    for _ in range(20):
+        assert session.process([BOX], [0.9], image)[1:] == ([], 0)
+    assert identify.boxes == 1
+
+    session.tracker.max_lost = 0
+    _, events, _ = session.process([], [], image)
+    assert events == [{'type': 'remove', 'product_id': 'p1', 'delta': -1, 'quantity': 0}]
+
+
+def test_doubtful_identities_are_rechecked_up_to_max_checks():
+    identify = Identify(similarity=0.72)
+    session = StreamSession(identify, similarity_threshold=0.7, margin=0.05, recheck_interval=2, max_checks=3,
+                            tracker=ByteTracker(min_hits=1))
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    for _ in range(12):
+        session.process([BOX], [0.9], image)
+    assert identify.boxes == 3
+    assert session.basket == {'p1': 1}
+
+
+def test_session_store_is_bounded_and_expires_idle_sessions():
+    store = SessionStore(max_sessions=1, idle_seconds=60)
+    first = store.add(StreamSession(Identify()))
+    assert first is not None and store.add(StreamSession(Identify())) is None
+
+    first.last_seen -= 120
+    second = store.add(StreamSession(Identify()))
+    assert second is not None and store.get(first.id) is None and store.get(second.id) is second
+    assert store.remove(second.id) is second and len(store) == 0
+
+
+def test_http_sessions_need_sticky_routing_with_several_workers(service, monkeypatch):
+    client = service.app.test_client()
+    monkeypatch.setattr(cpu_topology, '_worker', {'workers': 2})
+    monkeypatch.setattr(service, 'STREAM_STICKY', False)
+    response = client.post('/stream/sessions')
+    assert response.status_code == 501 and 'STICKY' in response.get_json()['error']
+
+    monkeypatch.setattr(service, 'STREAM_STICKY', True)
+    assert client.post('/stream/sessions').status_code == 201
+
+
+def test_http_session_flow(service, monkeypatch):
+    monkeypatch.setattr(cpu_topology, '_worker', {'workers': 1})
+    service.image_encoder.vector = service.knowledge_base['sal_celusal_500g']['mean_embedding']
+    client = service.app.test_client()
+    session_id = client.post('/stream/sessions').get_json()['session_id']
+
+    frames = [client.post(f'/stream/sessions/{session_id}/frames',
+                          data={'image': (io.BytesIO(png_bytes()), 'frame.png')}).get_json() for _ in range(3)]
+    assert [frame['identified'] for frame in frames] == [0, 1, 0]
+    assert frames[0]['events'] == [] and frames[2]['events'] == []
+    [event] = frames[1]['events']
+    assert event['type'] == 'add' and event['product_id'] == 'sal_celusal_500g' and event['sku'] == 'SAL-001'
+
+    closed = client.delete(f'/stream/sessions/{session_id}').get_json()
+    assert closed['frames'] == 3
+    assert closed['basket'] == [{'product_id': 'sal_celusal_500g', 'sku': 'SAL-001',
+                                 'nombre': frames[1]['basket'][0]['nombre'], 'quantity': 1}]
+    assert client.post(f'/stream/sessions/{session_id}/frames').status_code == 404
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Prototipos de texto de CLIP para reconocer productos sin fotos de muestra
+
+Productos como la Serenísima Protein 1L ("samples": 0) o las bebidas de
+DATASET-BEBIDAS-ARGENTINA.json tienen nombre, marca, volumen y keywords pero
+ninguna imagen. CLIP proyecta texto e imágenes al mismo espacio, así que con
+unos pocos prompts por producto (promediados y normalizados) se obtiene un
+prototipo contra el que comparar los ROIs.
+
+- Los prototipos se calculan una sola vez (al cargar el catálogo o con
+  `python text_prototypes.py build`) y se guardan en disco, identificados
+  por el hash del catálogo. Los productos cuyos prompts no cambiaron se
+  reutilizan del cache; solo se codifican los nuevos o modificados.
+- Se agregan al EmbeddingIndex como una fila de texto por producto, en una
+  matriz chica aparte (las filas de imagen, quizás el memmap del bundle, no
+  se copian): la búsqueda es un matmul contra imágenes y otro contra textos,
+  sin codificar texto por request.
+- La similitud imagen-texto de CLIP (~0.3) es mucho menor que la
+  imagen-imagen (~0.8): para ordenar y comparar con el umbral del servicio
+  cuenta multiplicada por `scale`, pero la similitud que se informa es el
+  coseno real (nunca mayor que 1).
+
+Uso:
+    python text_prototypes.py build --dataset ../DATASET-BEBIDAS-ARGENTINA.json
+    python text_prototypes.py build --mode all
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from embedding_index import normalize_rows
+
+FORMAT_VERSION = 1
+MODEL_NAME = 'clip-ViT-B-32'
+# Filas de texto: solo productos sin muestras de imagen, todos, o ninguno
+MODES = ('missing', 'all', 'off')
+# Prompts por producto (se descartan los que quedan vacíos o repetidos)
+TEMPLATES = (
+    'a photo of {nombre}',
+    'una foto de {nombre}, {marca}',
+    'a product photo of {marca} {categoria} {volumen}',
+    '{nombre} {keywords}',
+)
+DEFAULT_SCALE = 2.5
+
+
+def product_prompts(info):
+    """Prompts de un producto a partir de sus campos del catálogo"""
+    keywords = info.get('keywords') or []
+    fields = {
+        'nombre': str(info.get('nombre') or ''),
+        'marca': str(info.get('marca') or ''),
+        'categoria': str(info.get('categoria') or ''),
+        'volumen': str(info.get('volumen') or ''),
+        'keywords': ' '.join(keywords) if isinstance(keywords, (list, tuple)) else str(keywords),
+    }
+    if not fields['nombre']:
+        return []
+    prompts = []
+    for template in TEMPLATES:
+        prompt = re.sub(r'\s+', ' ', template.format(**fields)).strip(' ,')
+        prompt = re.sub(r'\s+,', ',', prompt).rstrip(',')
+        if prompt and prompt not in prompts:
+            prompts.append(prompt)
+    return prompts
+
+
+def prompts_key(prompts, model_name=MODEL_NAME):
+    """Clave de cache de un producto: cambia si cambian sus prompts o el modelo"""
+    return hashlib.sha1(json.dumps([model_name, prompts], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def catalog_hash(keys):
+    """Hash del catálogo de texto: {product_id: clave de sus prompts}"""
+    return hashlib.sha256(json.dumps(sorted(keys.items())).encode('utf-8')).hexdigest()
+
+
+def text_products(product_mapping, index=None, mode='missing'):
+    """{product_id: info} de los productos que llevan prototipo de texto"""
+    if mode == 'off':
+        return {}
+    with_images = set() if index is None or mode == 'all' else {str(pid) for pid in index.product_ids}
+    return {pid: info for pid, info in product_mapping.items()
+            if pid not in with_images or not int(info.get('samples', 1) or 0)}
+
+
+class TextPrototypes:
+    """Prototipo de texto normalizado (P, D) float32 por producto, con la clave de sus prompts"""
+
+    def __init__(self, product_ids, keys, vectors, model_name=MODEL_NAME):
+        self.product_ids = list(product_ids)
+        self.keys = list(keys)
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.model_name = model_name
+
+    @property
+    def catalog_hash(self):
+        return catalog_hash(dict(zip(self.product_ids, self.keys)))
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def save(self, path):
+        """Guardar en un .npz (sin pickle)"""
+        header = {
+            'format_version': FORMAT_VERSION,
+            'model': self.model_name,
+            'catalog_hash': self.catalog_hash,
+            'product_ids': self.product_ids,
+            'keys': self.keys
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, header=np.frombuffer(json.dumps(header, ensure_ascii=False).encode('utf-8'), dtype=np.uint8),
+                     vectors=self.vectors)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            header = json.loads(data['header'].tobytes().decode('utf-8'))
+            if header.get('format_version') != FORMAT_VERSION:
+                raise ValueError(f"Versión de prototipos de texto no soportada: {header.get('format_version')}")
+            return cls(header['product_ids'], header['keys'], data['vectors'], header['model'])
+
+
+def build_text_prototypes(products, encode_text, cache_path=None, model_name=MODEL_NAME):
+    """(TextPrototypes, estadísticas) para {product_id: info}, reutilizando el cache en disco.
+
+    encode_text(textos) -> (M, D) solo se llama si hay productos nuevos o modificados.
+    """
+    prompts = {pid: product_prompts(info) for pid, info in products.items()}
+    prompts = {pid: p for pid, p in prompts.items() if p}
+    keys = {pid: prompts_key(p, model_name) for pid, p in prompts.items()}
+    current_hash = catalog_hash(keys)
+
+    cached = None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            cached = TextPrototypes.load(cache_path)
+        except (OSError, ValueError, KeyError):
+            # Cache ilegible o de otra versión: se regenera
+            cached = None
+    if cached is not None and cached.catalog_hash == current_hash and cached.model_name == model_name:
+        return cached, {'catalog_hash': current_hash, 'products': len(cached), 'cached': len(cached), 'encoded': 0}
+
+    by_key = dict(zip(cached.keys, cached.vectors)) if cached is not None else {}
+    missing = [pid for pid in prompts if keys[pid] not in by_key]
+    if missing:
+        texts = [text for pid in missing for text in prompts[pid]]
+        embeddings = normalize_rows(encode_text(texts))
+        start = 0
+        for pid in missing:
+            count = len(prompts[pid])
+            # Ensemble de prompts: promedio de los textos normalizados, renormalizado
+            by_key[keys[pid]] = normalize_rows(embeddings[start:start + count].mean(axis=0))[0]
+            start += count
+
+    product_ids = list(prompts)
+    vectors = np.stack([by_key[keys[pid]] for pid in product_ids]) if product_ids else np.empty((0, 0), np.float32)
+    prototypes = TextPrototypes(product_ids, [keys[pid] for pid in product_ids], vectors, model_name)
+    if cache_path and product_ids:
+        prototypes.save(cache_path)
+    return prototypes, {'catalog_hash': current_hash, 'products': len(prototypes),
+                        'cached': len(prototypes) - len(missing), 'encoded': len(missing)}
+
+
+def merge_text_rows(index, prototypes, scale=DEFAULT_SCALE):
+    """EmbeddingIndex con una fila de texto por producto (puntaje por `scale`); los productos
+    que no estaban en el índice se agregan al final"""
+    if not len(prototypes):
+        return index
+    if prototypes.vectors.shape[1] != index.dimension:
+        raise ValueError(f"Dimensión de texto {prototypes.vectors.shape[1]} != dimensión del índice {index.dimension}")
+
+    product_ids = [str(pid) for pid in index.product_ids]
+    positions = {pid: i for i, pid in enumerate(product_ids)}
+    for pid in prototypes.product_ids:
+        if pid not in positions:
+            positions[pid] = len(product_ids)
+            product_ids.append(pid)
+
+    text_labels = np.array([positions[pid] for pid in prototypes.product_ids], dtype=np.int32)
+    return index.with_text(product_ids, prototypes.vectors, text_labels, scale)
+
+
+def load_dataset(path):
+    """{product_id: info} de un dataset como DATASET-BEBIDAS-ARGENTINA.json"""
+    from catalog_updates import dataset_product
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return dict(dataset_product(product) for product in json.load(f))
+
+
+def default_text_encoder(model_name=MODEL_NAME):
+    """encode_text con el modelo de sentence_transformers (para backends sin encoder de texto)"""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    return lambda texts: model.encode(list(texts), convert_to_numpy=True, show_progress_bar=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prototipos de texto de CLIP para productos sin fotos')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Calcular (o actualizar) el cache de prototipos de texto')
+    build_parser.add_argument('--kb', default='models/knowledge_base.pkl')
+    build_parser.add_argument('--mapping', default='models/product_mapping.json')
+    build_parser.add_argument('--bundle', default='models/knowledge_base.scxkb')
+    build_parser.add_argument('--dataset', action='append', default=[], help='Catálogo JSON adicional (repetible)')
+    build_parser.add_argument('--mode', default='missing', choices=MODES[:2])
+    build_parser.add_argument('--out', default='models/text_prototypes.npz')
+    args = parser.parse_args(argv)
+
+    from ann_index import load_exact_index
+
+    index, mapping = load_exact_index(args.kb, args.mapping, args.bundle)
+    for path in args.dataset:
+        mapping = {**load_dataset(path), **mapping}
+    products = text_products(mapping, index, args.mode)
+    encoder = []
+
+    def encode_text(texts):
+        # El modelo se carga solo si hay productos nuevos o modificados
+        if not encoder:
+            encoder.append(default_text_encoder())
+        return encoder[0](texts)
+
+    prototypes, stats = build_text_prototypes(products, encode_text, args.out)
+    print(f"✅ {stats['products']} prototipos de texto en {args.out} "
+          f"({stats['encoded']} codificados, {stats['cached']} del cache, hash {stats['catalog_hash'][:12]})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
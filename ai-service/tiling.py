@@ -0,0 +1,186 @@
+"""
+Inferencia por tiles para fotos de góndola de alta resolución
+
+YOLO ve cada imagen reducida a su `imgsz` nativo (640): en una foto de 12 MP
+de una góndola llena, un producto de 150 px queda en ~25 px y se pierde. Acá
+la imagen se parte en tiles solapados del tamaño nativo del modelo (o algo
+más grandes si hace falta para no pasar de `max_tiles`), todos los tiles
+pasan por YOLO en un solo batch (o repartidos en un pool de hilos) y las
+cajas se unen con un NMS entre tiles.
+
+Política adaptativa ('auto'): primero una pasada de la imagen completa con
+umbral de confianza bajo, que sirve como sonda de densidad. Solo se hacen
+tiles si la imagen es bastante más grande que `imgsz` y la sonda encontró
+muchos candidatos o candidatos chicos; una foto de una pared vacía o de un
+solo producto cuesta una pasada. Con tiles, el costo queda acotado a
+1 + max_tiles entradas de 640. Las detecciones de la pasada completa se
+suman al NMS, así los productos grandes que cruzan varios tiles no se
+pierden.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+MODES = ('off', 'auto', 'always')
+
+
+def tile_grid(width, height, tile_size, overlap=0.2, max_tiles=8):
+    """Ventanas (x0, y0, x1, y1) solapadas que cubren la imagen.
+
+    Todas del mismo tamaño (las del borde se corren hacia adentro) para que el
+    batch sea homogéneo; si con tile_size harían falta más de max_tiles, los
+    tiles se agrandan (YOLO los reduce a su imgsz).
+    """
+    size = tile_size
+    while True:
+        step = max(1, int(size * (1 - overlap)))
+        cols = max(1, math.ceil((width - size) / step) + 1) if width > size else 1
+        rows = max(1, math.ceil((height - size) / step) + 1) if height > size else 1
+        if cols * rows <= max_tiles or size >= max(width, height):
+            break
+        size = int(size * 1.1) + 1
+
+    tile_w, tile_h = min(size, width), min(size, height)
+    xs = [min(col * step, width - tile_w) for col in range(cols)]
+    ys = [min(row * step, height - tile_h) for row in range(rows)]
+    return [(x, y, x + tile_w, y + tile_h) for y in ys for x in xs]
+
+
+def merge_boxes(boxes, scores, iou_threshold=0.5, ios_threshold=0.6):
+    """NMS entre tiles -> (cajas, scores) de mayor a menor score.
+
+    Además del IoU usa la intersección sobre la caja más chica (IoS): un producto
+    cortado por el borde de un tile deja una caja parcial contenida en la caja
+    completa del tile vecino, con IoU bajo pero IoS alto. La caja que queda se
+    extiende a la unión con las que absorbe por IoS, así el resultado es el
+    producto completo aunque la parcial tenga más score.
+    """
+    boxes = boxes.copy()
+    areas = np.maximum(boxes[:, 2] - boxes[:, 0], 0) * np.maximum(boxes[:, 3] - boxes[:, 1], 0)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        # Al extenderse la caja puede contener otras partes del mismo producto
+        # (uno cortado en la esquina de cuatro tiles): repetir hasta que no crezca
+        while rest.size:
+            x1, y1, x2, y2 = boxes[i]
+            area = (x2 - x1) * (y2 - y1)
+            w = np.clip(np.minimum(x2, boxes[rest, 2]) - np.maximum(x1, boxes[rest, 0]), 0, None)
+            h = np.clip(np.minimum(y2, boxes[rest, 3]) - np.maximum(y1, boxes[rest, 1]), 0, None)
+            inter = w * h
+            iou = inter / (area + areas[rest] - inter + 1e-9)
+            ios = inter / (np.minimum(area, areas[rest]) + 1e-9)
+            # Parciales contenidas en la que queda, o la completa si la que queda es la parcial
+            contained = rest[(ios > ios_threshold) & ((iou <= iou_threshold) | (areas[rest] > area))]
+            rest = rest[(iou <= iou_threshold) & (ios <= ios_threshold)]
+            if not contained.size:
+                break
+            boxes[i, :2] = np.minimum(boxes[i, :2], boxes[contained, :2].min(axis=0))
+            boxes[i, 2:] = np.maximum(boxes[i, 2:], boxes[contained, 2:].max(axis=0))
+        order = rest
+    keep = np.array(keep, dtype=int)
+    return boxes[keep], scores[keep]
+
+
+class TiledDetector:
+    """Detector (misma interfaz detect(images, conf)) que decide por imagen entre una pasada y tiles"""
+
+    def __init__(self, detector, mode='auto', tile_size=None, overlap=0.2, max_tiles=8, min_objects=12,
+                 small_object_px=32, probe_conf=0.1, iou_threshold=0.5, ios_threshold=0.6, workers=1):
+        if mode not in MODES:
+            raise ValueError(f"Modo de tiles desconocido: {mode} (opciones: {', '.join(MODES)})")
+        self.detector = detector
+        self.mode = mode
+        self.tile_size = tile_size or getattr(detector, 'imgsz', 640)
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self.min_objects = min_objects
+        self.small_object_px = small_object_px
+        self.probe_conf = probe_conf
+        self.iou_threshold = iou_threshold
+        self.ios_threshold = ios_threshold
+        self.workers = workers
+        # El pool crea sus hilos con el primer submit (después del fork de gunicorn)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scanix-tiles') if workers > 1 else None
+        self.images = 0
+        self.tiled = 0
+        self.tiles = 0
+
+    @property
+    def name(self):
+        return self.detector.name
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'tile_size': self.tile_size,
+            'overlap': self.overlap,
+            'max_tiles': self.max_tiles,
+            'workers': self.workers,
+            'images': self.images,
+            'tiled': self.tiled,
+            'tiles': self.tiles
+        }
+
+    def needs_tiles(self, image, boxes):
+        """Política adaptativa a partir de la pasada completa (sonda de densidad)"""
+        height, width = image.shape[:2]
+        if max(width, height) < 1.5 * self.tile_size:
+            return False
+        if self.mode == 'always':
+            return True
+        if not len(boxes):
+            return False
+        # Lado corto de las cajas tal como lo vio YOLO (imagen reducida a tile_size)
+        scale = self.tile_size / max(width, height)
+        sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) * scale
+        return len(boxes) >= self.min_objects or float(np.median(sides)) < self.small_object_px
+
+    def detect(self, images, conf=None):
+        images = list(images)
+        conf = self.detector.conf if conf is None else conf
+        # Pasada completa con umbral bajo: los productos chicos que YOLO no llega a
+        # confirmar a esta escala igual aparecen como candidatos de score bajo
+        probes = self.detector.detect(images, conf=min(conf, self.probe_conf))
+        outputs = [(boxes[scores > conf], scores[scores > conf]) for boxes, scores in probes]
+        self.images += len(images)
+
+        jobs = []
+        for i, (image, (boxes, _)) in enumerate(zip(images, probes)):
+            if self.needs_tiles(image, boxes):
+                height, width = image.shape[:2]
+                jobs.extend((i, window) for window in tile_grid(width, height, self.tile_size, self.overlap,
+                                                                self.max_tiles))
+        if not jobs:
+            return outputs
+
+        crops = [images[i][y0:y1, x0:x1] for i, (x0, y0, x1, y1) in jobs]
+        tile_outputs = self._detect_tiles(crops, conf)
+        self.tiled += len({i for i, _ in jobs})
+        self.tiles += len(jobs)
+
+        per_image = {}
+        for (i, (x0, y0, _, _)), (boxes, scores) in zip(jobs, tile_outputs):
+            offset = np.array([x0, y0, x0, y0], dtype=np.float32)
+            per_image.setdefault(i, []).append((boxes + offset, scores))
+
+        merged = list(outputs)
+        for i, parts in per_image.items():
+            boxes = np.concatenate([outputs[i][0]] + [b for b, _ in parts]).astype(np.float32, copy=False)
+            scores = np.concatenate([outputs[i][1]] + [s for _, s in parts]).astype(np.float32, copy=False)
+            merged[i] = merge_boxes(boxes, scores, self.iou_threshold, self.ios_threshold)
+        return merged
+
+    def _detect_tiles(self, crops, conf):
+        """Todos los tiles en un batch, o repartidos entre los hilos del pool"""
+        if self._pool is None or len(crops) < 2:
+            return self.detector.detect(crops, conf=conf)
+        chunk = math.ceil(len(crops) / self.workers)
+        futures = [self._pool.submit(self.detector.detect, crops[start:start + chunk], conf)
+                   for start in range(0, len(crops), chunk)]
+        return [output for future in futures for output in future.result()]
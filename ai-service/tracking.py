@@ -0,0 +1,256 @@
+"""
+Tracking multi-frame para el reconocimiento por streaming de SCANIX AI Service
+
+La cámara del autoservicio manda muchos frames de la misma canasta. Cada
+sesión mantiene un tracker estilo ByteTrack (asociación por IoU en dos
+etapas: primero las detecciones de score alto, después las de score bajo
+contra los tracks que quedaron sin asociar) y la identidad de cada track.
+CLIP corre solo para tracks nuevos o cuya identidad sigue siendo dudosa, así
+que con la canasta quieta el costo por frame es solo YOLO.
+
+La sesión emite eventos incrementales 'add' / 'remove' con la cantidad de
+cada producto en la canasta.
+
+Las sesiones (tracker y canasta) viven en la memoria del proceso que las
+creó: no se comparten entre workers de gunicorn. Con varios workers, los
+frames de una sesión HTTP tienen que llegar siempre al mismo worker
+(afinidad por session_id en el balanceador, SCANIX_STREAM_STICKY=1); si no,
+app.py rechaza abrir sesiones HTTP. El WebSocket /stream de asgi.py no tiene
+este problema: la conexión entera queda en un worker.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """IoU entre todas las cajas de a (N, 4) y b (M, 4)"""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def greedy_match(iou, threshold):
+    """Pares (fila, columna) por IoU descendente, sin repetir filas ni columnas"""
+    pairs = []
+    if not iou.size:
+        return pairs
+    rows, cols = np.nonzero(iou >= threshold)
+    used_rows, used_cols = set(), set()
+    for k in np.argsort(-iou[rows, cols], kind='stable'):
+        r, c = int(rows[k]), int(cols[k])
+        if r not in used_rows and c not in used_cols:
+            pairs.append((r, c))
+            used_rows.add(r)
+            used_cols.add(c)
+    return pairs
+
+
+class Track:
+    """Objeto seguido entre frames y su identidad de producto"""
+
+    __slots__ = ('id', 'box', 'velocity', 'score', 'hits', 'lost', 'confirmed',
+                 'product_id', 'similarity', 'match_score', 'checks', 'last_check')
+
+    def __init__(self, track_id, box, score):
+        self.id = track_id
+        self.box = box
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.score = score
+        self.hits = 1
+        self.lost = 0
+        self.confirmed = False
+        self.product_id = None
+        self.similarity = 0.0
+        # Puntaje de la identificación en la escala del umbral (ver StreamSession)
+        self.match_score = 0.0
+        self.checks = 0
+        self.last_check = None
+
+    def predict(self):
+        """Posición esperada en el próximo frame (velocidad constante amortiguada)"""
+        return self.box + self.velocity * 0.5
+
+    def update(self, box, score, min_hits):
+        self.velocity = 0.5 * self.velocity + 0.5 * (box - self.box)
+        self.box = box
+        self.score = score
+        self.hits += 1
+        self.lost = 0
+        if self.hits >= min_hits:
+            self.confirmed = True
+
+
+class ByteTracker:
+    """Tracker por IoU en dos etapas (score alto, luego score bajo), sin apariencia"""
+
+    def __init__(self, high_threshold=0.5, low_threshold=0.1, match_iou=0.2, low_match_iou=0.5,
+                 max_lost=30, min_hits=2):
+        self.high_threshold = high_threshold
+        self.low_threshold = low_threshold
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.max_lost = max_lost
+        self.min_hits = min_hits
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, scores):
+        """Asociar las detecciones del frame; devuelve los tracks eliminados"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        high = np.nonzero(scores >= self.high_threshold)[0]
+        low = np.nonzero((scores >= self.low_threshold) & (scores < self.high_threshold))[0]
+
+        tracks = self.tracks
+        predicted = np.array([t.predict() for t in tracks], dtype=np.float32).reshape(-1, 4)
+
+        # Etapa 1: todos los tracks contra las detecciones de score alto
+        unmatched_tracks = set(range(len(tracks)))
+        unmatched_high = set(high.tolist())
+        for r, c in greedy_match(iou_matrix(predicted, boxes[high]), self.match_iou):
+            tracks[r].update(boxes[high[c]], float(scores[high[c]]), self.min_hits)
+            unmatched_tracks.discard(r)
+            unmatched_high.discard(int(high[c]))
+
+        # Etapa 2: tracks activos sin asociar contra las de score bajo (oclusiones, blur)
+        remaining = [i for i in sorted(unmatched_tracks) if tracks[i].lost == 0]
+        for r, c in greedy_match(iou_matrix(predicted[remaining], boxes[low]), self.low_match_iou):
+            tracks[remaining[r]].update(boxes[low[c]], float(scores[low[c]]), self.min_hits)
+            unmatched_tracks.discard(remaining[r])
+
+        removed = []
+        kept = []
+        for i, track in enumerate(tracks):
+            if i in unmatched_tracks:
+                track.lost += 1
+                # Los tentativos se descartan en cuanto se pierden
+                if not track.confirmed or track.lost > self.max_lost:
+                    removed.append(track)
+                    continue
+            kept.append(track)
+
+        for i in sorted(unmatched_high):
+            kept.append(Track(next(self._ids), boxes[i], float(scores[i])))
+        if self.min_hits <= 1:
+            for track in kept:
+                track.confirmed = True
+
+        self.tracks = kept
+        return removed
+
+
+class StreamSession:
+    """Sesión de streaming: tracker + identidad de cada track + canasta.
+
+    identify(image, boxes) -> [(product_id, similarity, score), ...] corre CLIP y
+    la búsqueda en el índice solo para las cajas que lo necesitan. El umbral se
+    compara con score (la similitud de un prototipo de texto, escalada);
+    similarity es el coseno que se informa.
+    """
+
+    def __init__(self, identify, similarity_threshold=0.7, margin=0.05, recheck_interval=10,
+                 max_checks=3, tracker=None):
+        self.id = uuid.uuid4().hex
+        self.identify = identify
+        self.similarity_threshold = similarity_threshold
+        self.margin = margin
+        self.recheck_interval = recheck_interval
+        self.max_checks = max_checks
+        self.tracker = tracker or ByteTracker()
+        self.frames = 0
+        self.identified = 0
+        self.basket = Counter()
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+    def needs_identity(self, track):
+        """CLIP para tracks nuevos o con identidad dudosa (cada recheck_interval frames)"""
+        if not track.confirmed or track.lost:
+            return False
+        if track.checks == 0:
+            return True
+        if track.match_score >= self.similarity_threshold + self.margin or track.checks >= self.max_checks:
+            return False
+        return self.frames - track.last_check >= self.recheck_interval
+
+    def process(self, boxes, scores, image):
+        """Procesar las detecciones de un frame; devuelve (tracks, eventos, cajas identificadas)"""
+        self.frames += 1
+        self.last_seen = time.monotonic()
+        self.tracker.update(boxes, scores)
+
+        pending = [track for track in self.tracker.tracks if self.needs_identity(track)]
+        if pending:
+            results = self.identify(image, np.stack([track.box for track in pending]))
+            for track, (product_id, similarity, score) in zip(pending, results):
+                track.checks += 1
+                track.last_check = self.frames
+                # Quedarse con la identificación más segura vista hasta ahora
+                if track.product_id is None or score > track.match_score:
+                    track.product_id = product_id
+                    track.similarity = similarity
+                    track.match_score = score
+            self.identified += len(pending)
+
+        basket = Counter(track.product_id for track in self.tracker.tracks
+                         if track.confirmed and track.product_id is not None
+                         and track.match_score > self.similarity_threshold)
+        events = []
+        for product_id in sorted(set(self.basket) | set(basket)):
+            delta = basket[product_id] - self.basket[product_id]
+            if delta:
+                events.append({
+                    'type': 'add' if delta > 0 else 'remove',
+                    'product_id': product_id,
+                    'delta': delta,
+                    'quantity': basket[product_id]
+                })
+        self.basket = basket
+        return self.tracker.tracks, events, len(pending)
+
+
+class SessionStore:
+    """Sesiones de streaming acotadas en cantidad y expiradas por inactividad"""
+
+    def __init__(self, max_sessions=64, idle_seconds=120):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.monotonic()
+        for session_id in [sid for sid, s in self._sessions.items() if now - s.last_seen > self.idle_seconds]:
+            del self._sessions[session_id]
+
+    def add(self, session):
+        """Registrar una sesión; None si ya se alcanzó el máximo"""
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                return None
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def remove(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
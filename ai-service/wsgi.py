@@ -0,0 +1,28 @@
+"""
+Punto de entrada WSGI de producción para SCANIX AI Service
+
+Carga YOLO, CLIP y el knowledge base una sola vez en el proceso master
+(gunicorn con preload_app) y los workers los heredan por copy-on-write.
+
+Uso:
+    cd ai-service
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import gc
+import sys
+
+from app import app, load_models, log
+
+# El master no infiere: inferir antes del fork deja pools de hilos de OpenMP
+# con la configuración del master que no sobreviven al fork. El warm-up corre
+# en cada worker (post_fork, después de configure_worker) y las verificaciones
+# de arranque (paridad ONNX, gate INT8, compresión del índice, prototipos de
+# texto) en procesos hijos efímeros (app.startup_check)
+if not load_models(preload=True):
+    log.error('startup_failed', "Error cargando modelos")
+    sys.exit(1)
+
+# Mover los objetos ya cargados a la generación permanente del GC: los
+# workers no los recorren y sus páginas no se copian después del fork
+gc.freeze()
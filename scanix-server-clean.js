@@ -723,6 +723,9 @@ app.post('/api/recognition/recognize', upload.single('image'), async (req, res)
     const aiResponse = await axios.post('http://localhost:5001/recognize', formData, {
       headers: {
         ...formData.getHeaders(),
+        // El AI service descarta el trabajo si ya no vamos a esperar la respuesta
+        'X-Scanix-Deadline-Ms': '29000',
+        'X-Scanix-Priority': 'interactive'
       },
       timeout: 30000
     });
@@ -771,6 +774,10 @@ app.post('/api/recognition/recognize', upload.single('image'), async (req, res)
     }
     
     if (error.response) {
+      // Servicio saturado: propagar cuándo reintentar
+      if (error.response.headers['retry-after']) {
+        res.set('Retry-After', error.response.headers['retry-after']);
+      }
       return res.status(error.response.status).json({
         success: false,
         error: error.response.data.error || 'Error en servicio de IA',